@@ -1,38 +1,81 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Request, request, jsonify, g
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
+import time
 import logging
+from tempfile import SpooledTemporaryFile
 
 # 加载环境变量
 load_dotenv()
 
-# 配置日志
-logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# 配置日志（级别由LOG_LEVEL控制，日志经队列由后台线程输出）
+from services.log_config import configure_logging, new_request_id, request_id_var
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# 上传文件在内存中保留的字节数上限，超过时转存到匿名临时文件
+UPLOAD_SPOOL_BYTES = int(os.getenv('UPLOAD_SPOOL_BYTES', 4 * 1024 * 1024))
+
+class UploadRequest(Request):
+    """上传文件保存在SpooledTemporaryFile中，由文件处理器直接读取
+
+    较小的文件只在内存中；较大的文件转存到匿名临时文件（创建后即被删除），
+    请求结束时随请求一起关闭，不会在磁盘上留下文件，也不会因同名上传互相覆盖。
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode='rb+')
+
 # 创建Flask应用
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-secret-key')
 
 # 配置文件上传
-app.config['UPLOAD_FOLDER'] = os.path.join(os.getcwd(), 'uploads')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 
-# 确保上传目录存在
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
-
 # 配置CORS
 frontend_url = os.getenv('FRONTEND_URL', '*')
 CORS(app, resources={r"/api/*": {"origins": frontend_url, "methods": ["GET", "POST", "OPTIONS"], "allow_headers": ["Content-Type", "Authorization"]}})
 
-# 导入路由
+# 导入路由和监控指标
+from services import metrics
 from routes.essay_routes import essay_routes
 
 # 注册蓝图
 app.register_blueprint(essay_routes, url_prefix='/api')
 
+# 为每个请求分配关联ID，写入该请求产生的所有日志，并通过响应头返回
+@app.before_request
+def assign_request_id():
+    new_request_id(request.headers.get('X-Request-ID'))
+    # 统计正在处理的请求数和处理耗时（流式响应在推送结束后才计入）
+    g.metrics_endpoint = request.endpoint or 'unknown'
+    g.metrics_started = time.perf_counter()
+    metrics.HTTP_IN_FLIGHT.labels(g.metrics_endpoint).inc()
+
+@app.after_request
+def expose_request_id(response):
+    response.headers['X-Request-ID'] = request_id_var.get()
+    g.metrics_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(error=None):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is None:
+        return
+    metrics.HTTP_IN_FLIGHT.labels(endpoint).dec()
+    status = g.pop('metrics_status', 500)
+    metrics.HTTP_REQUEST_SECONDS.labels(endpoint, str(status)).observe(time.perf_counter() - g.metrics_started)
+
+# Prometheus监控指标
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    body, content_type = metrics.render_metrics()
+    return body, 200, {'Content-Type': content_type}
+
 # 健康检查接口
 @app.route('/health', methods=['GET'])
 def health_check():
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+响应解析器微基准：对比旧版正则多次扫描实现与单次扫描的 ResponseParser
+
+用法（在backend目录下运行）: python -m benchmarks.bench_response_parser [重复次数]
+"""
+
+import os
+import sys
+import json
+import timeit
+import logging
+
+from benchmarks.legacy_response_parser import LegacyResponseParser
+from services.response_parser import ResponseParser
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures', 'spark_responses.jsonl')
+
+
+def load_corpus():
+    """加载录制的星火响应帧"""
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    # 与生产环境一致：INFO日志开启但不输出到控制台
+    logging.getLogger().setLevel(logging.INFO)
+    logging.getLogger().handlers = [logging.NullHandler()]
+
+    corpus = load_corpus()
+    legacy = LegacyResponseParser()
+    parser = ResponseParser()
+
+    print(f'{"响应":<16}{"帧数":>6}{"旧版(ms)":>12}{"新版(ms)":>12}{"加速比":>8}')
+    for record in corpus:
+        frames = record['frames']
+        assert legacy._process_response(frames) == parser.parse(frames), record['name']
+        old = timeit.timeit(lambda: legacy._process_response(frames), number=number) / number * 1000
+        new = timeit.timeit(lambda: parser.parse(frames), number=number) / number * 1000
+        print(f'{record["name"]:<16}{len(frames):>6}{old:>12.3f}{new:>12.3f}{old / new:>8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+"""
+基准测试的公共配置
+
+基准测试较慢，只有显式指定 benchmarks 目录或传入 --benchmark-only 时才会被收集，
+在backend目录下直接运行 python -m pytest 时只执行 tests/ 中的单元测试。
+"""
+
+import os
+import json
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_PATH = os.path.join(BENCHMARKS_DIR, '..', 'tests', 'fixtures', 'spark_responses.jsonl')
+
+
+def _explicitly_requested(config):
+    if config.getoption('benchmark_only', default=False):
+        return True
+    for arg in config.args:
+        path = os.path.abspath(arg.split('::', 1)[0])
+        if path == BENCHMARKS_DIR or path.startswith(BENCHMARKS_DIR + os.sep):
+            return True
+    return False
+
+
+def pytest_ignore_collect(collection_path, config):
+    if collection_path.name.startswith('test_bench_') and not _explicitly_requested(config):
+        return True
+    return None
+
+
+def load_recorded_responses():
+    """加载录制的星火响应帧，返回 [(名称, 帧列表)]"""
+    with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return [(record['name'], record['frames']) for record in records]
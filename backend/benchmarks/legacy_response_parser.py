@@ -0,0 +1,299 @@
+"""
+旧版星火响应解析器（services/xunfei_api.py 中 _process_response 及 _extract_* 的原始实现）
+
+仅作为基准测试的对照组保留，业务代码使用 services/response_parser.py。
+原实现中 _process_response 使用了未导入的 re 模块，这里在模块顶部补上导入，
+使对照组按原本设计的逻辑（先尝试JSON块）运行。
+"""
+
+import re
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class LegacyResponseParser:
+    def _process_response(self, responses):
+        """处理API响应数据"""
+        # 打印响应列表长度和内容，用于调试
+        logger.info(f'收到的响应数量: {len(responses)}')
+        if responses:
+            logger.info(f'第一个响应的结构: {json.dumps(responses[0], ensure_ascii=False)[:500]}...')
+        
+        # 提取所有文本响应
+        text_responses = []
+        for i, response in enumerate(responses):
+            logger.info(f'处理第 {i+1} 个响应')
+            # 检查响应结构
+            payload = response.get('payload', {})
+            logger.info(f'响应 {i+1} 的payload: {json.dumps(payload, ensure_ascii=False)[:300]}...')
+            
+            choices = payload.get('choices', {})
+            logger.info(f'响应 {i+1} 的choices: {json.dumps(choices, ensure_ascii=False)[:300]}...')
+            
+            # 尝试不同的文本提取方式
+            text = []
+            if isinstance(choices, dict):
+                # 标准结构
+                text = choices.get('text', [])
+            elif isinstance(choices, list):
+                # 可能的列表结构
+                text = choices
+            
+            logger.info(f'响应 {i+1} 中的文本数量: {len(text)}')
+            
+            for item in text:
+                logger.info(f'文本项: {json.dumps(item, ensure_ascii=False)}')
+                # 尝试不同的角色检查方式
+                role = item.get('role', '')
+                content = item.get('content', '')
+                
+                # 如果找到内容，无论角色如何，都添加到响应中
+                if content:
+                    text_responses.append(content)
+                    logger.info(f'添加内容: "{content[:100]}..."')
+        
+        # 合并响应文本
+        full_response = ''.join(text_responses)
+        logger.info(f'合并后的响应文本长度: {len(full_response)}')
+        logger.info(f'合并后的响应文本: "{full_response[:200]}..."')
+        
+        # 如果没有提取到内容，尝试从响应的其他部分提取
+        if not full_response:
+            logger.warning('没有从响应中提取到内容，尝试其他方式')
+            for response in responses:
+                # 尝试直接从payload中提取
+                payload = response.get('payload', {})
+                if isinstance(payload, str):
+                    text_responses.append(payload)
+                    logger.info(f'从payload中提取内容: "{payload[:100]}..."')
+                
+                # 尝试从message中提取
+                message = payload.get('message', {})
+                if isinstance(message, dict):
+                    msg_text = message.get('text', [])
+                    for item in msg_text:
+                        if isinstance(item, dict):
+                            content = item.get('content', '')
+                            if content:
+                                text_responses.append(content)
+                                logger.info(f'从message中提取内容: "{content[:100]}..."')
+                elif isinstance(message, list):
+                    for item in message:
+                        if isinstance(item, dict):
+                            content = item.get('content', '')
+                            if content:
+                                text_responses.append(content)
+                                logger.info(f'从message列表中提取内容: "{content[:100]}..."')
+        
+        # 重新合并响应文本
+        full_response = ''.join(text_responses)
+        logger.info(f'最终响应文本长度: {len(full_response)}')
+        logger.info(f'最终响应文本: "{full_response[:200]}..."')
+        
+        # 尝试解析JSON格式的响应
+        try:
+            json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', full_response)
+            if json_block_match:
+                json_str = json_block_match.group(1)
+                logger.info(f'找到JSON块，长度: {len(json_str)}')
+                logger.info(f'JSON内容前200字符: {json_str[:200]}...')
+                
+                json_content = json.loads(json_str)
+                logger.info(f'成功解析JSON响应，类型: {type(json_content)}')
+                logger.info(f'JSON键: {json_content.keys() if isinstance(json_content, dict) else "N/A"}')
+                
+                # 检查是否包含errors字段
+                if isinstance(json_content, dict) and 'errors' in json_content:
+                    result = {
+                        'feedback': '',
+                        'suggestions': json_content.get('improvement_suggestions', []),
+                        'grammar_errors': [],
+                        'detailed_errors': json_content.get('errors', []),
+                        'corrected_text': json_content.get('corrected_text', '')
+                    }
+                    logger.info(f'从JSON中提取结果成功: errors={len(result["detailed_errors"])}, suggestions={len(result["suggestions"])}, corrected_text长度={len(result["corrected_text"])}')
+                    return result
+                else:
+                    logger.warning(f'JSON中不包含errors字段，使用文本解析方式')
+            else:
+                logger.warning(f'未找到JSON块，使用文本解析方式')
+        except Exception as e:
+            logger.warning(f'JSON解析失败: {str(e)}，使用文本解析方式')
+        
+        # 构建结果（移除评分模块）
+        result = {
+            'feedback': full_response,
+            'suggestions': self._extract_suggestions(full_response),
+            'grammar_errors': self._extract_grammar_errors(full_response),
+            'detailed_errors': self._extract_detailed_errors(full_response),
+            'corrected_text': self._generate_corrected_text(full_response)
+        }
+        logger.info(f'使用文本解析方式提取结果: feedback长度={len(result["feedback"])}, suggestions={len(result["suggestions"])}, grammar_errors={len(result["grammar_errors"])}, detailed_errors={len(result["detailed_errors"])}, corrected_text长度={len(result["corrected_text"])}')
+        return result
+    
+
+    
+    def _extract_suggestions(self, response):
+        """从响应中提取改进建议"""
+        # 尝试从响应中提取改进建议
+        import re
+        suggestions_match = re.search(r'改进建议[:：]\s*([\s\S]*?)(?=详细错误分析|修改后的文本|$)', response)
+        if suggestions_match:
+            suggestions_text = suggestions_match.group(1)
+            # 分割建议并清理
+            suggestions = [s.strip() for s in suggestions_text.split('\n') if s.strip()]
+            return suggestions[:3]  # 最多返回3条建议
+        # 返回默认建议
+        return ['增强论点的说服力', '改善句子结构多样性', '增加具体例子']
+    
+    def _extract_grammar_errors(self, response):
+        """从响应中提取语法错误"""
+        # 尝试从响应中提取语法错误
+        import re
+        errors_match = re.search(r'语法错误[:：]\s*([\s\S]*?)(?=详细错误分析|修改后的文本|$)', response)
+        if errors_match:
+            errors_text = errors_match.group(1)
+            # 分割错误并清理
+            errors = [e.strip() for e in errors_text.split('\n') if e.strip()]
+            return errors[:3]  # 最多返回3条错误
+        # 返回默认错误
+        return ['时态使用不当', '主谓一致问题']
+    
+    def _extract_detailed_errors(self, response):
+        """从响应中提取详细的错误信息"""
+        # 尝试从响应中提取详细错误信息
+        import re
+        
+        logger.info(f'开始提取详细错误信息，响应长度: {len(response)}')
+        
+        # 尝试匹配JSON格式的详细错误信息
+        json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', response)
+        if json_block_match:
+            try:
+                json_content = json.loads(json_block_match.group(1))
+                # 检查JSON结构，处理不同格式
+                if isinstance(json_content, list):
+                    # 直接是错误列表
+                    logger.info(f'成功从JSON中提取详细错误信息，数量: {len(json_content)}')
+                    return json_content[:5]  # 最多返回5个详细错误
+                elif isinstance(json_content, dict) and 'errors' in json_content:
+                    # 包含errors字段的JSON
+                    errors = json_content['errors']
+                    if isinstance(errors, list):
+                        logger.info(f'成功从JSON的errors字段中提取详细错误信息，数量: {len(errors)}')
+                        return errors[:5]  # 最多返回5个详细错误
+                elif isinstance(json_content, dict):
+                    # 单个错误对象
+                    logger.info('成功从JSON中提取单个错误信息')
+                    return [json_content]
+            except json.JSONDecodeError as e:
+                logger.error(f'JSON解析错误: {str(e)}')
+        
+        # 尝试匹配非JSON格式的详细错误信息
+        errors_match = re.search(r'详细错误分析[:：]\s*([\s\S]*?)(?=修改后的文本|$)', response)
+        if errors_match:
+            errors_text = errors_match.group(1)
+            logger.info(f'成功匹配详细错误分析文本，长度: {len(errors_text)}')
+            
+            # 解析非JSON格式的错误信息
+            error_items = []
+            # 尝试按行解析错误信息
+            lines = errors_text.strip().split('\n')
+            current_error = {}
+            
+            for line in lines:
+                line = line.strip()
+                if '原始:' in line:
+                    current_error['original'] = line.split('原始:', 1)[1].strip()
+                elif '修改:' in line:
+                    current_error['corrected'] = line.split('修改:', 1)[1].strip()
+                elif '类型:' in line:
+                    current_error['error_type'] = line.split('类型:', 1)[1].strip()
+                elif '解释:' in line:
+                    current_error['explanation'] = line.split('解释:', 1)[1].strip()
+                    # 当收集到完整的错误信息时，添加到列表
+                    if all(key in current_error for key in ['original', 'corrected', 'error_type', 'explanation']):
+                        error_items.append(current_error.copy())
+                        current_error = {}
+            
+            if error_items:
+                logger.info(f'成功解析非JSON格式错误信息，数量: {len(error_items)}')
+                return error_items[:5]
+        
+        # 尝试匹配其他格式的错误信息
+        # 查找所有可能的错误对
+        error_pairs = re.findall(r'(.*?)[→→](.*?)[\n\r]', response)
+        if error_pairs:
+            error_items = []
+            for i, (original, corrected) in enumerate(error_pairs[:5]):
+                error_items.append({
+                    'original': original.strip(),
+                    'corrected': corrected.strip(),
+                    'error_type': '语法错误',
+                    'explanation': '需要修改的语法问题'
+                })
+            logger.info(f'成功匹配错误对，数量: {len(error_items)}')
+            return error_items
+        
+        # 如果没有找到任何错误信息，返回空列表
+        logger.warning('未能从响应中提取详细错误信息')
+        return []
+    
+    def _generate_corrected_text(self, response):
+        """生成修改后的文本"""
+        # 尝试从响应中提取修改后的文本
+        import re
+        
+        logger.info('开始提取修改后的文本')
+        logger.info(f'响应内容前500字符: {response[:500]}...')
+        logger.info(f'响应内容后500字符: {response[-500:] if len(response) > 500 else response}...')
+        
+        # 尝试匹配修改后的文本（中文格式）
+        # 匹配"修改后的文本"或"修改后的完整文本"
+        corrected_match = re.search(r'修改后的(?:完整)?文本[:：]\s*([\s\S]*?)(?=\d+\.|详细错误分析|评分|改进建议|$)', response)
+        if corrected_match:
+            corrected_text = corrected_match.group(1).strip()
+            logger.info(f'匹配到"修改后的文本"，内容长度: {len(corrected_text)}')
+            if corrected_text:
+                # 去除可能的Markdown格式标签
+                corrected_text = re.sub(r'```json\s*([\s\S]*?)\s*```', '', corrected_text)
+                corrected_text = re.sub(r'```\s*([\s\S]*?)\s*```', '', corrected_text)
+                corrected_text = corrected_text.strip()
+                if corrected_text:
+                    logger.info(f'成功提取修改后的文本，长度: {len(corrected_text)}')
+                    return corrected_text
+        
+        # 尝试匹配其他格式的修改后文本
+        other_match = re.search(r'修正后[:：]\s*([\s\S]*?)(?=\n\n|评分|改进建议|$)', response)
+        if other_match:
+            corrected_text = other_match.group(1).strip()
+            logger.info(f'匹配到"修正后"，内容长度: {len(corrected_text)}')
+            if corrected_text:
+                # 去除可能的Markdown格式标签
+                corrected_text = re.sub(r'```json\s*([\s\S]*?)\s*```', '', corrected_text)
+                corrected_text = re.sub(r'```\s*([\s\S]*?)\s*```', '', corrected_text)
+                corrected_text = corrected_text.strip()
+                if corrected_text:
+                    logger.info(f'成功提取其他格式的修改后文本，长度: {len(corrected_text)}')
+                    return corrected_text
+        
+        # 尝试从JSON中提取corrected_text字段
+        json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', response)
+        if json_block_match:
+            try:
+                json_content = json.loads(json_block_match.group(1))
+                logger.info(f'JSON内容键: {json_content.keys() if isinstance(json_content, dict) else "N/A"}')
+                if isinstance(json_content, dict) and 'corrected_text' in json_content:
+                    corrected_text = json_content['corrected_text']
+                    if corrected_text:
+                        logger.info(f'成功从JSON中提取corrected_text，长度: {len(corrected_text)}')
+                        return corrected_text
+            except json.JSONDecodeError as e:
+                logger.warning(f'JSON解析失败: {e}')
+        
+        # 如果没有找到修改后的文本，返回空字符串
+        logger.warning('未能从响应中提取修改后的文本')
+        logger.warning(f'完整响应内容: {response}')
+        return ''  # 返回空字符串而不是响应的一部分
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+压测脚本：以N个并发用户调用 /api/check-essay 或 /api/upload-file，统计延迟分位数和吞吐量
+
+建议配合 benchmarks/mock_spark_server.py 使用，避免消耗真实配额。
+用法（在backend目录下运行）:
+    python -m benchmarks.load_test --url http://127.0.0.1:5000 --mode check-essay --users 16 --requests 200
+    python -m benchmarks.load_test --mode upload-docx --users 8 --duration 30
+"""
+
+import io
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ESSAY = (
+    "Last summer I go to the beach with my family. The weather were very hot and we swimmed in the sea. "
+    "My brother build a big sandcastle and I help him. In the evening we eat seafood in a small restaurant. "
+    "It was the most happiest day of my holiday."
+)
+
+
+def make_docx(text):
+    """生成只包含一段文字的最小docx文件"""
+    from docx import Document
+    document = Document()
+    document.add_paragraph(text)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def make_image(text):
+    """生成带文字的PNG图片
+
+    模拟OCR服务返回固定文本，并追加图片内容的摘要，因此不同的文字（图片）会得到不同的识别结果。
+    """
+    from PIL import Image, ImageDraw
+    image = Image.new('RGB', (800, 200), 'white')
+    ImageDraw.Draw(image).text((10, 10), text[:80], fill='black')
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def percentile(sorted_values, p):
+    """线性插值计算分位数"""
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * p / 100
+    low = int(k)
+    high = min(low + 1, len(sorted_values) - 1)
+    return sorted_values[low] + (sorted_values[high] - sorted_values[low]) * (k - low)
+
+
+class LoadTest:
+    def __init__(self, base_url, mode, users, total_requests, duration, unique):
+        self.base_url = base_url.rstrip('/')
+        self.mode = mode
+        self.users = users
+        self.total_requests = total_requests
+        self.duration = duration
+        # 每次请求使用不同的作文（文本追加唯一后缀，docx和图片按该文本生成），绕过批改结果缓存
+        self.unique = unique
+        self.latencies = []
+        self.errors = Counter()
+        self._issued = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._docx = make_docx(ESSAY) if mode == 'upload-docx' and not unique else None
+        self._image = make_image(ESSAY) if mode == 'upload-image' and not unique else None
+
+    def _session(self):
+        # 每个用户线程复用一个连接
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
+    def _next(self, deadline):
+        with self._lock:
+            if self.total_requests and self._issued >= self.total_requests:
+                return False
+            if deadline and time.perf_counter() >= deadline:
+                return False
+            self._issued += 1
+            return True
+
+    def _payload(self):
+        """生成一次请求的参数（不计入延迟）"""
+        content = f'{ESSAY} #{uuid.uuid4().hex[:8]}' if self.unique else ESSAY
+        if self.mode == 'check-essay':
+            return {'json': {'content': content}}
+        if self.mode == 'upload-docx':
+            data = make_docx(content) if self.unique else self._docx
+            return {'files': {'file': ('essay.docx', data,
+                                       'application/vnd.openxmlformats-officedocument.wordprocessingml.document')}}
+        # 后缀画在图片开头，保证每张图片的像素都不同
+        data = make_image(content[-9:] + ' ' + content) if self.unique else self._image
+        return {'files': {'file': ('essay.png', data, 'image/png')}}
+
+    def _request(self, payload):
+        endpoint = 'check-essay' if self.mode == 'check-essay' else 'upload-file'
+        return self._session().post(f'{self.base_url}/api/{endpoint}', timeout=300, **payload)
+
+    def _user(self, deadline):
+        while self._next(deadline):
+            payload = self._payload()
+            start = time.perf_counter()
+            try:
+                response = self._request(payload)
+                elapsed = time.perf_counter() - start
+                body = response.json() if response.status_code == 200 else {}
+                if response.status_code != 200:
+                    error = f'HTTP {response.status_code}'
+                elif not body.get('success'):
+                    error = 'success=false'
+                elif (body.get('result') or {}).get('degraded'):
+                    # 星火调用失败时接口仍返回200和本地检查的降级结果
+                    error = 'degraded'
+                else:
+                    error = None
+            except (requests.RequestException, ValueError) as e:
+                elapsed = time.perf_counter() - start
+                error = type(e).__name__
+            with self._lock:
+                if error:
+                    self.errors[error] += 1
+                else:
+                    self.latencies.append(elapsed)
+
+    def run(self):
+        start = time.perf_counter()
+        deadline = start + self.duration if self.duration else None
+        with ThreadPoolExecutor(max_workers=self.users) as executor:
+            for _ in range(self.users):
+                executor.submit(self._user, deadline)
+        return time.perf_counter() - start
+
+    def report(self, wall_time):
+        latencies = sorted(self.latencies)
+        ok = len(latencies)
+        failed = sum(self.errors.values())
+        print(f'模式: {self.mode}  并发用户: {self.users}  总耗时: {wall_time:.2f}s')
+        print(f'成功: {ok}  失败: {failed}  吞吐量: {ok / wall_time:.2f} req/s')
+        if latencies:
+            print('延迟(ms): p50 {:.1f}  p95 {:.1f}  p99 {:.1f}  max {:.1f}'.format(
+                percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000,
+                percentile(latencies, 99) * 1000, latencies[-1] * 1000))
+        for error, count in self.errors.most_common():
+            print(f'  错误 {error}: {count}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='作文批改接口压测')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='后端地址')
+    parser.add_argument('--mode', choices=('check-essay', 'upload-docx', 'upload-image'), default='check-essay')
+    parser.add_argument('--users', type=int, default=10, help='并发用户数')
+    parser.add_argument('--requests', type=int, default=100, help='总请求数，0表示不限（需配合--duration）')
+    parser.add_argument('--duration', type=float, default=0, help='压测时长（秒），0表示不限')
+    parser.add_argument('--cached', action='store_true', help='所有请求使用相同作文（测试缓存命中路径）')
+    args = parser.parse_args()
+    if not args.requests and not args.duration:
+        parser.error('--requests 和 --duration 不能同时为0')
+
+    test = LoadTest(args.url, args.mode, args.users, args.requests, args.duration, unique=not args.cached)
+    test.report(test.run())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+本地模拟的讯飞星火WebSocket服务（以及OCR HTTP服务），用于离线压测
+
+- 星火：校验与正式服务相同的签名URL（authorization/date/host），按帧回放录制的响应
+  （header.status 0/1/2，payload.choices.text），可配置首字延迟、生成速度和错误码
+- OCR：接受与正式服务相同格式的POST请求，返回Base64编码的 whole_text
+
+用法（在backend目录下运行）:
+    python -m benchmarks.mock_spark_server --port 8765 --ocr-port 8766 --token-rate 200 --latency 0.5
+然后启动后端时设置:
+    SPARK_API_URL=ws://127.0.0.1:8765/v4.0/chat
+    OCR_URL=http://127.0.0.1:8766/v1/private/hh_ocr_recognize_doc
+"""
+
+import os
+import json
+import hmac
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import threading
+import email.utils
+import urllib.parse
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import websockets
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), '..', 'tests', 'fixtures', 'spark_responses.jsonl')
+
+# 签名中date允许的最大偏差（秒），与正式服务一致
+MAX_CLOCK_SKEW = 300
+
+
+def load_corpus(path=CORPUS_PATH):
+    """加载录制的响应，返回每条响应合并后的完整文本"""
+    texts = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                texts.append(''.join(
+                    item['content'] for frame in record['frames'] for item in frame['payload']['choices']['text']
+                ))
+    return texts
+
+
+def verify_signature(query, path, api_key, api_secret, method='GET'):
+    """按讯飞的hmac-sha256规则校验签名URL，返回错误信息，校验通过时返回None"""
+    try:
+        authorization = base64.b64decode(query['authorization']).decode('utf-8')
+        date = query['date']
+        host = query['host']
+    except (KeyError, ValueError):
+        return '缺少或无法解析鉴权参数'
+
+    fields = dict(
+        part.strip().split('=', 1) for part in authorization.split(',') if '=' in part
+    )
+    fields = {key.strip(): value.strip().strip('"') for key, value in fields.items()}
+    if fields.get('api_key') != api_key:
+        return 'api_key不匹配'
+
+    signature_origin = f"host: {host}\ndate: {date}\n{method} {path} HTTP/1.1"
+    expected = base64.b64encode(
+        hmac.new(api_secret.encode('utf-8'), signature_origin.encode('utf-8'), digestmod=hashlib.sha256).digest()
+    ).decode('utf-8')
+    if not hmac.compare_digest(expected, fields.get('signature', '')):
+        return '签名不匹配'
+
+    try:
+        signed_at = email.utils.parsedate_to_datetime(date).timestamp()
+    except (TypeError, ValueError):
+        return 'date格式错误'
+    if abs(time.time() - signed_at) > MAX_CLOCK_SKEW:
+        return 'date与服务器时间偏差过大'
+    return None
+
+
+class MockSpark:
+    """模拟星火WebSocket服务"""
+
+    def __init__(self, texts, token_rate, latency, chunk_size, error_rate, error_code, api_key, api_secret):
+        self.texts = texts
+        self.token_rate = token_rate
+        self.latency = latency
+        self.chunk_size = chunk_size
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.sessions = 0
+
+    async def process_request(self, path, request_headers):
+        """握手阶段校验签名，失败时与正式服务一样返回HTTP 401"""
+        parsed = urllib.parse.urlparse(path)
+        query = dict(urllib.parse.parse_qsl(parsed.query))
+        error = verify_signature(query, parsed.path, self.api_key, self.api_secret)
+        if error:
+            body = json.dumps({'message': f'HMAC signature cannot be verified: {error}'}).encode('utf-8')
+            return HTTPStatus.UNAUTHORIZED, [('Content-Type', 'application/json')], body
+        return None
+
+    async def handler(self, ws):
+        self.sessions += 1
+        sid = f'mock{self.sessions:06d}'
+        request = json.loads(await ws.recv())
+        if not request.get('header', {}).get('app_id'):
+            await ws.send(json.dumps({'header': {'code': 10005, 'message': 'app_id is required', 'sid': sid, 'status': 2}}))
+            return
+
+        await asyncio.sleep(self.latency)
+        if random.random() < self.error_rate:
+            await ws.send(json.dumps({
+                'header': {'code': self.error_code, 'message': 'mock error', 'sid': sid, 'status': 2}
+            }))
+            return
+
+        text = random.choice(self.texts)
+        chunks = [text[i:i + self.chunk_size] for i in range(0, len(text), self.chunk_size)] or ['']
+        delay = self.chunk_size / self.token_rate if self.token_rate > 0 else 0
+        for seq, chunk in enumerate(chunks):
+            status = 2 if seq == len(chunks) - 1 else (0 if seq == 0 else 1)
+            await ws.send(json.dumps({
+                'header': {'code': 0, 'message': 'Success', 'sid': sid, 'status': status},
+                'payload': {'choices': {'status': status, 'seq': seq,
+                                        'text': [{'content': chunk, 'role': 'assistant', 'index': 0}]}}
+            }, ensure_ascii=False))
+            if status != 2 and delay:
+                await asyncio.sleep(delay)
+
+
+def make_ocr_handler(text, latency, api_key, api_secret, unique=False):
+    """模拟OCR服务：校验POST签名后返回固定的识别文本
+
+    unique 为True时在文本后追加请求体的摘要：不同的图片得到不同的文本，压测时不会命中批改结果缓存。
+    """
+
+    class OCRHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            request_body = self.rfile.read(length)
+            parsed = urllib.parse.urlparse(self.path)
+            error = verify_signature(dict(urllib.parse.parse_qsl(parsed.query)), parsed.path,
+                                     api_key, api_secret, method='POST')
+            if error:
+                body = json.dumps({'message': f'HMAC signature cannot be verified: {error}'}).encode('utf-8')
+                self.send_response(HTTPStatus.UNAUTHORIZED)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                return
+            time.sleep(latency)
+            whole_text = f'{text} #{hashlib.sha1(request_body).hexdigest()[:8]}' if unique else text
+            recognized = json.dumps({'whole_text': whole_text}, ensure_ascii=False).encode('utf-8')
+            body = json.dumps({
+                'header': {'code': 0, 'message': 'success', 'sid': 'mock-ocr'},
+                'payload': {'recognizeDocumentRes': {'text': base64.b64encode(recognized).decode('utf-8')}}
+            }).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return OCRHandler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟讯飞星火WebSocket服务和OCR服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765, help='星火WebSocket端口')
+    parser.add_argument('--ocr-port', type=int, default=8766, help='OCR HTTP端口，0表示不启动')
+    parser.add_argument('--token-rate', type=float, default=200, help='生成速度（字符/秒），0表示不限速')
+    parser.add_argument('--chunk-size', type=int, default=8, help='每帧包含的字符数')
+    parser.add_argument('--latency', type=float, default=0.5, help='首帧前的延迟（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回错误码的概率')
+    parser.add_argument('--error-code', type=int, default=10013, help='返回的错误码')
+    parser.add_argument('--ocr-latency', type=float, default=0.3, help='OCR响应延迟（秒）')
+    parser.add_argument('--ocr-fixed-text', action='store_true',
+                        help='OCR对所有图片返回完全相同的文本（默认追加图片摘要，使不同图片的识别结果不同）')
+    args = parser.parse_args()
+
+    api_key = os.getenv('APIKey')
+    api_secret = os.getenv('APISecret')
+    if not api_key or not api_secret:
+        raise SystemExit('请先在.env中配置APIKey和APISecret（与后端使用相同的配置）')
+
+    spark = MockSpark(load_corpus(), args.token_rate, args.latency, args.chunk_size,
+                      args.error_rate, args.error_code, api_key, api_secret)
+
+    if args.ocr_port:
+        ocr_server = ThreadingHTTPServer(
+            (args.host, args.ocr_port),
+            make_ocr_handler("I goes to school everyday. My teacher are very kind.", args.ocr_latency,
+                             os.getenv('OCR_API_KEY') or api_key, os.getenv('OCR_API_SECRET') or api_secret,
+                             unique=not args.ocr_fixed_text)
+        )
+        threading.Thread(target=ocr_server.serve_forever, daemon=True).start()
+        print(f'模拟OCR服务: http://{args.host}:{args.ocr_port}/v1/private/hh_ocr_recognize_doc')
+
+    async def serve():
+        async with websockets.serve(spark.handler, args.host, args.port,
+                                    process_request=spark.process_request, max_size=None):
+            print(f'模拟星火服务: ws://{args.host}:{args.port}/v4.0/chat')
+            await asyncio.Future()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+文件处理基准：解析小型和大型Word文档
+"""
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from docx import Document
+
+from services.file_processor import FileProcessor
+
+PARAGRAPH = ('Last summer I go to the beach with my family. The weather were very hot and we swimmed in the sea. '
+             'My brother build a big sandcastle and I help him.')
+
+# 文档名称 -> (段落数, 表格数)
+DOCUMENTS = {
+    'small': (10, 0),
+    'large': (2_000, 20),
+}
+
+
+@pytest.fixture(scope='module')
+def docx_files(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('docx')
+    paths = {}
+    for name, (paragraphs, tables) in DOCUMENTS.items():
+        document = Document()
+        for i in range(paragraphs):
+            document.add_paragraph(f'{i}. {PARAGRAPH}')
+            if i == 0:
+                document.add_paragraph('')
+        for _ in range(tables):
+            table = document.add_table(rows=5, cols=3)
+            for cell in table._cells:
+                cell.text = 'table cell text'
+        path = directory / f'{name}.docx'
+        document.save(str(path))
+        paths[name] = str(path)
+    return paths
+
+
+@pytest.mark.parametrize('name', list(DOCUMENTS))
+def test_process_word(benchmark, docx_files, name):
+    benchmark.group = 'process_word'
+    content = benchmark(FileProcessor(docx_max_chars=0).process_word, docx_files[name])
+    assert content.startswith('0. Last summer')
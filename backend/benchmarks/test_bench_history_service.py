@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+历史记录服务基准：在1k/10k/100k条记录下添加记录与按条件查询
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from services.history_service import HistoryService, TIME_FORMAT
+from services.history_storage import SQLiteHistoryStorage, AppendLogHistoryStorage
+
+SIZES = [1_000, 10_000, 100_000]
+
+RESULT = {
+    'feedback': '',
+    'suggestions': ['增强论点的说服力'],
+    'grammar_errors': [],
+    'detailed_errors': [
+        {'original': 'I goes', 'corrected': 'I go', 'error_type': '主谓一致', 'explanation': '第一人称用原形'}
+    ],
+    'corrected_text': 'I go to school every day.'
+}
+
+
+def make_items(count):
+    """生成count条记录，创建时间均匀分布在最近30天内"""
+    now = datetime.now()
+    step = timedelta(days=30) / count
+    return [{
+        'id': i + 1,
+        'content': f'I goes to school everyday. Essay number {i}.',
+        'result': RESULT,
+        'type': 'text',
+        'created_at': (now - timedelta(days=30) + step * i).strftime(TIME_FORMAT),
+    } for i in range(count)]
+
+
+@pytest.fixture(params=['sqlite', 'log'])
+def backend(request):
+    return request.param
+
+
+def make_service(backend, directory, count=0):
+    """打开directory中的存储；count大于0时先写入count条记录"""
+    if backend == 'sqlite':
+        storage = SQLiteHistoryStorage(str(directory / 'history.db'))
+    else:
+        storage = AppendLogHistoryStorage(str(directory / 'history.log'))
+    if count:
+        storage.import_items(make_items(count))
+    return HistoryService(str(directory / 'missing.json'), storage=storage)
+
+
+@pytest.mark.parametrize('count', SIZES)
+def test_add_history(benchmark, backend, tmp_path, count):
+    benchmark.group = f'add_history-{backend}'
+    service = make_service(backend, tmp_path, count)
+    item = benchmark(service.add_history, 'I goes to school everyday.', RESULT)
+    assert item['id'] > count
+
+
+@pytest.mark.parametrize('count', SIZES)
+@pytest.mark.parametrize('filter_type', ['all', 'week'])
+def test_get_history(benchmark, tmp_path, count, filter_type):
+    benchmark.group = f'get_history-{filter_type}'
+    service = make_service('sqlite', tmp_path, count)
+    assert benchmark(service.get_history, filter_type)
+
+
+@pytest.mark.parametrize('count', SIZES)
+def test_get_history_page(benchmark, tmp_path, count):
+    benchmark.group = 'get_history_page'
+    service = make_service('sqlite', tmp_path, count)
+    assert len(benchmark(service.get_history_page, 'all', 20)['items']) == 20
+
+
+@pytest.mark.parametrize('count', SIZES)
+def test_load_history(benchmark, backend, tmp_path, count):
+    """启动时从存储加载并建立索引"""
+    benchmark.group = f'load_history-{backend}'
+    make_service(backend, tmp_path, count).storage.close()
+    service = benchmark.pedantic(make_service, args=(backend, tmp_path), rounds=3, iterations=1)
+    assert len(service.history) == count
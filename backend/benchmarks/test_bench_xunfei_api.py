@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+星火客户端热点路径基准：响应解析（录制的模型输出）与WebSocket签名生成
+"""
+
+import pytest
+
+pytest.importorskip('pytest_benchmark')
+
+from benchmarks.conftest import load_recorded_responses
+from services.xunfei_api import XunfeiAPI
+
+RECORDED_RESPONSES = dict(load_recorded_responses())
+
+
+@pytest.fixture
+def xunfei_api(monkeypatch):
+    monkeypatch.setenv('APPID', 'bench-app')
+    monkeypatch.setenv('APIKey', 'bench-key')
+    monkeypatch.setenv('APISecret', 'bench-secret')
+    return XunfeiAPI()
+
+
+@pytest.mark.parametrize('name', list(RECORDED_RESPONSES))
+def test_process_response(benchmark, xunfei_api, name):
+    benchmark.group = 'process_response'
+    result = benchmark(xunfei_api._process_response, RECORDED_RESPONSES[name])
+    assert set(result) >= {'detailed_errors', 'corrected_text'}
+
+
+def test_process_response_corpus(benchmark, xunfei_api):
+    """整个语料库依次解析一遍"""
+    benchmark.group = 'process_response'
+    corpus = list(RECORDED_RESPONSES.values())
+
+    def parse_all():
+        return [xunfei_api._process_response(frames) for frames in corpus]
+
+    assert len(benchmark(parse_all)) == len(corpus)
+
+
+def test_generate_signature(benchmark, xunfei_api):
+    benchmark.group = 'signature'
+    date, authorization = benchmark(xunfei_api._generate_signature)
+    assert date and authorization
+
+
+def test_build_ws_url(benchmark, xunfei_api):
+    benchmark.group = 'signature'
+    assert benchmark(xunfei_api._build_ws_url).startswith('wss://')
+
+
+def test_align_errors(benchmark):
+    """长作文（约1.5万字符）中为100条错误定位 start/end"""
+    from services.span_aligner import align_errors
+
+    sentences = [f'In year {index} my friend and i goes to the park, and we plays football there.'
+                 for index in range(200)]
+    essay = '\n'.join(sentences)
+    errors = [{'original': f'{index} my friend and i goes'} for index in range(0, 200, 2)]
+    benchmark.group = 'align_errors'
+    aligned = benchmark(align_errors, essay, errors)
+    assert all(error['start'] is not None for error in aligned)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+独立的批改任务worker进程
+
+Web进程设置 JOB_WORKERS=0 后，批改任务只由本进程执行，Web worker不会被星火API阻塞。
+用法: JOB_WORKERS=0 python job_worker.py [worker线程数]
+"""
+
+import os
+import sys
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from services.log_config import configure_logging
+configure_logging()
+
+# 导入路由模块时不在其中启动worker，由本进程统一启动
+os.environ['JOB_WORKERS'] = '0'
+from routes.essay_routes import job_queue
+
+if __name__ == '__main__':
+    num_workers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    job_queue.start(num_workers)
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        job_queue.stop()
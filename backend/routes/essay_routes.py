@@ -1,9 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from services.xunfei_api import XunfeiAPI
+from services.async_xunfei_api import AsyncXunfeiAPI
 from services.file_processor import FileProcessor
 from services.history_service import HistoryService
+from services.grading_cache import GradingCache
+from services.batch_service import BatchService
+from services.job_queue import JobQueue
+from services.local_checker import LocalChecker
+from services.single_flight import SingleFlight
 import logging
 import os
+import io
+import json
+import zipfile
 from werkzeug.utils import secure_filename
 
 # 创建蓝图
@@ -12,16 +21,54 @@ essay_routes = Blueprint('essay_routes', __name__)
 # 配置日志
 logger = logging.getLogger(__name__)
 
-# 初始化讯飞API服务
-xunfei_api = XunfeiAPI()
+# 初始化批改结果缓存
+grading_cache = GradingCache.from_env()
+# 初始化本地拼写和语法检查（LOCAL_CHECKER=0 时关闭）
+local_checker = LocalChecker.from_env()
+# 合并相同作文的并发批改（SINGLE_FLIGHT=0 时关闭）
+single_flight = SingleFlight.from_env(grading_cache)
+# 初始化讯飞API服务（默认使用异步客户端，SPARK_CLIENT=sync 时退回同步客户端）
+if os.getenv('SPARK_CLIENT', 'async') == 'sync':
+    xunfei_api = XunfeiAPI(cache=grading_cache, local_checker=local_checker, single_flight=single_flight)
+else:
+    xunfei_api = AsyncXunfeiAPI(cache=grading_cache, local_checker=local_checker, single_flight=single_flight)
 # 初始化文件处理器
 file_processor = FileProcessor()
 # 初始化历史记录服务
 history_service = HistoryService()
+# 初始化批量批改服务
+batch_service = BatchService(xunfei_api, history_service)
+
+# 后台批改任务：批改作文并保存历史记录
+def run_check_essay_job(payload):
+    content = payload['content']
+    result = xunfei_api.check_essay(content)
+    if result.get('degraded'):
+        # 星火不可用时只有本地检查的降级结果，任务记为失败，不保存历史记录
+        raise RuntimeError('批改服务暂时不可用，请稍后重新提交')
+    history_item = history_service.add_history(content, result, payload.get('input_type', 'text'))
+    return {'result': result, 'history_id': history_item['id'] if history_item else None}
+
+# 初始化持久化任务队列（JOB_WORKERS=0 时不在Web进程中执行任务，由 job_worker.py 单独执行）
+job_queue = JobQueue.from_env(os.path.join(os.path.dirname(__file__), '..', 'jobs.db'))
+job_queue.register('check_essay', run_check_essay_job)
+job_workers = int(os.getenv('JOB_WORKERS', 2))
+if job_workers > 0:
+    job_queue.start(job_workers)
 
 # 允许的文件类型
 ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 ALLOWED_DOC_EXTENSIONS = {'docx'}
+ALLOWED_PDF_EXTENSIONS = {'pdf'}
+
+# 一次上传的作文最多包含的页数（图片张数加PDF页数）
+MAX_OCR_PAGES = int(os.getenv('OCR_MAX_PAGES', 20))
+
+# 单个批次最多包含的作文数
+MAX_BATCH_SIZE = 100
+# 批量上传的zip中单个Word文档、全部文档解压后的字节数上限（防止压缩炸弹）
+MAX_ZIP_MEMBER_BYTES = int(os.getenv('BATCH_MAX_DOCX_BYTES', 20 * 1024 * 1024))
+MAX_ZIP_TOTAL_BYTES = int(os.getenv('BATCH_MAX_ZIP_BYTES', 200 * 1024 * 1024))
 
 # 检查文件扩展名是否允许
 def allowed_file(filename, allowed_extensions):
@@ -39,44 +86,201 @@ def check_essay():
         
         essay_content = data['content']
         
-        # 调用讯飞API进行批改
-        result = xunfei_api.check_essay(essay_content)
+        # 提交修改稿时带上上一版的历史记录ID，只重新批改修改过的段落
+        previous_id = data.get('previous_id')
+        if previous_id is not None:
+            try:
+                previous_id = int(previous_id)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'previous_id 必须是整数'}), 400
+            previous = history_service.get_history_by_id(previous_id)
+            if previous is None:
+                return jsonify({'error': '上一版的历史记录不存在'}), 404
+            result = xunfei_api.regrade_essay(essay_content, previous['content'], previous['result'])
+        else:
+            # 调用讯飞API进行批改
+            result = xunfei_api.check_essay(essay_content)
         
         # 保存到历史记录
-        history_service.add_history(essay_content, result, 'text')
+        history_item = history_service.add_history(essay_content, result, 'text', parent_id=previous_id)
         
-        return jsonify({'success': True, 'result': result}), 200
+        return jsonify({'success': True, 'result': result,
+                        'history_id': history_item['id'] if history_item else None}), 200
         
     except Exception as e:
         logger.error(f'批改作文失败: {str(e)}')
         return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
+# 流式批改作文接口（Server-Sent Events）
+@essay_routes.route('/check-essay/stream', methods=['POST'])
+def check_essay_stream():
+    data = request.json
+    if not data or 'content' not in data:
+        return jsonify({'error': '缺少作文内容'}), 400
+    
+    essay_content = data['content']
+    
+    def generate():
+        for event in xunfei_api.stream_essay(essay_content):
+            if event['type'] == 'result':
+                # 保存到历史记录
+                history_service.add_history(essay_content, event['result'], 'text')
+            yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# 本地快速检查接口：只做本地拼写和语法检查，不调用星火，毫秒级返回
+@essay_routes.route('/quick-check', methods=['POST'])
+def quick_check():
+    data = request.json
+    if not data or 'content' not in data:
+        return jsonify({'error': '缺少作文内容'}), 400
+    if local_checker is None:
+        return jsonify({'error': '本地检查未启用'}), 503
+    return jsonify({'success': True, 'errors': local_checker.check(data['content'])}), 200
+
+# 从zip压缩包中读取所有Word文档
+def read_docx_zip(file):
+    essays = []
+    total_bytes = 0
+    with zipfile.ZipFile(io.BytesIO(file.read())) as archive:
+        for info in archive.infolist():
+            name = info.filename.rsplit('/', 1)[-1]
+            if info.is_dir() or name.startswith(('.', '~$')) or not allowed_file(name, ALLOWED_DOC_EXTENSIONS):
+                continue
+            if len(essays) >= MAX_BATCH_SIZE:
+                raise ValueError(f'单次最多批改 {MAX_BATCH_SIZE} 篇作文')
+            # 解压前按目录中记录的原始大小检查，读取时再限制实际读取的字节数（目录中的大小可能被伪造）
+            total_bytes += info.file_size
+            if info.file_size > MAX_ZIP_MEMBER_BYTES or total_bytes > MAX_ZIP_TOTAL_BYTES:
+                raise ValueError(f'压缩包中的文件解压后过大: {name}')
+            with archive.open(info) as f:
+                data = f.read(MAX_ZIP_MEMBER_BYTES + 1)
+            if len(data) > MAX_ZIP_MEMBER_BYTES:
+                raise ValueError(f'压缩包中的文件解压后过大: {name}')
+            content = file_processor.process_word(io.BytesIO(data))
+            if content.strip():
+                essays.append({'name': name, 'content': content})
+    return essays
+
+# 批量批改作文接口
+@essay_routes.route('/check-essays/batch', methods=['POST'])
+def check_essays_batch():
+    try:
+        input_type = 'text'
+        if 'file' in request.files:
+            # zip压缩包中的Word文档
+            file = request.files['file']
+            if not allowed_file(secure_filename(file.filename), {'zip'}):
+                return jsonify({'error': '批量上传仅支持zip压缩包'}), 400
+            try:
+                essays = read_docx_zip(file)
+            except (zipfile.BadZipFile, ValueError) as e:
+                return jsonify({'error': f'压缩包处理失败: {str(e)}'}), 400
+            input_type = 'word'
+        else:
+            # JSON格式：{"essays": ["...", {"name": "...", "content": "..."}]}
+            data = request.json
+            if not data or not isinstance(data.get('essays'), list):
+                return jsonify({'error': '缺少作文列表'}), 400
+            essays = []
+            for essay in data['essays']:
+                if isinstance(essay, str):
+                    essay = {'content': essay}
+                if not isinstance(essay, dict) or not isinstance(essay.get('content'), str):
+                    return jsonify({'error': '作文列表格式错误'}), 400
+                essays.append(essay)
+        
+        if not essays:
+            return jsonify({'error': '没有可批改的作文'}), 400
+        if len(essays) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'单次最多批改 {MAX_BATCH_SIZE} 篇作文'}), 400
+        
+        batch = batch_service.submit(essays, input_type)
+        return jsonify({'success': True, **batch}), 202
+        
+    except Exception as e:
+        logger.error(f'批量批改提交失败: {str(e)}')
+        return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
+
+# 查询批量批改进度接口
+@essay_routes.route('/check-essays/batch/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    batch = batch_service.get_batch(batch_id)
+    if batch is None:
+        return jsonify({'error': '批次不存在'}), 404
+    return jsonify({'success': True, 'batch': batch}), 200
+
+# 流式获取批量批改结果接口（Server-Sent Events）
+@essay_routes.route('/check-essays/batch/<batch_id>/stream', methods=['GET'])
+def stream_batch(batch_id):
+    if batch_service.get_batch(batch_id) is None:
+        return jsonify({'error': '批次不存在'}), 404
+    
+    def generate():
+        for item in batch_service.iter_results(batch_id, timeout=600):
+            yield f"event: item\ndata: {json.dumps(item, ensure_ascii=False)}\n\n"
+        yield f"event: done\ndata: {json.dumps(batch_service.get_batch(batch_id) or {}, ensure_ascii=False)}\n\n"
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+# 提交后台批改任务接口
+@essay_routes.route('/jobs', methods=['POST'])
+def submit_job():
+    try:
+        data = request.json
+        if not data or 'content' not in data:
+            return jsonify({'error': '缺少作文内容'}), 400
+        
+        job_id = job_queue.submit('check_essay', {'content': data['content'], 'input_type': 'text'})
+        return jsonify({'success': True, 'job_id': job_id, 'status': 'queued'}), 202
+        
+    except Exception as e:
+        logger.error(f'提交批改任务失败: {str(e)}')
+        return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
+
+# 查询后台批改任务接口
+@essay_routes.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    try:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+        return jsonify({'success': True, 'job': job}), 200
+        
+    except Exception as e:
+        logger.error(f'查询批改任务失败: {str(e)}')
+        return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
+
 # 文件上传接口
 @essay_routes.route('/upload-file', methods=['POST'])
 def upload_file():
     try:
-        # 检查是否有文件被上传
-        if 'file' not in request.files:
+        # 检查是否有文件被上传（多页作文使用多个 files 字段，兼容单个 file 字段）
+        files = request.files.getlist('files') or request.files.getlist('file')
+        if not files:
             return jsonify({'error': '没有文件被上传'}), 400
         
-        file = request.files['file']
-        
         # 检查文件名是否为空
-        if file.filename == '':
+        filenames = [secure_filename(file.filename) for file in files]
+        if any(not file.filename for file in files):
             return jsonify({'error': '文件名为空'}), 400
         
-        # 检查文件类型
-        filename = secure_filename(file.filename)
-        file_ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        
         # 根据文件类型处理
-        if allowed_file(filename, ALLOWED_DOC_EXTENSIONS):
-            # 处理Word文档
-            file_path = os.path.join('uploads', filename)
-            file.save(file_path)
-            
-            # 解析Word文档
-            content = file_processor.process_word(file_path)
+        if len(files) == 1 and allowed_file(filenames[0], ALLOWED_DOC_EXTENSIONS):
+            # 处理Word文档：直接从上传的流中解析，不写入临时文件
+            try:
+                content = file_processor.process_word(files[0].stream)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
             
             # 调用讯飞API进行批改
             result = xunfei_api.check_essay(content)
@@ -84,39 +288,57 @@ def upload_file():
             # 保存到历史记录
             history_service.add_history(content, result, 'word')
             
-            # 删除临时文件
-            os.remove(file_path)
-            
             return jsonify({'success': True, 'result': result, 'content': content}), 200
-            
-        elif allowed_file(filename, ALLOWED_IMAGE_EXTENSIONS):
-            # 处理图片（预留OCR接口）
-            file_path = os.path.join('uploads', filename)
-            file.save(file_path)
-            
-            # 调用OCR处理（预留接口）
-            content = file_processor.process_image(file_path)
-            
-            # 如果OCR成功，调用讯飞API进行批改
-            if content:
-                result = xunfei_api.check_essay(content)
-                # 保存到历史记录
-                history_service.add_history(content, result, 'image')
+        
+        # 多个文件时只接受图片和PDF，按上传顺序作为页码顺序
+        if not all(allowed_file(name, ALLOWED_IMAGE_EXTENSIONS | ALLOWED_PDF_EXTENSIONS) for name in filenames):
+            return jsonify({'error': '不支持的文件类型'}), 400
+        
+        # 图片和PDF直接从上传的流中读取
+        pages = []
+        for file, name in zip(files, filenames):
+            if allowed_file(name, ALLOWED_PDF_EXTENSIONS):
+                try:
+                    pages.extend(file_processor.render_pdf(file.stream, max_pages=MAX_OCR_PAGES - len(pages)))
+                except ValueError:
+                    return jsonify({'error': f'作文页数超过上限 {MAX_OCR_PAGES}'}), 400
+                except RuntimeError as e:
+                    logger.error('PDF解析失败: %s', e)
+                    return jsonify({'error': 'PDF文件无法解析'}), 400
             else:
-                result = {'error': 'OCR处理失败，请手动输入作文内容'}
-            
-            # 删除临时文件
-            os.remove(file_path)
-            
-            return jsonify({'success': True, 'result': result, 'content': content}), 200
+                pages.append(file.stream)
+            if len(pages) > MAX_OCR_PAGES:
+                return jsonify({'error': f'作文页数超过上限 {MAX_OCR_PAGES}'}), 400
+        
+        # 各页并发OCR，按页码顺序拼接全文
+        content = file_processor.process_images(pages)
+        
+        # 如果OCR成功，调用讯飞API对整篇作文批改一次
+        if content:
+            result = xunfei_api.check_essay(content)
+            # 保存到历史记录
+            history_service.add_history(content, result, 'image')
         else:
-            return jsonify({'error': '不支持的文件类型'}), 400
+            result = {'error': 'OCR处理失败，请手动输入作文内容'}
+        
+        return jsonify({'success': True, 'result': result, 'content': content, 'pages': len(pages)}), 200
         
     except Exception as e:
         logger.error(f'文件上传失败: {str(e)}')
         return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
-# 获取批改历史接口
+# 批改结果缓存统计接口
+@essay_routes.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    if grading_cache is None:
+        return jsonify({'success': True, 'enabled': False}), 200
+    return jsonify({'success': True, 'enabled': True, 'stats': grading_cache.stats()}), 200
+
+# 单页历史记录的默认条数和最大条数
+DEFAULT_HISTORY_LIMIT = 20
+MAX_HISTORY_LIMIT = 100
+
+# 获取批改历史接口（分页返回摘要，完整记录通过 /history/<id> 获取）
 @essay_routes.route('/history', methods=['GET'])
 def get_history():
     try:
@@ -128,14 +350,23 @@ def get_history():
         if filter_type not in valid_filters:
             filter_type = 'all'
         
+        # 分页参数
+        limit = request.args.get('limit', DEFAULT_HISTORY_LIMIT, type=int)
+        limit = max(1, min(limit, MAX_HISTORY_LIMIT))
+        before = request.args.get('before')
+        
         # 获取历史记录
-        history = history_service.get_history(filter_type)
+        page = history_service.get_history_page(filter_type, limit, before)
+        if page is None:
+            return jsonify({'error': '分页游标格式错误'}), 400
         
         return jsonify({
             'success': True, 
-            'history': history,
+            'history': page['items'],
             'filter': filter_type,
-            'count': len(history)
+            'count': len(page['items']),
+            'total': page['total'],
+            'next_before': page['next_before']
         }), 200
         
     except Exception as e:
@@ -157,6 +388,18 @@ def get_history_detail(history_id):
         logger.error(f'获取历史记录详情失败: {str(e)}')
         return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
 
+# 获取同一篇作文的全部修订（摘要），按提交顺序排列
+@essay_routes.route('/history/<int:history_id>/revisions', methods=['GET'])
+def get_history_revisions(history_id):
+    try:
+        revisions = history_service.get_revisions(history_id)
+        if revisions is None:
+            return jsonify({'error': '历史记录不存在'}), 404
+        return jsonify({'success': True, 'revisions': [history_service.summarize(item) for item in revisions]}), 200
+    except Exception as e:
+        logger.error(f'获取作文修订记录失败: {str(e)}')
+        return jsonify({'error': f'服务器内部错误: {str(e)}'}), 500
+
 # 删除历史记录接口
 @essay_routes.route('/history/<int:history_id>', methods=['DELETE'])
 def delete_history(history_id):
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import queue
+import asyncio
+import threading
+import logging
+import websockets
+from services.xunfei_api import XunfeiAPI
+from services.log_config import request_id_var
+from services import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+
+class AsyncXunfeiAPI(XunfeiAPI):
+    """基于asyncio的讯飞星火客户端，支持多个批改请求同时进行
+
+    所有WebSocket会话都运行在一个后台事件循环线程中，并通过信号量限制同时打开的
+    连接数（星火协议每个连接只处理一次请求，连接无法复用，因此用信号量代替连接池）。
+    同步代码（Flask路由）仍然调用 check_essay，请求会被提交到后台事件循环，
+    因此配合 gthread 等多线程worker时，一个慢请求不会阻塞其他用户。
+    事件循环只负责收发帧，响应解析在调用线程中进行，避免CPU密集的解析阻塞其他会话。
+    """
+
+    def __init__(self, max_concurrency=None, timeout=None, cache=None, local_checker=None, single_flight=None):
+        super().__init__(cache=cache, local_checker=local_checker, single_flight=single_flight)
+        # 同时进行的WebSocket会话上限
+        if max_concurrency is None:
+            max_concurrency = os.getenv('SPARK_MAX_CONCURRENCY', 16)
+        self.max_concurrency = int(max_concurrency)
+        # 单次批改的超时时间（秒），不包含排队等待的时间
+        if timeout is None:
+            timeout = os.getenv('SPARK_TIMEOUT', 120)
+        self.timeout = float(timeout)
+        # 信号量属于后台事件循环，随循环一起创建
+        self._semaphore = None
+        self._loop = None
+        self._loop_lock = threading.Lock()
+
+    def _get_loop(self):
+        """获取后台事件循环，首次调用或循环已关闭时启动新的循环线程，并为其创建新的信号量"""
+        with self._loop_lock:
+            if self._loop is None or self._loop.is_closed():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(target=loop.run_forever, name='spark-event-loop', daemon=True)
+                thread.start()
+                # 在新循环中创建信号量：旧循环的信号量不能在新循环中使用（Python 3.10以前会绑定创建时的循环）
+                self._semaphore = asyncio.run_coroutine_threadsafe(self._create_semaphore(), loop).result()
+                self._loop = loop
+            return self._loop
+
+    async def _create_semaphore(self):
+        return asyncio.Semaphore(self.max_concurrency)
+
+    def _submit(self, coroutine):
+        """把协程提交到后台事件循环，日志沿用调用线程的请求关联ID"""
+        return asyncio.run_coroutine_threadsafe(
+            self._with_request_id(coroutine, request_id_var.get()), self._get_loop()
+        )
+
+    async def _with_request_id(self, coroutine, request_id):
+        # 每个任务有独立的上下文，这里的设置只影响本次会话
+        request_id_var.set(request_id)
+        return await coroutine
+
+    def run(self, coroutine):
+        """在后台事件循环中执行协程，并阻塞等待结果（供同步代码调用）"""
+        return self._submit(coroutine).result()
+
+    async def request_frames_async(self, content, timeout=None, on_frame=None, prompt=None):
+        """异步请求批改，返回原始响应帧列表，失败或超时时抛出异常
+
+        on_frame 不为None时，每收到一帧都会以该帧为参数调用一次（用于流式转发）；
+        prompt 为完整的提示词（默认按PROMPT_TEMPLATE生成）。
+        """
+        if timeout is None:
+            timeout = self.timeout
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(self._receive_frames_async(content, on_frame, prompt), timeout)
+            except asyncio.TimeoutError:
+                metrics.SPARK_ERRORS.labels('timeout').inc()
+                raise TimeoutError(f'讯飞API在 {timeout} 秒内未返回最终响应')
+
+    async def check_essay_async(self, content, timeout=None):
+        """异步批改作文并解析结果，供异步调用方使用（解析在线程池中进行）"""
+        responses = await self.request_frames_async(content, timeout)
+        return await asyncio.get_running_loop().run_in_executor(None, self._process_response, responses)
+
+    async def _receive_frames_async(self, content, on_frame=None, prompt=None):
+        """通过异步WebSocket发送请求并收集响应帧"""
+        with metrics.timed('sign'):
+            ws_url = self._build_ws_url()
+        connect_started = time.perf_counter()
+        try:
+            ws = await websockets.connect(ws_url, open_timeout=10, max_size=None)
+        except Exception:
+            metrics.SPARK_ERRORS.labels('connection').inc()
+            raise
+        finally:
+            metrics.observe('connect', time.perf_counter() - connect_started)
+
+        metrics.SPARK_SESSIONS_IN_FLIGHT.inc()
+        try:
+            logger.debug('WebSocket连接成功')
+            await ws.send(json.dumps(self._build_request(content, prompt)))
+            sent_at = time.perf_counter()
+            logger.debug('请求发送成功')
+
+            responses = []
+            async for message in ws:
+                if not responses:
+                    metrics.observe('first_frame', time.perf_counter() - sent_at)
+                response = json.loads(message)
+                self._check_frame(response)
+                responses.append(response)
+                if on_frame is not None:
+                    on_frame(response)
+
+                # 检查是否收到最终响应
+                if response.get('header', {}).get('status') == 2:
+                    metrics.observe('last_frame', time.perf_counter() - sent_at)
+                    logger.debug('收到最终响应，共 %d 帧', len(responses))
+                    break
+            else:
+                metrics.SPARK_ERRORS.labels('connection').inc()
+                raise ConnectionError('WebSocket连接在收到最终响应前关闭')
+        finally:
+            metrics.SPARK_SESSIONS_IN_FLIGHT.dec()
+            await ws.close()
+
+        return responses
+
+    def _request_essay(self, content, prompt=None):
+        """同步接口：在后台事件循环中收取响应帧，在当前线程中解析"""
+        responses = self.run(self.request_frames_async(content, prompt=prompt))
+        return self._process_response(responses)
+
+    def _grade_segments(self, texts, prompts=None):
+        """同步接口：各片段在后台事件循环中并发请求（受信号量限制），在当前线程中解析"""
+        prompts = prompts or [None] * len(texts)
+
+        async def request_all():
+            return await asyncio.gather(*(self.request_frames_async(text, prompt=prompt)
+                                          for text, prompt in zip(texts, prompts)),
+                                        return_exceptions=True)
+
+        outcomes = []
+        for responses in self.run(request_all()):
+            if isinstance(responses, BaseException):
+                outcomes.append(responses)
+                continue
+            try:
+                outcomes.append(self._process_response(responses))
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    def _iter_frames(self, content, prompt=None):
+        """同步接口：在后台事件循环中收取响应帧，通过队列逐帧交给调用线程"""
+        frames = queue.Queue()
+        future = self._submit(self.request_frames_async(content, on_frame=frames.put, prompt=prompt))
+        # 请求结束（成功或失败）后放入结束标记
+        future.add_done_callback(lambda _: frames.put(None))
+        try:
+            while True:
+                response = frames.get()
+                if response is None:
+                    break
+                yield response
+            # 抛出请求过程中的异常（超时、错误码等）
+            future.result()
+        finally:
+            # 调用方提前停止迭代（例如客户端断开）时取消WebSocket会话
+            future.cancel()
@@ -0,0 +1,146 @@
+import os
+import uuid
+import time
+import threading
+import contextvars
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from services.grading_cache import normalize_essay
+
+logger = logging.getLogger(__name__)
+
+
+class BatchService:
+    """批量批改服务：去重后以有限并发调用星火API，客户端通过批次ID轮询或流式获取结果"""
+
+    def __init__(self, xunfei_api, history_service, max_workers=None, max_batches=100):
+        self.xunfei_api = xunfei_api
+        self.history_service = history_service
+        if max_workers is None:
+            max_workers = int(os.getenv('BATCH_MAX_WORKERS', 8))
+        self.max_workers = max_workers
+        # 只保留最近的批次，超出时淘汰最早完成的批次
+        self.max_batches = max_batches
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='batch-grading')
+        self._batches = OrderedDict()
+        self._lock = threading.Lock()
+        # 任意作文批改完成时通知等待中的流式请求
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, essays, input_type='text'):
+        """提交一批作文，立即返回批次信息
+
+        essays 为 [{'name': ..., 'content': ...}] 列表；文本相同（忽略多余空白）的作文只批改一次。
+        """
+        batch_id = uuid.uuid4().hex
+        items = []
+        groups = {}
+        for index, essay in enumerate(essays):
+            items.append({
+                'index': index,
+                'name': essay.get('name') or f'essay-{index + 1}',
+                'status': 'pending',
+                'result': None,
+                'history_id': None,
+            })
+            groups.setdefault(normalize_essay(essay['content']), []).append(index)
+
+        batch = {
+            'batch_id': batch_id,
+            'status': 'running',
+            'created_at': time.time(),
+            'total': len(items),
+            'unique': len(groups),
+            'completed': 0,
+            'items': items,
+        }
+        with self._lock:
+            self._batches[batch_id] = batch
+            self._evict()
+
+        for indexes in groups.values():
+            content = essays[indexes[0]]['content']
+            # 批改线程的日志沿用提交请求的关联ID
+            context = contextvars.copy_context()
+            self._executor.submit(context.run, self._grade_group, batch, indexes, content, input_type)
+
+        logger.info(f'批量批改已提交，批次ID: {batch_id}，作文数: {len(items)}，去重后: {len(groups)}')
+        return self._summary(batch)
+
+    def _grade_group(self, batch, indexes, content, input_type):
+        """批改一组相同的作文，并把结果分发给组内每一篇"""
+        with self._lock:
+            for index in indexes:
+                batch['items'][index]['status'] = 'running'
+        try:
+            result = self.xunfei_api.check_essay(content)
+            if result.get('degraded'):
+                # 星火调用失败时check_essay返回本地检查的降级结果：标记为失败，不保存历史记录
+                logger.error(f'批量批改失败，批次ID: {batch["batch_id"]}: 星火不可用，仅有本地检查结果')
+                history_item = None
+                status = 'failed'
+            else:
+                history_item = self.history_service.add_history(content, result, input_type)
+                status = 'completed'
+        except Exception as e:
+            logger.error(f'批量批改失败，批次ID: {batch["batch_id"]}: {str(e)}')
+            result = {'error': str(e)}
+            history_item = None
+            status = 'failed'
+
+        with self._changed:
+            for index in indexes:
+                item = batch['items'][index]
+                item['status'] = status
+                item['result'] = result
+                item['history_id'] = history_item['id'] if history_item else None
+            batch['completed'] += len(indexes)
+            if batch['completed'] == batch['total']:
+                batch['status'] = 'completed'
+                batch['finished_at'] = time.time()
+            self._changed.notify_all()
+
+    def _evict(self):
+        """淘汰最早的已完成批次（调用方需持有锁）"""
+        while len(self._batches) > self.max_batches:
+            finished = next((key for key, batch in self._batches.items() if batch['status'] == 'completed'), None)
+            if finished is None:
+                break
+            del self._batches[finished]
+
+    def _summary(self, batch):
+        return {key: batch[key] for key in ('batch_id', 'status', 'total', 'unique', 'completed')}
+
+    def get_batch(self, batch_id):
+        """获取批次状态和已完成的结果，批次不存在时返回None"""
+        with self._lock:
+            batch = self._batches.get(batch_id)
+            if batch is None:
+                return None
+            summary = self._summary(batch)
+            summary['items'] = [dict(item) for item in batch['items']]
+            return summary
+
+    def iter_results(self, batch_id, timeout=None):
+        """按完成顺序逐篇产出结果，全部完成后结束；批次不存在时立即结束"""
+        sent = set()
+        deadline = time.time() + timeout if timeout else None
+        while True:
+            with self._changed:
+                batch = self._batches.get(batch_id)
+                if batch is None:
+                    return
+                ready = [dict(item) for item in batch['items']
+                         if item['index'] not in sent and item['status'] in ('completed', 'failed')]
+                if not ready:
+                    if batch['status'] == 'completed':
+                        return
+                    remaining = deadline - time.time() if deadline else None
+                    if remaining is not None and remaining <= 0:
+                        return
+                    self._changed.wait(remaining)
+                    continue
+            for item in ready:
+                sent.add(item['index'])
+                yield item
@@ -0,0 +1,74 @@
+import zipfile
+import xml.etree.ElementTree as ET
+
+# WordprocessingML命名空间
+W_NS = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+MC_NS = '{http://schemas.openxmlformats.org/markup-compatibility/2006}'
+
+PARAGRAPH = W_NS + 'p'
+TEXT = W_NS + 't'
+TAB = W_NS + 'tab'
+BREAKS = (W_NS + 'br', W_NS + 'cr')
+BODY = W_NS + 'body'
+# 文本框在 mc:AlternateContent 中同时以新格式（mc:Choice）和VML（mc:Fallback）各保存一份
+FALLBACK = MC_NS + 'Fallback'
+
+
+class DocumentTooLongError(ValueError):
+    """文档字符数超过上限"""
+
+
+def extract_docx_text(source, max_chars=None):
+    """流式提取.docx正文的文本，返回按段落换行拼接的全文
+
+    source 为文件路径或可seek的二进制流（例如上传文件的流），不会写入临时文件。
+    段落、表格单元格和文本框中的文字按文档顺序提取，空段落被跳过。
+    累计字符数超过max_chars时立即抛出DocumentTooLongError，不再解析剩余内容；
+    文件不是有效的.docx时抛出ValueError。
+    """
+    try:
+        with zipfile.ZipFile(source) as archive, archive.open('word/document.xml') as xml:
+            return '\n'.join(_iter_paragraphs(xml, max_chars))
+    except (zipfile.BadZipFile, KeyError, ET.ParseError) as e:
+        raise ValueError(f'无法解析的Word文档: {e}') from e
+
+
+def _iter_paragraphs(xml, max_chars):
+    """逐个产生非空段落的文本，已处理的元素会被释放"""
+    # 文本框中的段落嵌套在外层段落里，每层段落一个缓冲区
+    paragraphs = []
+    body = None
+    fallback_depth = 0
+    total = 0
+    for event, elem in ET.iterparse(xml, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == FALLBACK:
+                fallback_depth += 1
+            elif tag == PARAGRAPH and not fallback_depth:
+                paragraphs.append([])
+            elif tag == BODY:
+                body = elem
+            continue
+
+        if tag == FALLBACK:
+            fallback_depth -= 1
+        elif fallback_depth or not paragraphs:
+            pass
+        elif tag == TEXT:
+            paragraphs[-1].append(elem.text or '')
+        elif tag == TAB:
+            paragraphs[-1].append('\t')
+        elif tag in BREAKS:
+            paragraphs[-1].append('\n')
+        elif tag == PARAGRAPH:
+            text = ''.join(paragraphs.pop())
+            if text.strip():
+                total += len(text) + 1
+                if max_chars and total - 1 > max_chars:
+                    raise DocumentTooLongError(f'文档超过 {max_chars} 个字符')
+                yield text
+
+        # 正文的顶层元素（段落、表格）处理完后释放，内存占用与文档大小无关
+        if body is not None and not paragraphs and tag != BODY:
+            body.clear()
@@ -0,0 +1,141 @@
+import re
+
+from services.span_aligner import find_spans
+
+# 句子：到句末标点（可带引号、括号）为止，或到段落末尾
+_SENTENCE_RE = re.compile(r'[^.!?。！？]*(?:[.!?。！？]+["\'”’)\]]*|$)')
+_PARAGRAPH_RE = re.compile(r'[^\n]+')
+
+# 合并后各列表的条数上限
+MAX_MERGED_SUGGESTIONS = 5
+MAX_MERGED_GRAMMAR_ERRORS = 5
+
+
+def _trimmed(text, start, end):
+    """去掉 text[start:end] 两端的空白，返回新的 (start, end)，全是空白时返回None"""
+    piece = text[start:end]
+    stripped = piece.strip()
+    if not stripped:
+        return None
+    start += len(piece) - len(piece.lstrip())
+    return start, start + len(stripped)
+
+
+def _hard_split(text, start, end, max_chars):
+    """没有句末标点的超长句子：尽量在空白处切开"""
+    while end - start > max_chars:
+        cut = text.rfind(' ', start + 1, start + max_chars + 1)
+        if cut <= start:
+            cut = start + max_chars
+        span = _trimmed(text, start, cut)
+        if span:
+            yield span
+        start = cut
+    span = _trimmed(text, start, end)
+    if span:
+        yield span
+
+
+def paragraph_spans(text):
+    """返回各非空段落（按换行分隔，去掉两端空白）在原文中的 (start, end)"""
+    spans = []
+    for paragraph in _PARAGRAPH_RE.finditer(text):
+        span = _trimmed(text, paragraph.start(), paragraph.end())
+        if span is not None:
+            spans.append(span)
+    return spans
+
+
+def locate_errors(text, errors, start=0, end=None):
+    """在 text[start:end] 中定位各条错误的 original，返回每条错误在text中的 (start, end)（找不到时为None）
+
+    按错误的先后顺序依次对应，同一个原文片段出现多次时依次对应；匹配忽略大小写、空白和标点的差异（见 find_spans）。
+    """
+    originals = [(error.get('original') or '') if isinstance(error, dict) else '' for error in errors]
+    return find_spans(text, originals, start, end)
+
+
+def _units(text, max_chars):
+    """按文档顺序产出不可再分的文本单元：段落；超长段落按句子；超长句子按空白"""
+    for span in paragraph_spans(text):
+        if span[1] - span[0] <= max_chars:
+            yield span
+            continue
+        for sentence in _SENTENCE_RE.finditer(text, span[0], span[1]):
+            if sentence.start() == sentence.end():
+                continue
+            sentence_span = _trimmed(text, sentence.start(), sentence.end())
+            if sentence_span:
+                yield from _hard_split(text, *sentence_span, max_chars)
+
+
+def split_essay(text, max_chars):
+    """把作文切分为不超过max_chars的片段，优先在段落边界切开，其次在句子边界
+
+    返回 [{'start': ..., 'end': ..., 'text': ...}]，start/end 为片段在原文中的位置，
+    片段之间原有的空白（换行或空格）不属于任何片段。
+    """
+    segments = []
+    current = None
+    for start, end in _units(text, max_chars):
+        if current is not None and end - current[0] <= max_chars:
+            current[1] = end
+            continue
+        if current is not None:
+            segments.append(current)
+        current = [start, end]
+    if current is not None:
+        segments.append(current)
+    return [{'start': start, 'end': end, 'text': text[start:end]} for start, end in segments]
+
+
+def dedupe(items, limit):
+    """去掉空项和重复项，保持原有顺序，最多保留limit条"""
+    merged = []
+    for item in items:
+        if item and item not in merged:
+            merged.append(item)
+    return merged[:limit]
+
+
+def merge_results(text, segments, results):
+    """把各片段的批改结果按原文顺序合并为一份结果
+
+    results 与 segments 一一对应，批改失败的片段为None：该片段按原文保留，不产生错误。
+    每条详细错误增加 segment（片段序号）和 start/end（original 在整篇作文中的位置，找不到时为None），
+    同一片段内的错误按出现位置排序。
+    """
+    detailed_errors = []
+    corrected_parts = []
+    feedback = []
+    suggestions = []
+    grammar_errors = []
+    for index, (segment, result) in enumerate(zip(segments, results)):
+        # 片段之间保留原文中的分隔符（段落换行或句间空格）
+        if index:
+            corrected_parts.append(text[segments[index - 1]['end']:segment['start']])
+        if result is None:
+            corrected_parts.append(segment['text'])
+            continue
+
+        corrected_parts.append(result.get('corrected_text') or segment['text'])
+        if result.get('feedback'):
+            feedback.append(result['feedback'])
+        suggestions.extend(result.get('suggestions') or [])
+        grammar_errors.extend(result.get('grammar_errors') or [])
+
+        errors = [error for error in result.get('detailed_errors') or [] if isinstance(error, dict)]
+        spans = locate_errors(text, errors, segment['start'], segment['end'])
+        located = [dict(error, segment=index, start=span[0] if span else None, end=span[1] if span else None)
+                   for error, span in zip(errors, spans)]
+        # 找不到位置的错误排在片段末尾，保持模型给出的相对顺序
+        located.sort(key=lambda error: error['start'] if error['start'] is not None else segment['end'])
+        detailed_errors.extend(located)
+
+    return {
+        'feedback': '\n\n'.join(feedback),
+        'suggestions': dedupe(suggestions, MAX_MERGED_SUGGESTIONS),
+        'grammar_errors': dedupe(grammar_errors, MAX_MERGED_GRAMMAR_ERRORS),
+        'detailed_errors': detailed_errors,
+        'corrected_text': ''.join(corrected_parts),
+    }
@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import copy
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# 连续的空格/制表符、行尾空白、多余空行
+_INLINE_SPACE_RE = re.compile(r'[ \t　]+')
+_BLANK_LINES_RE = re.compile(r'\n{3,}')
+
+
+def normalize_essay(content):
+    """规范化作文文本：统一Unicode形式和换行，压缩多余空白，不改变大小写和标点"""
+    text = unicodedata.normalize('NFKC', content or '')
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = '\n'.join(_INLINE_SPACE_RE.sub(' ', line).strip() for line in text.split('\n'))
+    return _BLANK_LINES_RE.sub('\n\n', text).strip()
+
+
+class GradingCache:
+    """按内容寻址的批改结果缓存：内存LRU + 可选的SQLite磁盘层，均支持TTL"""
+
+    def __init__(self, max_entries=512, ttl=86400, disk_path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn = None
+        if disk_path:
+            self._conn = sqlite3.connect(disk_path, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS grading_cache ('
+                    'key TEXT PRIMARY KEY, '
+                    'expires_at REAL NOT NULL, '
+                    'result TEXT NOT NULL)'
+                )
+
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建缓存，GRADING_CACHE_SIZE=0 时返回None（关闭缓存）"""
+        max_entries = int(os.getenv('GRADING_CACHE_SIZE', 512))
+        if max_entries <= 0:
+            return None
+        ttl = int(os.getenv('GRADING_CACHE_TTL', 86400))
+        disk_path = os.getenv('GRADING_CACHE_PATH') or None
+        return cls(max_entries=max_entries, ttl=ttl, disk_path=disk_path)
+
+    @staticmethod
+    def make_key(content, prompt, parameters):
+        """由规范化的作文文本、提示词模板和模型参数计算缓存键"""
+        payload = json.dumps({
+            'content': normalize_essay(content),
+            'prompt': prompt,
+            'parameters': parameters,
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """查询缓存，命中时返回结果的副本，未命中返回None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return copy.deepcopy(result)
+                del self._memory[key]
+
+            if self._conn is not None:
+                row = self._conn.execute(
+                    'SELECT expires_at, result FROM grading_cache WHERE key = ?', (key,)
+                ).fetchone()
+                if row and row[0] > now:
+                    result = json.loads(row[1])
+                    self._remember(key, row[0], result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return copy.deepcopy(result)
+
+            self.misses += 1
+            return None
+
+    def set(self, key, result):
+        """写入缓存（内存层与磁盘层）"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, copy.deepcopy(result))
+            if self._conn is not None:
+                try:
+                    with self._conn:
+                        self._conn.execute(
+                            'INSERT OR REPLACE INTO grading_cache (key, expires_at, result) VALUES (?, ?, ?)',
+                            (key, expires_at, json.dumps(result, ensure_ascii=False))
+                        )
+                        self._conn.execute('DELETE FROM grading_cache WHERE expires_at <= ?', (time.time(),))
+                except sqlite3.Error as e:
+                    logger.error(f'写入批改结果磁盘缓存失败: {str(e)}')
+
+    def _remember(self, key, expires_at, result):
+        self._memory[key] = (expires_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'size': len(self._memory),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'disk_enabled': self._conn is not None,
+            }
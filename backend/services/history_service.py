@@ -1,110 +1,279 @@
-import json
 import os
+import bisect
+import threading
 from datetime import datetime, timedelta
 import logging
+from services.history_storage import create_history_storage, migrate_legacy_json
+from services import metrics
 
 logger = logging.getLogger(__name__)
 
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# 列表摘要中作文预览的长度
+PREVIEW_LENGTH = 100
+
+# 各筛选条件对应的时间窗口（与原实现一致：time_diff.days == 0 / <= 3 / <= 7）
+FILTER_WINDOWS = {
+    'today': timedelta(days=1),
+    '3days': timedelta(days=4),
+    'week': timedelta(days=8),
+}
+
 class HistoryService:
-    def __init__(self, storage_file='history.json'):
+    def __init__(self, storage_file='history.json', storage=None):
+        # storage_file 为旧版JSON文件，仅用于首次启动时迁移
         self.storage_file = os.path.join(os.path.dirname(__file__), '..', storage_file)
-        self.history = self._load_history()
+        if storage is None:
+            base_path = os.getenv('HISTORY_STORAGE_PATH') or os.path.splitext(self.storage_file)[0]
+            storage = create_history_storage(os.getenv('HISTORY_BACKEND', 'sqlite'), base_path)
+        self.storage = storage
+        # 保护内存列表与存储写入，支持多线程worker共享同一个实例
+        self._lock = threading.RLock()
+        # ID索引：id -> 记录
+        self._by_id = {}
+        # 时间索引：按 (创建时间, -id) 升序排列，创建时间在插入时解析一次
+        self._timeline = []
+        # 修订索引：作文ID（第一版的记录ID）-> 各版本记录ID（升序）
+        self._revisions = {}
+        self._rebuild(self._load_history())
     
-    def _load_history(self):
-        """从文件加载历史记录"""
+    @property
+    def history(self):
+        """按ID升序排列的全部历史记录"""
+        with self._lock:
+            self._refresh()
+            return [self._by_id[key] for key in sorted(self._by_id)]
+    
+    def _rebuild(self, items):
+        """用全部记录重建索引（调用方需持有锁）"""
+        self._by_id = {item['id']: item for item in items}
+        self._timeline = sorted(self._timeline_key(item) for item in items)
+        self._revisions = {}
+        for item in sorted(items, key=lambda item: item['id']):
+            self._revisions.setdefault(self._essay_id(item), []).append(item['id'])
+    
+    def _refresh(self):
+        """应用其他进程（或共享同一存储的其他实例）写入的变更（调用方需持有锁）
+        
+        变更按发生顺序应用，且按ID幂等，重复收到本进程自己的写入也不影响结果。
+        """
         try:
-            if os.path.exists(self.storage_file):
-                with open(self.storage_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # 确保数据是列表格式
-                    if isinstance(data, list):
-                        return data
-                    else:
-                        return []
-            else:
-                return []
+            changes = self.storage.changes()
         except Exception as e:
-            logger.error(f'加载历史记录失败: {str(e)}')
-            return []
+            # 同步失败时继续使用当前索引，下次请求再重试
+            logger.error(f'同步历史记录变更失败: {str(e)}')
+            return
+        for change in changes:
+            op = change['op']
+            if op == 'add':
+                item = change['item']
+                if item['id'] in self._by_id:
+                    self._unindex(self._by_id[item['id']])
+                self._index(item)
+            elif op == 'del':
+                item = self._by_id.get(change['id'])
+                if item is not None:
+                    self._unindex(item)
+            elif op == 'clear':
+                self._rebuild([])
+            elif op == 'reset':
+                self._rebuild(change['items'])
     
-    def _save_history(self):
-        """保存历史记录到文件"""
+    def _timeline_key(self, item):
         try:
-            with open(self.storage_file, 'w', encoding='utf-8') as f:
-                json.dump(self.history, f, ensure_ascii=False, indent=2)
+            created_at = datetime.strptime(item['created_at'], TIME_FORMAT)
+        except (KeyError, TypeError, ValueError):
+            created_at = datetime.min
+        return (created_at, -item['id'])
+    
+    def _essay_id(self, item):
+        """记录所属作文的ID：第一版记录的ID"""
+        return item.get('essay_id') or item['id']
+    
+    def _index(self, item):
+        """将记录加入ID索引、时间索引和修订索引（调用方需持有锁）"""
+        self._by_id[item['id']] = item
+        bisect.insort(self._timeline, self._timeline_key(item))
+        bisect.insort(self._revisions.setdefault(self._essay_id(item), []), item['id'])
+    
+    def _unindex(self, item):
+        """将记录从ID索引、时间索引和修订索引中移除（调用方需持有锁）"""
+        del self._by_id[item['id']]
+        key = self._timeline_key(item)
+        index = bisect.bisect_left(self._timeline, key)
+        if index < len(self._timeline) and self._timeline[index] == key:
+            del self._timeline[index]
+        revisions = self._revisions.get(self._essay_id(item), [])
+        if item['id'] in revisions:
+            revisions.remove(item['id'])
+            if not revisions:
+                del self._revisions[self._essay_id(item)]
+    
+    def _load_history(self):
+        """从存储后端加载历史记录，首次启动时迁移旧版history.json"""
+        try:
+            migrate_legacy_json(self.storage, self.storage_file)
         except Exception as e:
-            logger.error(f'保存历史记录失败: {str(e)}')
+            # 未写入迁移标记，下次启动会重新尝试迁移
+            logger.error(f'迁移旧版历史记录失败: {str(e)}')
+        try:
+            return self.storage.load()
+        except Exception as e:
+            logger.error(f'加载历史记录失败: {str(e)}')
+            return []
     
-    def add_history(self, content, result, input_type='text'):
-        """添加历史记录"""
+    def add_history(self, content, result, input_type='text', parent_id=None):
+        """添加历史记录
+        
+        parent_id 为同一篇作文上一版的记录ID，新记录与其归为同一篇作文的修订。
+        """
         try:
             history_item = {
-                'id': len(self.history) + 1,
+                'id': None,
                 'content': content,
                 'result': result,
                 'type': input_type,
                 'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
-            self.history.append(history_item)
-            self._save_history()
+            with self._lock:
+                self._refresh()
+                if parent_id is not None:
+                    parent = self._by_id.get(parent_id)
+                    history_item['parent_id'] = parent_id
+                    history_item['essay_id'] = self._essay_id(parent) if parent is not None else parent_id
+                # ID由存储后端分配，保证单调递增且不会复用已删除的ID
+                with metrics.timed('history_write'):
+                    self.storage.append(history_item)
+                self._index(history_item)
             
-            logger.info(f'历史记录已添加，ID: {history_item["id"]}')
+            logger.info('历史记录已添加，ID: %s', history_item['id'])
             return history_item
         except Exception as e:
             logger.error(f'添加历史记录失败: {str(e)}')
             return None
     
+    def _filter_range(self, filter_type):
+        """返回筛选条件在时间索引中对应的 [start, end) 范围（调用方需持有锁），筛选条件无效时返回None"""
+        window = FILTER_WINDOWS.get(filter_type)
+        if window is None:
+            return (0, len(self._timeline)) if filter_type == 'all' else None
+        now = datetime.now()
+        # 二分定位时间窗口的起点（创建时间晚于 now - window 的记录）
+        start = bisect.bisect_right(self._timeline, (now - window, float('inf')))
+        if filter_type == 'today':
+            end = bisect.bisect_right(self._timeline, (now, float('inf')))
+        else:
+            end = len(self._timeline)
+        return start, end
+    
     def get_history(self, filter_type='all'):
-        """获取历史记录，支持按时间筛选"""
+        """获取历史记录，支持按时间筛选，按时间倒序排列"""
         try:
-            now = datetime.now()
-            filtered_history = []
-            
-            for item in self.history:
-                created_at = datetime.strptime(item['created_at'], '%Y-%m-%d %H:%M:%S')
-                time_diff = now - created_at
-                
-                if filter_type == 'today' and time_diff.days == 0:
-                    filtered_history.append(item)
-                elif filter_type == '3days' and time_diff.days <= 3:
-                    filtered_history.append(item)
-                elif filter_type == 'week' and time_diff.days <= 7:
-                    filtered_history.append(item)
-                elif filter_type == 'all':
-                    filtered_history.append(item)
-            
-            # 按时间倒序排列
-            filtered_history.sort(key=lambda x: x['created_at'], reverse=True)
-            
-            return filtered_history
+            with self._lock:
+                self._refresh()
+                bounds = self._filter_range(filter_type)
+                if bounds is None:
+                    return []
+                start, end = bounds
+                return [self._by_id[-key[1]] for key in reversed(self._timeline[start:end])]
         except Exception as e:
             logger.error(f'获取历史记录失败: {str(e)}')
             return []
     
+    def summarize(self, item):
+        """历史记录摘要：列表页只需要的字段，不包含作文全文和批改结果"""
+        result = item.get('result') or {}
+        detailed_errors = result.get('detailed_errors') if isinstance(result, dict) else None
+        content = item.get('content') or ''
+        return {
+            'id': item['id'],
+            'type': item.get('type'),
+            'created_at': item.get('created_at'),
+            'preview': content[:PREVIEW_LENGTH],
+            'error_count': len(detailed_errors) if isinstance(detailed_errors, list) else 0
+        }
+    
+    def _encode_cursor(self, key):
+        """时间索引键 -> 分页游标字符串 "<创建时间的秒数>_<ID>"（不依赖该记录是否仍然存在）"""
+        created_at, negative_id = key
+        return f'{int((created_at - datetime.min).total_seconds())}_{-negative_id}'
+    
+    def _decode_cursor(self, cursor):
+        """分页游标字符串 -> 时间索引键，格式错误时抛出ValueError"""
+        seconds, history_id = cursor.split('_', 1)
+        return (datetime.min + timedelta(seconds=int(seconds)), -int(history_id))
+    
+    def get_history_page(self, filter_type='all', limit=20, before=None):
+        """分页获取历史记录摘要，按时间倒序排列
+        
+        before 为上一页返回的游标（上一页最后一条记录的创建时间和ID），返回排在它之后的记录；
+        游标记录的是位置而不是记录本身，该记录被删除后仍可继续翻页。游标格式错误时返回None。
+        返回 {'items': [...], 'total': 筛选后的总数, 'next_before': 下一页游标或None}
+        """
+        try:
+            cursor_key = self._decode_cursor(before) if before is not None else None
+        except (ValueError, OverflowError):
+            return None
+        try:
+            with self._lock:
+                self._refresh()
+                bounds = self._filter_range(filter_type)
+                if bounds is None:
+                    return {'items': [], 'total': 0, 'next_before': None}
+                start, end = bounds
+                total = end - start
+                if cursor_key is not None:
+                    # 游标在时间索引中的位置，之前（更早）的记录即为下一页
+                    end = max(start, min(end, bisect.bisect_left(self._timeline, cursor_key)))
+                page_start = max(start, end - limit)
+                keys = self._timeline[page_start:end]
+                items = [self.summarize(self._by_id[-key[1]]) for key in reversed(keys)]
+                next_before = self._encode_cursor(keys[0]) if keys and page_start > start else None
+                return {'items': items, 'total': total, 'next_before': next_before}
+        except Exception as e:
+            logger.error(f'分页获取历史记录失败: {str(e)}')
+            return {'items': [], 'total': 0, 'next_before': None}
+    
     def get_history_by_id(self, history_id):
         """根据ID获取历史记录"""
         try:
-            for item in self.history:
-                if item['id'] == history_id:
-                    return item
-            return None
+            with self._lock:
+                self._refresh()
+                return self._by_id.get(history_id)
         except Exception as e:
             logger.error(f'根据ID获取历史记录失败: {str(e)}')
             return None
     
+    def get_revisions(self, history_id):
+        """获取记录所属作文的全部修订，按ID（提交顺序）升序排列；记录不存在时返回None"""
+        try:
+            with self._lock:
+                self._refresh()
+                item = self._by_id.get(history_id)
+                if item is None:
+                    return None
+                return [self._by_id[key] for key in self._revisions.get(self._essay_id(item), [])]
+        except Exception as e:
+            logger.error(f'获取作文修订记录失败: {str(e)}')
+            return None
+    
     def delete_history(self, history_id):
         """删除历史记录"""
         try:
-            original_length = len(self.history)
-            self.history = [item for item in self.history if item['id'] != history_id]
-            
-            if len(self.history) < original_length:
-                self._save_history()
-                logger.info(f'历史记录已删除，ID: {history_id}')
-                return True
-            else:
-                return False
+            with self._lock:
+                self._refresh()
+                item = self._by_id.get(history_id)
+                if item is None:
+                    return False
+                with metrics.timed('history_write'):
+                    self.storage.delete(history_id)
+                    self._unindex(item)
+                    if self.storage.needs_compaction():
+                        self.storage.compact()
+            logger.info(f'历史记录已删除，ID: {history_id}')
+            return True
         except Exception as e:
             logger.error(f'删除历史记录失败: {str(e)}')
             return False
@@ -112,8 +281,10 @@ class HistoryService:
     def clear_history(self):
         """清空所有历史记录"""
         try:
-            self.history = []
-            self._save_history()
+            with self._lock:
+                with metrics.timed('history_write'):
+                    self.storage.clear()
+                self._rebuild([])
             logger.info('所有历史记录已清空')
             return True
         except Exception as e:
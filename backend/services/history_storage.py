@@ -0,0 +1,461 @@
+import json
+import os
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有fcntl时只保证单进程内的线程安全
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryStorage:
+    """历史记录存储后端基类，只负责持久化单条记录的增删
+
+    多个进程可以共享同一个存储文件：ID由存储统一分配，各进程通过 changes() 获取
+    其他进程写入的变更，以保持内存索引与存储一致。
+    """
+
+    def load(self):
+        """加载全部历史记录，按ID升序返回"""
+        raise NotImplementedError
+
+    def append(self, item):
+        """追加一条历史记录，由存储后端分配单调递增的ID并写入item['id']"""
+        raise NotImplementedError
+
+    def import_items(self, items):
+        """按原ID导入历史记录并标记迁移完成（用于从旧版history.json迁移）"""
+        raise NotImplementedError
+
+    def needs_migration(self):
+        """旧版history.json是否尚未成功迁移"""
+        return False
+
+    def mark_migrated(self):
+        """记录迁移已完成"""
+        pass
+
+    def delete(self, history_id):
+        """删除一条历史记录"""
+        raise NotImplementedError
+
+    def clear(self):
+        """清空所有历史记录（已分配的ID不会被重新使用）"""
+        raise NotImplementedError
+
+    def changes(self):
+        """返回自上次 load()/changes() 以来存储中的变更，按发生顺序排列
+
+        每项为 {'op': 'add', 'item': ...}、{'op': 'del', 'id': ...}、{'op': 'clear'}
+        或 {'op': 'reset', 'items': [...]}（无法增量同步时返回全部记录）。
+        结果中可能包含本进程自己写入的变更，调用方按ID幂等地应用即可。
+        """
+        return []
+
+    def needs_compaction(self):
+        """是否需要压缩存储文件"""
+        return False
+
+    def compact(self):
+        """用当前有效记录重写存储文件"""
+        pass
+
+    def close(self):
+        """释放存储资源"""
+        pass
+
+
+class SQLiteHistoryStorage(HistoryStorage):
+    """基于SQLite（WAL模式）的历史记录存储，每次只写入变更的记录
+
+    每次写入在同一事务中向 changes 表追加一条变更记录；其他进程通过 PRAGMA data_version
+    发现数据库被修改后，只读取新增的变更，无需重新加载全部记录。
+    """
+
+    # changes 表保留的变更条数，落后更多的进程会重新加载全部记录
+    CHANGE_RETENTION = 10000
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            # AUTOINCREMENT保证删除或清空后ID也不会被重新分配
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS history ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'created_at TEXT NOT NULL, '
+                'data TEXT NOT NULL)'
+            )
+            self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS changes ('
+                'seq INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'op TEXT NOT NULL, '
+                'history_id INTEGER)'
+            )
+        # 已同步到的变更序号，以及上次检查时的 data_version
+        self._seq = 0
+        self._data_version = None
+
+    def _decode(self, history_id, data):
+        item = json.loads(data)
+        item['id'] = history_id
+        return item
+
+    def _load_locked(self):
+        # 在同一个读事务中读取记录和变更序号，保证二者一致
+        self._conn.execute('BEGIN')
+        try:
+            rows = self._conn.execute('SELECT id, data FROM history ORDER BY id').fetchall()
+            self._seq = self._conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+        finally:
+            self._conn.execute('COMMIT')
+        self._data_version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+        return [self._decode(history_id, data) for history_id, data in rows]
+
+    def load(self):
+        with self._lock:
+            return self._load_locked()
+
+    def _record_change(self, op, history_id=None):
+        """记录一条变更（调用方需在写事务中），并定期清理过旧的变更"""
+        seq = self._conn.execute(
+            'INSERT INTO changes (op, history_id) VALUES (?, ?)', (op, history_id)
+        ).lastrowid
+        if seq % 1000 == 0:
+            self._conn.execute('DELETE FROM changes WHERE seq <= ?', (seq - self.CHANGE_RETENTION,))
+
+    def append(self, item):
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                'INSERT INTO history (created_at, data) VALUES (?, ?)',
+                (item['created_at'], json.dumps(item, ensure_ascii=False))
+            )
+            item['id'] = cursor.lastrowid
+            self._record_change('add', item['id'])
+        return item['id']
+
+    def import_items(self, items):
+        rows = [(item['id'], item['created_at'], json.dumps(item, ensure_ascii=False)) for item in items]
+        # 导入与迁移标记在同一事务中提交，失败时下次启动会重新迁移
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO history (id, created_at, data) VALUES (?, ?, ?)', rows)
+            self._conn.executemany(
+                "INSERT INTO changes (op, history_id) VALUES ('add', ?)", [(item['id'],) for item in items]
+            )
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', '1')")
+
+    def needs_migration(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'migrated'").fetchone()
+        return row is None
+
+    def mark_migrated(self):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', '1')")
+
+    def delete(self, history_id):
+        with self._lock, self._conn:
+            cursor = self._conn.execute('DELETE FROM history WHERE id = ?', (history_id,))
+            deleted = cursor.rowcount > 0
+            if deleted:
+                self._record_change('del', history_id)
+        return deleted
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM history')
+            self._record_change('clear')
+
+    def changes(self):
+        with self._lock:
+            # data_version 只在其他连接提交写入后变化，未变化时无需查询
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._data_version:
+                return []
+            self._data_version = version
+
+            self._conn.execute('BEGIN')
+            try:
+                oldest = self._conn.execute('SELECT MIN(seq) FROM changes').fetchone()[0]
+                if oldest is not None and oldest > self._seq + 1:
+                    # 需要的变更已被清理，只能重新加载
+                    self._conn.execute('COMMIT')
+                    return [{'op': 'reset', 'items': self._load_locked()}]
+                rows = self._conn.execute(
+                    'SELECT c.seq, c.op, c.history_id, h.data FROM changes c '
+                    "LEFT JOIN history h ON c.op = 'add' AND h.id = c.history_id "
+                    'WHERE c.seq > ? ORDER BY c.seq',
+                    (self._seq,)
+                ).fetchall()
+            finally:
+                if self._conn.in_transaction:
+                    self._conn.execute('COMMIT')
+
+            result = []
+            for seq, op, history_id, data in rows:
+                self._seq = seq
+                if op == 'add':
+                    # 记录已被后续变更删除时跳过，之后的del变更会处理
+                    if data is not None:
+                        result.append({'op': 'add', 'item': self._decode(history_id, data)})
+                elif op == 'del':
+                    result.append({'op': 'del', 'id': history_id})
+                elif op == 'clear':
+                    result.append({'op': 'clear'})
+            return result
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class AppendLogHistoryStorage(HistoryStorage):
+    """基于追加日志（JSON Lines）的历史记录存储，删除记录过多时自动压缩
+
+    清空和压缩时会在日志开头写入 {"op": "meta", "last_id": N}，保留已分配的最大ID，
+    保证ID单调递增、不被重新使用。
+
+    多个进程共享同一个日志时，所有写入都在 log_path + '.lock' 的文件锁（fcntl.flock）内进行：
+    写入前先读取其他进程追加的内容以获得最新的ID高水位。压缩和清空通过原子替换文件完成，
+    其他进程发现文件被替换后重新加载。
+    """
+
+    # 失效日志条数超过该阈值且多于有效记录数时触发压缩
+    COMPACT_THRESHOLD = 1000
+
+    def __init__(self, log_path):
+        self.log_path = log_path
+        # 迁移完成后写入的标记文件
+        self.marker_path = log_path + '.migrated'
+        self.lock_path = log_path + '.lock'
+        self._lock = threading.Lock()
+        # 有效记录的ID和失效日志条数，用于判断是否需要压缩
+        self._live_ids = set()
+        self._dead_count = 0
+        self._last_id = 0
+        # 已读取到的文件位置和文件标识（inode），文件被替换时重新加载
+        self._offset = 0
+        self._file_id = None
+        # 写入前追赶读取到的、尚未通过 changes() 返回的变更
+        self._pending = []
+        if not os.path.exists(log_path):
+            open(log_path, 'a', encoding='utf-8').close()
+
+    @contextmanager
+    def _locked(self):
+        """线程锁 + 跨进程文件锁"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _apply(self, entry):
+        """更新计数和ID高水位，返回需要通知调用方的变更（调用方需持有线程锁）"""
+        op = entry.get('op')
+        if op == 'add':
+            history_id = entry['item']['id']
+            self._last_id = max(self._last_id, history_id)
+            if history_id in self._live_ids:
+                self._dead_count += 1
+            self._live_ids.add(history_id)
+            return entry
+        if op == 'del':
+            if entry['id'] in self._live_ids:
+                self._live_ids.discard(entry['id'])
+                self._dead_count += 2
+            else:
+                self._dead_count += 1
+            return entry
+        if op == 'meta':
+            self._last_id = max(self._last_id, entry.get('last_id', 0))
+        return None
+
+    def _read_new(self, reset=False):
+        """读取文件中尚未读取的完整行，返回其中的变更（调用方需持有线程锁）"""
+        try:
+            stat = os.stat(self.log_path)
+        except FileNotFoundError:
+            return []
+        file_id = (stat.st_dev, stat.st_ino)
+        if reset or file_id != self._file_id or stat.st_size < self._offset:
+            # 首次读取，或文件已被其他进程压缩/清空后替换
+            self._file_id = file_id
+            self._offset = 0
+            self._dead_count = 0
+            self._live_ids = set()
+            reset = True
+        if stat.st_size == self._offset and not reset:
+            return []
+
+        with open(self.log_path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # 只处理完整的行，正在写入的最后一行留到下次读取
+        end = data.rfind(b'\n') + 1
+        self._offset += end
+        entries = []
+        for line in data[:end].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                entry = self._apply(json.loads(line))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                # 进程中途退出可能留下损坏的行，直接跳过
+                logger.warning('历史日志中存在损坏的行，已跳过')
+                self._dead_count += 1
+                continue
+            if entry is not None:
+                entries.append(entry)
+        if reset:
+            items = {}
+            for entry in entries:
+                if entry['op'] == 'add':
+                    items[entry['item']['id']] = entry['item']
+                else:
+                    items.pop(entry['id'], None)
+            return [{'op': 'reset', 'items': [items[key] for key in sorted(items)]}]
+        return entries
+
+    def _catch_up(self):
+        """写入前读取其他进程追加的内容（调用方需持有文件锁）"""
+        self._pending.extend(self._read_new())
+
+    def load(self):
+        with self._lock:
+            self._pending = []
+            changes = self._read_new(reset=True)
+        return changes[0]['items']
+
+    def changes(self):
+        with self._lock:
+            changes = self._pending + self._read_new()
+            self._pending = []
+        return changes
+
+    def _write_entries(self, entries):
+        lines = ''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(lines)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite(self, items):
+        """原子地重写日志文件，开头保留ID高水位（调用方需持有文件锁）"""
+        tmp_path = self.log_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'op': 'meta', 'last_id': self._last_id}) + '\n')
+            for item in items:
+                f.write(json.dumps({'op': 'add', 'item': item}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.log_path)
+        stat = os.stat(self.log_path)
+        self._file_id = (stat.st_dev, stat.st_ino)
+        self._offset = stat.st_size
+        self._live_ids = {item['id'] for item in items}
+        self._dead_count = 0
+
+    def _append_entries(self, entries):
+        """追加变更并把已读位置移到文件末尾（调用方需持有文件锁且已追赶读取）"""
+        self._write_entries(entries)
+        for entry in entries:
+            self._apply(entry)
+        self._offset = os.stat(self.log_path).st_size
+
+    def append(self, item):
+        with self._locked():
+            self._catch_up()
+            item['id'] = self._last_id + 1
+            self._append_entries([{'op': 'add', 'item': item}])
+        return item['id']
+
+    def import_items(self, items):
+        with self._locked():
+            self._catch_up()
+            self._append_entries([{'op': 'add', 'item': item} for item in items])
+        # 标记文件在数据落盘后再写入；若中途失败，下次启动重新导入时按ID去重
+        self.mark_migrated()
+
+    def needs_migration(self):
+        return not os.path.exists(self.marker_path)
+
+    def mark_migrated(self):
+        open(self.marker_path, 'a', encoding='utf-8').close()
+
+    def delete(self, history_id):
+        with self._locked():
+            self._catch_up()
+            if history_id not in self._live_ids:
+                return False
+            self._append_entries([{'op': 'del', 'id': history_id}])
+        return True
+
+    def clear(self):
+        with self._locked():
+            self._catch_up()
+            self._rewrite([])
+            self._pending.append({'op': 'clear'})
+
+    def needs_compaction(self):
+        """判断失效日志是否已多到需要压缩"""
+        return self._dead_count > self.COMPACT_THRESHOLD and self._dead_count > len(self._live_ids)
+
+    def compact(self):
+        """用当前有效记录重写日志文件，原子替换旧文件"""
+        with self._locked():
+            # 从文件重新读取有效记录，包含其他进程写入的记录
+            self._pending.extend(self._read_new(reset=True))
+            items = self._pending[-1]['items']
+            self._rewrite(items)
+        logger.info(f'历史日志压缩完成，有效记录: {len(items)}')
+
+
+def create_history_storage(backend, base_path):
+    """根据后端名称创建存储实例，base_path为不带扩展名的存储文件路径"""
+    backend = (backend or 'sqlite').lower()
+    if backend == 'sqlite':
+        return SQLiteHistoryStorage(base_path + '.db')
+    if backend == 'log':
+        return AppendLogHistoryStorage(base_path + '.log')
+    raise ValueError(f'不支持的历史记录存储后端: {backend}')
+
+
+def migrate_legacy_json(storage, json_path):
+    """将旧版history.json中的记录导入新的存储后端，返回导入的记录数
+
+    只有导入成功后才会写入迁移标记；读取或导入失败时抛出异常，下次启动会重试。
+    """
+    if not storage.needs_migration():
+        return 0
+    if not os.path.exists(json_path):
+        storage.mark_migrated()
+        return 0
+    with open(json_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f'{json_path} 不是有效的历史记录列表')
+
+    # 旧版按 len(history)+1 分配ID，删除后可能出现重复ID，迁移时保留最后一条
+    items = {}
+    for item in data:
+        if isinstance(item, dict) and 'id' in item and 'created_at' in item:
+            items[item['id']] = item
+    storage.import_items([items[key] for key in sorted(items)])
+    logger.info(f'已从 {json_path} 迁移 {len(items)} 条历史记录')
+    return len(items)
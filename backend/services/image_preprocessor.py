@@ -0,0 +1,95 @@
+import io
+import os
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# 送入OCR的图片长边上限（像素）：手机照片通常为4000px以上，缩小到该尺寸后识别率基本不变
+DEFAULT_MAX_SIDE = 2048
+# JPEG重新编码的质量
+DEFAULT_QUALITY = 85
+
+
+def preprocess_image(data, max_side=DEFAULT_MAX_SIDE, quality=DEFAULT_QUALITY):
+    """预处理图片：按EXIF方向旋转、转为灰度、缩小到max_side以内，并重新编码为JPEG
+
+    data 为图片字节或可seek的二进制流（例如上传文件的流，直接解码而不先读入内存）。
+    返回 (JPEG数据（bytes或memoryview）, 统计信息)。图片无法解析时抛出异常。
+    原图已是JPEG且处理后反而更大时（例如已经很小的灰度图），直接使用原图。
+    """
+    source = data if hasattr(data, 'read') else io.BytesIO(data)
+    original_bytes = source.seek(0, io.SEEK_END)
+    source.seek(0)
+    with Image.open(source) as image:
+        original_format = image.format
+        original_size = image.size
+        # 手机照片的方向记录在EXIF中，OCR服务不会读取
+        image = ImageOps.exif_transpose(image)
+        # 透明背景按白色处理，再转为灰度
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGBA', image.size, 'white')
+            image = Image.alpha_composite(background, image)
+        image = image.convert('L')
+        if max(image.size) > max_side:
+            image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=quality, optimize=True)
+        # 直接引用缓冲区，base64编码时不再复制
+        processed = buffer.getbuffer()
+        processed_size = image.size
+
+    if original_format == 'JPEG' and len(processed) >= original_bytes and processed_size == original_size:
+        source.seek(0)
+        processed = source.read()
+    return processed, {
+        'format': original_format,
+        'original_bytes': original_bytes,
+        'processed_bytes': len(processed),
+        'saved_bytes': original_bytes - len(processed),
+        'original_size': original_size,
+        'processed_size': processed_size,
+    }
+
+
+class ImagePreprocessor:
+    """在线程池中执行图片预处理
+
+    Pillow在解码、缩放和编码时会释放GIL，线程池即可并行利用多核；不使用进程池，
+    避免在已有多个线程的gunicorn worker中fork，或在spawn子进程中重新导入应用模块。
+    """
+
+    def __init__(self, max_workers=None, max_side=None, quality=None):
+        if max_workers is None:
+            max_workers = int(os.getenv('OCR_PREPROCESS_WORKERS', min(4, os.cpu_count() or 1)))
+        self.max_side = int(max_side or os.getenv('OCR_MAX_SIDE', DEFAULT_MAX_SIDE))
+        self.quality = int(quality or os.getenv('OCR_JPEG_QUALITY', DEFAULT_QUALITY))
+        # max_workers为0时在调用线程中直接处理
+        self._executor = (ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-preprocess')
+                          if max_workers > 0 else None)
+
+    def process(self, data):
+        """预处理单张图片，返回 (JPEG字节, 统计信息)"""
+        return self.process_many([data])[0]
+
+    def process_many(self, images):
+        """并行预处理多张图片，按输入顺序返回 [(JPEG字节, 统计信息)]，任一图片无法解析时抛出异常"""
+        with metrics.timed('preprocess_image'):
+            if self._executor is None or len(images) == 1:
+                results = [preprocess_image(data, self.max_side, self.quality) for data in images]
+            else:
+                futures = [self._executor.submit(preprocess_image, data, self.max_side, self.quality)
+                           for data in images]
+                results = [future.result() for future in futures]
+        for _, stats in results:
+            metrics.OCR_IMAGE_BYTES.labels('original').inc(stats['original_bytes'])
+            metrics.OCR_IMAGE_BYTES.labels('processed').inc(stats['processed_bytes'])
+            logger.info('图片预处理完成: %s %dx%d -> %dx%d，%d -> %d 字节，节省 %d 字节',
+                        stats['format'], *stats['original_size'], *stats['processed_size'],
+                        stats['original_bytes'], stats['processed_bytes'], stats['saved_bytes'])
+        return results
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+from services.log_config import request_id_var
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueue:
+    """基于SQLite的持久化任务队列，无需外部消息中间件
+
+    任务提交后立即返回任务ID，由本地worker线程领取执行。领取任务时写入租约到期时间，执行期间定期续租；
+    worker进程重启或崩溃后不再续租，租约过期的任务会被重新领取，因此任务不会因重启而丢失，
+    也不会因执行时间超过租约而被其他worker重复执行。
+    多个进程可以共享同一个数据库文件，领取任务在 BEGIN IMMEDIATE 事务中完成，不会重复领取。
+    已结束的任务保留 retention_seconds 秒后由worker定期删除。
+    """
+
+    # 两次清理已结束任务的最小间隔（秒）
+    PRUNE_INTERVAL = 3600
+
+    def __init__(self, db_path, lease_seconds=600, max_attempts=3, poll_interval=1.0, retention_seconds=7 * 86400):
+        self.db_path = db_path
+        # 租约时长：执行中的任务每隔租约的1/3续租一次，worker退出后最多经过该时长被重新领取
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.poll_interval = poll_interval
+        # 已完成或失败的任务的保留时长（秒），0表示不删除
+        self.retention_seconds = retention_seconds
+        self._last_prune = 0
+        self._prune_lock = threading.Lock()
+        self._handlers = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._workers = []
+        self._worker_prefix = f'{os.getpid()}-{uuid.uuid4().hex[:6]}'
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'id TEXT PRIMARY KEY, '
+                'kind TEXT NOT NULL, '
+                'payload TEXT NOT NULL, '
+                'status TEXT NOT NULL, '
+                'result TEXT, '
+                'error TEXT, '
+                'attempts INTEGER NOT NULL DEFAULT 0, '
+                'worker TEXT, '
+                'lease_until REAL, '
+                'created_at REAL NOT NULL, '
+                'updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)')
+
+    @classmethod
+    def from_env(cls, default_path):
+        return cls(
+            os.getenv('JOB_QUEUE_PATH') or default_path,
+            lease_seconds=int(os.getenv('JOB_LEASE_SECONDS', 600)),
+            max_attempts=int(os.getenv('JOB_MAX_ATTEMPTS', 3)),
+            retention_seconds=int(os.getenv('JOB_RETENTION_SECONDS', 7 * 86400)),
+        )
+
+    def _connect(self):
+        """每个线程使用独立的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA busy_timeout=30000')
+            self._local.conn = conn
+        return conn
+
+    def register(self, kind, handler):
+        """注册任务处理函数，handler(payload) 返回可JSON序列化的结果"""
+        self._handlers[kind] = handler
+
+    def submit(self, kind, payload):
+        """提交任务，返回任务ID"""
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, payload, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job_id, kind, json.dumps(payload, ensure_ascii=False), 'queued', now, now)
+        )
+        self._wakeup.set()
+        logger.info(f'任务已提交，任务ID: {job_id}，类型: {kind}')
+        return job_id
+
+    def get(self, job_id):
+        """查询任务状态和结果，任务不存在时返回None"""
+        row = self._connect().execute(
+            'SELECT id, kind, status, result, error, attempts, created_at, updated_at FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            'job_id': row[0],
+            'kind': row[1],
+            'status': row[2],
+            'result': json.loads(row[3]) if row[3] else None,
+            'error': row[4],
+            'attempts': row[5],
+            'created_at': row[6],
+            'updated_at': row[7],
+        }
+
+    def claim(self, worker_id):
+        """领取一个排队中或租约已过期的任务，没有任务时返回None"""
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            job_id, kind, payload, attempts = row
+            if attempts >= self.max_attempts:
+                # 多次因进程退出而未完成的任务不再重试
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, updated_at = ? WHERE id = ?",
+                    ('任务多次执行未完成', now, job_id)
+                )
+                conn.execute('COMMIT')
+                return self.claim(worker_id)
+            conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                "lease_until = ?, updated_at = ? WHERE id = ?",
+                (worker_id, now + self.lease_seconds, now, job_id)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return {'job_id': job_id, 'kind': kind, 'payload': json.loads(payload)}
+
+    def _finish(self, job_id, worker_id, status, result=None, error=None):
+        # 只有仍持有该任务的worker才能写入结果
+        self._connect().execute(
+            'UPDATE jobs SET status = ?, result = ?, error = ?, lease_until = NULL, updated_at = ? '
+            'WHERE id = ? AND worker = ?',
+            (status, json.dumps(result, ensure_ascii=False) if result is not None else None,
+             error, time.time(), job_id, worker_id)
+        )
+
+    def renew(self, job_id, worker_id):
+        """延长任务的租约，返回该worker是否仍持有任务"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + self.lease_seconds, job_id, worker_id)
+        )
+        return cursor.rowcount > 0
+
+    @contextmanager
+    def _heartbeat(self, job_id, worker_id):
+        """任务执行期间在后台线程中定期续租"""
+        done = threading.Event()
+
+        def beat():
+            while not done.wait(self.lease_seconds / 3):
+                try:
+                    if not self.renew(job_id, worker_id):
+                        logger.warning(f'任务租约已丢失，任务ID: {job_id}')
+                        return
+                except sqlite3.Error as e:
+                    logger.error(f'任务续租失败，任务ID: {job_id}: {str(e)}')
+
+        thread = threading.Thread(target=beat, name=f'job-heartbeat-{job_id[:8]}', daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def prune(self, now=None):
+        """删除结束时间早于保留时长的已完成或失败的任务，返回删除的条数"""
+        if not self.retention_seconds:
+            return 0
+        cutoff = (now or time.time()) - self.retention_seconds
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status IN ('completed', 'failed') AND updated_at < ?", (cutoff,)
+        )
+        if cursor.rowcount:
+            logger.info(f'已清理 {cursor.rowcount} 个过期任务')
+        return cursor.rowcount
+
+    def _maybe_prune(self):
+        """空闲时每隔 PRUNE_INTERVAL 秒清理一次（同一进程的多个worker只清理一次）"""
+        with self._prune_lock:
+            now = time.time()
+            if now - self._last_prune < self.PRUNE_INTERVAL:
+                return
+            self._last_prune = now
+        self.prune(now)
+
+    def run_once(self, worker_id):
+        """领取并执行一个任务，返回是否执行了任务"""
+        job = self.claim(worker_id)
+        if job is None:
+            return False
+        handler = self._handlers.get(job['kind'])
+        # 任务执行期间的日志以任务ID作为关联ID
+        token = request_id_var.set(f'job-{job["job_id"][:12]}')
+        try:
+            if handler is None:
+                raise ValueError(f'未注册的任务类型: {job["kind"]}')
+            with self._heartbeat(job['job_id'], worker_id):
+                result = handler(job['payload'])
+            self._finish(job['job_id'], worker_id, 'completed', result=result)
+            logger.info(f'任务执行完成，任务ID: {job["job_id"]}')
+        except Exception as e:
+            logger.error(f'任务执行失败，任务ID: {job["job_id"]}: {str(e)}')
+            self._finish(job['job_id'], worker_id, 'failed', error=str(e))
+        finally:
+            request_id_var.reset(token)
+        return True
+
+    def _work(self, worker_id):
+        while not self._stopping.is_set():
+            try:
+                if self.run_once(worker_id):
+                    continue
+                self._maybe_prune()
+            except Exception as e:
+                logger.error(f'任务worker异常: {str(e)}')
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self, num_workers):
+        """启动本地worker线程"""
+        for i in range(num_workers):
+            worker_id = f'{self._worker_prefix}-{i}'
+            thread = threading.Thread(target=self._work, args=(worker_id,), name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._workers.append(thread)
+        logger.info(f'任务队列已启动 {num_workers} 个worker')
+
+    def stop(self, timeout=None):
+        """停止worker线程（正在执行的任务会执行完毕）"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._workers:
+            thread.join(timeout)
+        self._workers = []
@@ -0,0 +1,103 @@
+import json
+import logging
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# JSON代码块的起始标记
+JSON_FENCE = '```json'
+
+
+class IncrementalErrorExtractor:
+    """增量式错误提取器：逐段喂入模型输出，错误对象一闭合就立即解析返回
+
+    支持两种结构：顶层即错误列表 ``[{...}, {...}]``，或顶层对象中的 ``"errors": [{...}]``。
+    只跟踪括号深度、字符串和转义状态，不会重复扫描已处理的文本。
+    """
+
+    def __init__(self):
+        # 尚未找到JSON起始标记前的文本（只保留可能是标记前缀的尾部）
+        self._pending = ''
+        # JSON块开始后收到的文本
+        self._text = ''
+        self._started = False
+        self._finished = False
+        self._in_string = False
+        self._escape = False
+        self._string_chars = []
+        self._last_string = None
+        self._pending_key = None
+        # 容器栈：每项为 (类型, 所属键名, 起始位置, 是否为错误列表)
+        self._stack = []
+        self.errors = []
+
+    def feed(self, chunk):
+        """喂入一段新文本，返回本次新闭合的错误对象列表"""
+        if self._finished or not chunk:
+            return []
+        if not self._started:
+            text = self._pending + chunk
+            index = text.find(JSON_FENCE)
+            if index < 0:
+                # 保留可能被截断的起始标记
+                self._pending = text[-(len(JSON_FENCE) - 1):]
+                return []
+            self._started = True
+            self._pending = ''
+            chunk = text[index + len(JSON_FENCE):]
+
+        start = len(self._text)
+        self._text += chunk
+        completed = []
+        for position in range(start, len(self._text)):
+            char = self._text[position]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    self._last_string = ''.join(self._string_chars)
+                else:
+                    self._string_chars.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                self._string_chars = []
+            elif char == ':':
+                self._pending_key = self._last_string
+            elif char == ',':
+                self._pending_key = None
+            elif char in '[{':
+                key = self._pending_key if self._stack and self._stack[-1][0] == '{' else None
+                is_error_list = char == '[' and (not self._stack or (len(self._stack) == 1 and key == 'errors'))
+                self._stack.append((char, key, position, is_error_list))
+                self._pending_key = None
+            elif char in ']}':
+                if not self._stack:
+                    continue
+                _, _, begin, _ = self._stack.pop()
+                if char == '}' and self._stack and self._stack[-1][3]:
+                    error = self._decode(self._text[begin:position + 1])
+                    if error is not None:
+                        completed.append(error)
+                if not self._stack:
+                    self._finished = True
+                    break
+            elif char == '`' and not self._stack:
+                # 代码块结束仍未出现JSON结构
+                self._finished = True
+                break
+
+        self.errors.extend(completed)
+        return completed
+
+    def _decode(self, text):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError as e:
+            logger.debug('流式错误对象解析失败: %s', e)
+            return None
+        return value if isinstance(value, dict) else None
@@ -0,0 +1,301 @@
+import os
+import re
+import logging
+
+from services import metrics
+from services.span_aligner import find_spans
+from services.spelling_index import SpellingIndex
+
+logger = logging.getLogger(__name__)
+
+# 单词（可带撇号缩写，如 don't、I'm）
+_WORD_RE = re.compile(r"[A-Za-z]+(?:'[A-Za-z]+)?")
+_SPACES_RE = re.compile(r'[ \t]+')
+_SENTENCE_END = '.!?'
+
+# 不会被当作句首的缩写
+ABBREVIATIONS = {'e.g', 'i.e', 'etc', 'vs', 'mr', 'mrs', 'ms', 'dr', 'st', 'no'}
+
+# 可以合法重复的单词（"had had"、"that that"）
+REPEATABLE_WORDS = {'had', 'that'}
+
+# 以元音字母开头但读辅音的前缀，以及以h开头但读元音的单词
+CONSONANT_SOUND_PREFIXES = ('uni', 'use', 'usu', 'uti', 'ure', 'uro', 'eu', 'ewe', 'one', 'once', 'ufo', 'ukr')
+VOWEL_SOUND_PREFIXES = ('hour', 'honest', 'honor', 'honour', 'heir')
+
+# 主语与be动词、助动词的搭配：主语 -> {错误形式: 正确形式}
+AGREEMENT_FIXES = {
+    'i': {'is': 'am', 'are': 'am', 'has': 'have', 'does': 'do', "doesn't": "don't"},
+    'you': {'is': 'are', 'am': 'are', 'was': 'were', 'has': 'have', 'does': 'do', "doesn't": "don't"},
+    'we': {'is': 'are', 'am': 'are', 'was': 'were', 'has': 'have', 'does': 'do', "doesn't": "don't"},
+    'they': {'is': 'are', 'am': 'are', 'was': 'were', 'has': 'have', 'does': 'do', "doesn't": "don't"},
+    'he': {'are': 'is', 'am': 'is', 'have': 'has', 'do': 'does', "don't": "doesn't"},
+    'she': {'are': 'is', 'am': 'is', 'have': 'has', 'do': 'does', "don't": "doesn't"},
+    'it': {'are': 'is', 'am': 'is', 'have': 'has', 'do': 'does', "don't": "doesn't"},
+}
+# "if he were"、"I wish I were" 等虚拟语气中的were是正确的
+SUBJUNCTIVE_MARKERS = {'if', 'wish', 'though', 'as'}
+# 出现在主语之前时，主语后面的动词用原形（疑问句、使役动词、感官动词）
+BARE_INFINITIVE_MARKERS = {
+    'do', 'does', 'did', 'can', 'could', 'will', 'would', 'shall', 'should', 'may', 'might', 'must',
+    'let', 'lets', 'make', 'makes', 'made', 'help', 'helps', 'helped', 'see', 'saw', 'watch', 'watched',
+    'hear', 'heard', 'have', 'has', 'had', 'why', 'not',
+}
+
+# 常用动词原形，用于检查第三人称单数
+COMMON_VERBS = (
+    'go do like want play make get think know say see come take give look use find tell ask work feel try '
+    'leave call need love live study watch help read write eat drink walk run swim speak listen learn teach '
+    'buy enjoy hope believe visit stay start finish open close clean cook wash sleep sit stand bring hate '
+    'prefer become seem mean keep begin show hear put turn move pay meet understand follow stop spend grow '
+    'win remember wait send build carry fly cry worry fix miss dance sing draw drive ride travel practice '
+    'wear catch feed choose laugh smile talk change'
+).split()
+# 不规则动词被套用 -ed 规则的常见错误形式
+IRREGULAR_PAST = {
+    'goed': 'went', 'swimmed': 'swam', 'buyed': 'bought', 'eated': 'ate', 'runned': 'ran', 'writed': 'wrote',
+    'teached': 'taught', 'thinked': 'thought', 'catched': 'caught', 'bringed': 'brought', 'taked': 'took',
+    'maked': 'made', 'gived': 'gave', 'comed': 'came', 'sayed': 'said', 'drinked': 'drank', 'speaked': 'spoke',
+    'sleeped': 'slept', 'feeled': 'felt', 'leaved': 'left', 'meeted': 'met', 'sitted': 'sat', 'standed': 'stood',
+    'understanded': 'understood', 'winned': 'won', 'getted': 'got', 'knowed': 'knew', 'growed': 'grew',
+    'throwed': 'threw', 'drived': 'drove', 'rided': 'rode', 'falled': 'fell', 'hurted': 'hurt', 'cutted': 'cut',
+    'hitted': 'hit', 'choosed': 'chose', 'forgeted': 'forgot', 'becomed': 'became', 'begined': 'began',
+    'breaked': 'broke', 'builded': 'built', 'feeded': 'fed', 'finded': 'found', 'keeped': 'kept',
+    'losed': 'lost', 'selled': 'sold', 'sended': 'sent', 'spended': 'spent', 'telled': 'told', 'weared': 'wore',
+    'drawed': 'drew', 'flyed': 'flew', 'readed': 'read', 'heared': 'heard',
+}
+
+# 本地检查的错误类型
+SPELLING = '拼写错误'
+VERB_FORM = '动词形式'
+AGREEMENT = '主谓一致'
+ARTICLE = '冠词'
+CAPITALIZATION = '大小写'
+REPEATED_WORD = '重复单词'
+
+
+def third_person(verb):
+    """动词原形 -> 第三人称单数"""
+    if verb == 'have':
+        return 'has'
+    if verb.endswith(('s', 'sh', 'ch', 'x', 'z', 'o')):
+        return verb + 'es'
+    if verb.endswith('y') and verb[-2:-1] not in 'aeiou':
+        return verb[:-1] + 'ies'
+    return verb + 's'
+
+
+THIRD_PERSON = {verb: third_person(verb) for verb in COMMON_VERBS}
+BASE_FORM = {form: verb for verb, form in THIRD_PERSON.items()}
+
+
+def _match_case(replacement, original):
+    """按原文的大小写输出替换文本"""
+    if original.isupper() and len(original) > 1:
+        return replacement.upper()
+    if original[:1].isupper():
+        return replacement[:1].upper() + replacement[1:]
+    return replacement
+
+
+def _error(text, start, end, corrected, error_type, explanation):
+    return {
+        'original': text[start:end],
+        'corrected': corrected,
+        'error_type': error_type,
+        'explanation': explanation,
+        'start': start,
+        'end': end,
+        'source': 'local',
+    }
+
+
+class LocalChecker:
+    """本地快速检查：拼写（词典索引）和常见的ESL语法错误（规则），毫秒级返回
+
+    结果与星火返回的详细错误合并；星火不可用时作为降级结果。只报告把握较大的错误：
+    词典中没有且编辑距离1内有常用词的单词、大写开头的专有名词和缩写不检查拼写。
+    """
+
+    def __init__(self, spelling=None):
+        self.spelling = spelling or SpellingIndex(index_path=os.getenv('LOCAL_CHECKER_INDEX') or None)
+
+    @classmethod
+    def from_env(cls):
+        """根据环境变量创建检查器，LOCAL_CHECKER=0 时返回None（关闭本地检查）"""
+        if os.getenv('LOCAL_CHECKER', '1') == '0':
+            return None
+        return cls()
+
+    def check(self, text):
+        """检查作文，返回按位置排序的详细错误列表（带 start/end 和 source='local'）"""
+        with metrics.timed('local_check'):
+            tokens = [(match.start(), match.end(), match.group()) for match in _WORD_RE.finditer(text)]
+            errors = []
+            for index, token in enumerate(tokens):
+                previous = tokens[index - 1] if index else None
+                following = tokens[index + 1] if index + 1 < len(tokens) else None
+                error = (self._repeated(text, previous, token, following)
+                         or self._article(text, previous, token, following)
+                         or self._agreement(text, previous, token, following)
+                         or self._capitalization(text, previous, token)
+                         or self._spelling(text, previous, token))
+                if error is not None:
+                    errors.append(error)
+            return self._non_overlapping(errors)
+
+    def _adjacent(self, text, first, second):
+        """两个单词之间只有空格"""
+        return second is not None and not _SPACES_RE.sub('', text[first[1]:second[0]]) and first[1] < second[0]
+
+    def _capitalized(self, text, previous, token):
+        """单词本身需要改为大写时（句首、代词I）返回大写后的形式，否则返回原词"""
+        error = self._capitalization(text, previous, token)
+        return error['corrected'] if error is not None else token[2]
+
+    def _repeated(self, text, previous, token, following):
+        start, end, word = token
+        if (self._adjacent(text, token, following) and word.lower() == following[2].lower()
+                and word.lower() not in REPEATABLE_WORDS):
+            return _error(text, start, following[1], self._capitalized(text, previous, token), REPEATED_WORD,
+                          f'单词 "{word}" 重复')
+        return None
+
+    def _article(self, text, previous, token, following):
+        start, end, word = token
+        if word.lower() not in ('a', 'an') or not self._adjacent(text, token, following):
+            return None
+        next_word = following[2]
+        if next_word.isupper() and len(next_word) > 1:
+            # 缩写按字母读音，规则无法判断
+            return None
+        lower = next_word.lower()
+        vowel_sound = ((lower[0] in 'aeiou' and not lower.startswith(CONSONANT_SOUND_PREFIXES))
+                       or lower.startswith(VOWEL_SOUND_PREFIXES))
+        word = self._capitalized(text, previous, token)
+        if word.lower() == 'a' and vowel_sound:
+            corrected = _match_case('an', word)
+        elif word.lower() == 'an' and not vowel_sound:
+            corrected = _match_case('a', word)
+        else:
+            return None
+        return _error(text, start, following[1], f'{corrected} {next_word}', ARTICLE,
+                      f'"{next_word}" 以{"元音" if vowel_sound else "辅音"}音开头，冠词应使用 "{corrected}"')
+
+    def _agreement(self, text, previous, token, following):
+        start, end, word = token
+        subject = word.lower()
+        if subject not in AGREEMENT_FIXES or not self._adjacent(text, token, following):
+            return None
+        if previous is not None and previous[2].lower() in BARE_INFINITIVE_MARKERS:
+            return None
+        verb = following[2]
+        lower = verb.lower()
+        corrected = AGREEMENT_FIXES[subject].get(lower)
+        if corrected is None and lower == 'were' and subject in ('i', 'he', 'she', 'it'):
+            if previous is None or previous[2].lower() not in SUBJUNCTIVE_MARKERS:
+                corrected = 'was'
+        if corrected is None and subject in ('he', 'she') and lower in THIRD_PERSON:
+            corrected = THIRD_PERSON[lower]
+        if corrected is None and subject in ('i', 'you', 'we', 'they') and lower in BASE_FORM:
+            corrected = BASE_FORM[lower]
+        if corrected is None:
+            return None
+        return _error(text, start, following[1],
+                      f'{self._capitalized(text, previous, token)} {_match_case(corrected, verb)}', AGREEMENT,
+                      f'主语 "{word}" 后的动词应为 "{corrected}"')
+
+    def _capitalization(self, text, previous, token):
+        start, end, word = token
+        if word == 'i' or word.startswith("i'"):
+            return _error(text, start, end, 'I' + word[1:], CAPITALIZATION, '代词 "I" 必须大写')
+        if not word[0].islower():
+            return None
+        before = text[:start].rstrip(' \t')
+        if before and before[-1] not in _SENTENCE_END and before[-1] != '\n':
+            return None
+        if before and before[-1] in _SENTENCE_END:
+            # "e.g. example" 之类的缩写后不是句首
+            if previous is not None and text[previous[0]:start].rstrip(' \t.!?').lower() in ABBREVIATIONS:
+                return None
+            if before.endswith('...'):
+                return None
+        return _error(text, start, end, word[0].upper() + word[1:], CAPITALIZATION, '句首单词的首字母应大写')
+
+    def _spelling(self, text, previous, token):
+        start, end, word = token
+        lower = word.lower()
+        if lower in IRREGULAR_PAST and lower not in self.spelling:
+            corrected = _match_case(IRREGULAR_PAST[lower], word)
+            return _error(text, start, end, corrected, VERB_FORM, f'不规则动词的过去式应为 "{corrected}"')
+        # 很短的单词、缩写、专有名词（非句首的大写单词）不检查拼写
+        if len(word) < 3 or "'" in word or word.isupper() or (word[0].isupper() and previous is not None):
+            return None
+        if lower in self.spelling:
+            return None
+        suggestion = self.spelling.suggest(lower)
+        if suggestion is None:
+            return None
+        corrected = _match_case(suggestion, word)
+        return _error(text, start, end, corrected, SPELLING, f'"{word}" 可能拼写错误，应为 "{corrected}"')
+
+    def _non_overlapping(self, errors):
+        """同一位置只保留最先检测到的错误"""
+        kept = []
+        last_end = -1
+        for error in sorted(errors, key=lambda error: error['start']):
+            if error['start'] >= last_end:
+                kept.append(error)
+                last_end = error['end']
+        return kept
+
+
+def apply_corrections(text, errors):
+    """按错误的位置把修改应用到原文，返回修改后的文本（错误需带start/end且互不重叠）"""
+    parts = []
+    cursor = 0
+    for error in sorted(errors, key=lambda error: error['start']):
+        if error['start'] < cursor:
+            continue
+        parts.append(text[cursor:error['start']])
+        parts.append(error['corrected'])
+        cursor = error['end']
+    parts.append(text[cursor:])
+    return ''.join(parts)
+
+
+def merge_local_errors(text, result, local_errors):
+    """把本地检查的错误合并到星火的批改结果中，返回新的结果
+
+    与星火错误位置重叠（或原文相同）的本地错误被丢弃；合并后按在原文中的位置排序，无法定位的错误排在最后。
+    """
+    llm_errors = [error for error in result.get('detailed_errors') or [] if isinstance(error, dict)]
+    hints = [error.get('start') if isinstance(error.get('start'), int) else None for error in llm_errors]
+    spans = find_spans(text, [error.get('original') or '' for error in llm_errors], hints=hints)
+    starts = [span[0] if span else None for span in spans]
+    covered = [span for span in spans if span is not None]
+    originals = {(error.get('original') or '').strip().lower() for error in llm_errors}
+
+    merged = list(zip(starts, llm_errors))
+    for error in local_errors:
+        start, end = error['start'], error['end']
+        if error['original'].lower() in originals or any(start < right and left < end for left, right in covered):
+            continue
+        merged.append((start, error))
+    merged.sort(key=lambda pair: pair[0] if pair[0] is not None else len(text))
+    return dict(result, detailed_errors=[error for _, error in merged])
+
+
+def degraded_result(text, local_errors):
+    """星火不可用时的降级结果：只包含本地检查发现的错误，修改后文本为应用这些修改后的原文"""
+    counts = {}
+    for error in local_errors:
+        counts[error['error_type']] = counts.get(error['error_type'], 0) + 1
+    return {
+        'feedback': '批改服务暂时不可用，以下为本地检查结果（仅包括拼写、动词形式、主谓一致、冠词、大小写和重复单词），请稍后重新提交获取完整批改。',
+        'suggestions': [],
+        'grammar_errors': [f'{error_type}：{count} 处' for error_type, count in counts.items()],
+        'detailed_errors': local_errors,
+        'corrected_text': apply_corrections(text, local_errors),
+        'degraded': True,
+    }
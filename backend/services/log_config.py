@@ -0,0 +1,107 @@
+import os
+import json
+import uuid
+import queue
+import atexit
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s'
+
+# 日志中单个载荷（响应帧、OCR结果等）保留的最大字符数
+DEFAULT_PAYLOAD_LIMIT = 500
+
+# 当前请求的关联ID，不在请求上下文中时为 '-'
+request_id_var = contextvars.ContextVar('request_id', default='-')
+
+_payload_limit = DEFAULT_PAYLOAD_LIMIT
+_listener = None
+
+
+class RequestIdFilter(logging.Filter):
+    """为日志记录附加当前请求的关联ID"""
+
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        return True
+
+
+class Payload:
+    """延迟序列化的日志载荷：只有日志真正输出时才执行json.dumps，并截断到配置的长度
+
+    用法: logger.debug('收到响应: %s', Payload(response))
+    """
+
+    __slots__ = ('value', 'limit')
+
+    def __init__(self, value, limit=None):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        value = self.value
+        if not isinstance(value, str):
+            try:
+                value = json.dumps(value, ensure_ascii=False)
+            except (TypeError, ValueError):
+                value = repr(value)
+        return truncate(value, self.limit)
+
+
+def truncate(text, limit=None):
+    """截断过长的文本，并注明原始长度"""
+    limit = _payload_limit if limit is None else limit
+    if limit <= 0 or len(text) <= limit:
+        return text
+    return f'{text[:limit]}...(共{len(text)}字符)'
+
+
+def new_request_id(incoming=None):
+    """设置当前请求的关联ID：优先沿用客户端传入的ID，否则生成新的ID"""
+    request_id = (incoming or '').strip()[:64] or uuid.uuid4().hex[:12]
+    request_id_var.set(request_id)
+    return request_id
+
+
+def configure_logging(level=None):
+    """配置根日志器：请求线程只把日志记录放入队列，由后台线程负责格式化输出
+
+    日志级别取 level 参数或环境变量 LOG_LEVEL（默认INFO），
+    载荷截断长度取环境变量 LOG_PAYLOAD_LIMIT（默认500，0表示不截断）。
+    """
+    global _payload_limit, _listener
+    level = (level or os.getenv('LOG_LEVEL') or 'INFO').upper()
+    _payload_limit = int(os.getenv('LOG_PAYLOAD_LIMIT', DEFAULT_PAYLOAD_LIMIT))
+
+    _stop_listener()
+
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = QueueHandler(log_queue)
+    # 关联ID必须在产生日志的线程中读取
+    queue_handler.addFilter(RequestIdFilter())
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(level)
+    # 第三方库的调试日志（握手、连接池）量大且对排查批改问题帮助不大
+    for name in ('websocket', 'websockets', 'urllib3', 'PIL'):
+        logging.getLogger(name).setLevel(max(logging.INFO, root.level))
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def _stop_listener():
+    """输出队列中剩余的日志并停止后台线程"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
@@ -0,0 +1,80 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# 各阶段耗时的分桶（秒）：签名、解析等在毫秒级，模型生成可能长达数分钟
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                 1, 2.5, 5, 10, 20, 30, 60, 120, 300)
+
+# 批改流程各阶段的耗时：
+# sign             构建签名URL（_build_ws_url）
+# connect          建立WebSocket连接（握手）
+# first_frame      发送请求到收到第一帧
+# last_frame       发送请求到收到最终帧
+# parse            解析响应（_process_response）
+# process_word     解析Word文档
+# process_image    图片预处理与OCR
+# preprocess_image 图片预处理（旋转、灰度、缩放、JPEG编码）
+# ocr              单页OCR请求（含重试）
+# history_write    写入历史记录存储
+# local_check      本地拼写和语法检查
+STAGE_SECONDS = Histogram(
+    'essay_checker_stage_seconds', '批改流程各阶段耗时（秒）', ['stage'], buckets=STAGE_BUCKETS
+)
+
+HTTP_REQUEST_SECONDS = Histogram(
+    'essay_checker_http_request_seconds', 'HTTP请求处理耗时（秒）', ['endpoint', 'status'], buckets=STAGE_BUCKETS
+)
+
+HTTP_IN_FLIGHT = Gauge(
+    'essay_checker_http_requests_in_flight', '正在处理的HTTP请求数', ['endpoint'], multiprocess_mode='livesum'
+)
+
+SPARK_SESSIONS_IN_FLIGHT = Gauge(
+    'essay_checker_spark_sessions_in_flight', '正在进行的星火WebSocket会话数', multiprocess_mode='livesum'
+)
+
+# 星火返回的非0错误码；协议之外的失败记为 timeout / connection
+SPARK_ERRORS = Counter(
+    'essay_checker_spark_errors_total', '星火API错误次数', ['code']
+)
+
+# 与正在进行的相同批改合并的请求数：thread 为同一进程内等待，process 为等待其他worker进程
+COALESCED_REQUESTS = Counter(
+    'essay_checker_coalesced_requests_total', '合并到进行中批改的请求数', ['scope']
+)
+
+# 送入OCR前后的图片字节数，二者之差即预处理节省的上传量
+OCR_IMAGE_BYTES = Counter(
+    'essay_checker_ocr_image_bytes', 'OCR图片字节数', ['stage']
+)
+
+
+@contextmanager
+def timed(stage):
+    """记录代码块的耗时（无论是否抛出异常）"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - start)
+
+
+def observe(stage, seconds):
+    """记录已测得的阶段耗时"""
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+
+def render_metrics():
+    """生成 /metrics 的响应内容，返回 (内容, Content-Type)
+
+    设置了 PROMETHEUS_MULTIPROC_DIR 时（多个gunicorn worker进程），汇总所有进程的指标。
+    """
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
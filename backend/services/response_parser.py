@@ -0,0 +1,183 @@
+import re
+import json
+import logging
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 一次扫描即可定位的所有标记：JSON块（整体跳过，块内文字不会被当作小节标题）和各小节标题
+_MARKER_RE = re.compile(
+    r'(?P<json>```json\s*(?P<json_body>[\s\S]*?)\s*```)'
+    r'|(?P<suggestions>改进建议[:：])'
+    r'|(?P<grammar>语法错误[:：])'
+    r'|(?P<details>详细错误分析[:：])'
+    r'|(?P<corrected>修改后的(?:完整)?文本[:：])'
+    r'|(?P<revised>修正后[:：])'
+    r'|(?P<score>评分)'
+    r'|(?P<numbered>\d+\.)'
+    r'|(?P<blank>\n\n)'
+)
+
+# 各小节在遇到哪些后续标记时结束
+_SECTION_TERMINATORS = {
+    'suggestions': ('details', 'corrected'),
+    'grammar': ('details', 'corrected'),
+    'details': ('corrected',),
+    'corrected': ('numbered', 'details', 'score', 'suggestions'),
+    'revised': ('blank', 'score', 'suggestions'),
+}
+
+# 修改后文本中残留的Markdown代码块
+_FENCE_RE = re.compile(r'```(?:json)?\s*[\s\S]*?\s*```')
+# 兜底：形如 "原文 → 修改" 的错误对，按行查找（最后一行没有换行符时不计入）
+_LINE_BREAK_RE = re.compile(r'[\n\r]')
+
+# 详细错误分析小节中的字段前缀
+_DETAIL_FIELDS = (('原始:', 'original'), ('修改:', 'corrected'), ('类型:', 'error_type'), ('解释:', 'explanation'))
+
+DEFAULT_SUGGESTIONS = ['增强论点的说服力', '改善句子结构多样性', '增加具体例子']
+DEFAULT_GRAMMAR_ERRORS = ['时态使用不当', '主谓一致问题']
+
+
+class ResponseParser:
+    """星火响应解析器：合并各帧文本后，只扫描一遍即可切分出所有小节并生成结果"""
+
+    def extract_text(self, responses):
+        """合并所有响应帧中的文本"""
+        parts = []
+        for response in responses:
+            choices = response.get('payload', {}).get('choices', {})
+            text = choices.get('text', []) if isinstance(choices, dict) else choices
+            for item in text:
+                content = item.get('content', '') if isinstance(item, dict) else ''
+                if content:
+                    parts.append(content)
+        if parts:
+            return ''.join(parts)
+
+        # 没有提取到内容时，尝试从payload本身或message中提取
+        for response in responses:
+            payload = response.get('payload', {})
+            if isinstance(payload, str):
+                parts.append(payload)
+                continue
+            message = payload.get('message', {})
+            items = message.get('text', []) if isinstance(message, dict) else message
+            if isinstance(items, list):
+                for item in items:
+                    if isinstance(item, dict) and item.get('content'):
+                        parts.append(item['content'])
+        return ''.join(parts)
+
+    def parse(self, responses):
+        """解析响应帧列表，返回批改结果"""
+        full_response = self.extract_text(responses)
+        logger.debug('响应帧数量: %d，合并后的文本长度: %d', len(responses), len(full_response))
+        return self.parse_text(full_response)
+
+    def parse_text(self, full_response):
+        """解析模型输出的完整文本，返回批改结果"""
+        json_body, sections = self._scan(full_response)
+
+        json_content = None
+        if json_body is not None:
+            try:
+                json_content = json.loads(json_body)
+            except json.JSONDecodeError as e:
+                logger.warning('JSON块解析失败: %s，使用文本解析方式', e)
+
+        # 标准格式：JSON对象中包含errors字段
+        if isinstance(json_content, dict) and 'errors' in json_content:
+            return {
+                'feedback': '',
+                'suggestions': json_content.get('improvement_suggestions', []),
+                'grammar_errors': [],
+                'detailed_errors': json_content.get('errors', []),
+                'corrected_text': json_content.get('corrected_text', '')
+            }
+
+        return {
+            'feedback': full_response,
+            'suggestions': self._lines(sections.get('suggestions'), 3) or list(DEFAULT_SUGGESTIONS),
+            'grammar_errors': self._lines(sections.get('grammar'), 3) or list(DEFAULT_GRAMMAR_ERRORS),
+            'detailed_errors': self._detailed_errors(json_content, sections.get('details'), full_response),
+            'corrected_text': self._corrected_text(json_content, sections)
+        }
+
+    def _scan(self, text):
+        """单次扫描文本，返回第一个JSON块内容和各小节（首次出现）的文本"""
+        json_body = None
+        open_sections = {}
+        sections = {}
+        for match in _MARKER_RE.finditer(text):
+            kind = match.lastgroup
+            if kind == 'json_body':
+                kind = 'json'
+            # 结束所有以该标记为终止符的小节
+            for name in list(open_sections):
+                if kind in _SECTION_TERMINATORS[name]:
+                    sections[name] = text[open_sections.pop(name):match.start()]
+            if kind == 'json':
+                if json_body is None:
+                    json_body = match.group('json_body')
+            elif kind in _SECTION_TERMINATORS and kind not in sections and kind not in open_sections:
+                open_sections[kind] = match.end()
+        for name, start in open_sections.items():
+            sections[name] = text[start:]
+        return json_body, sections
+
+    def _lines(self, section, limit):
+        if not section:
+            return []
+        return [line.strip() for line in section.split('\n') if line.strip()][:limit]
+
+    def _detailed_errors(self, json_content, details, full_response):
+        # JSON格式的错误列表
+        if isinstance(json_content, list):
+            return json_content[:5]
+        if isinstance(json_content, dict):
+            if 'errors' not in json_content:
+                return [json_content]
+
+        # 非JSON格式的详细错误分析
+        if details:
+            error_items = []
+            current_error = {}
+            for line in details.strip().split('\n'):
+                line = line.strip()
+                for prefix, key in _DETAIL_FIELDS:
+                    if prefix in line:
+                        current_error[key] = line.split(prefix, 1)[1].strip()
+                        break
+                if len(current_error) == len(_DETAIL_FIELDS):
+                    error_items.append(current_error)
+                    current_error = {}
+            if error_items:
+                return error_items[:5]
+
+        # 兜底：箭头形式的错误对（只在以上格式都不存在时才扫描）
+        error_items = []
+        if '→' in full_response:
+            for line in _LINE_BREAK_RE.split(full_response)[:-1]:
+                if '→' in line:
+                    original, corrected = line.split('→', 1)
+                    error_items.append({
+                        'original': original.strip(),
+                        'corrected': corrected.strip(),
+                        'error_type': '语法错误',
+                        'explanation': '需要修改的语法问题'
+                    })
+                    if len(error_items) == 5:
+                        break
+        return error_items
+
+    def _corrected_text(self, json_content, sections):
+        for name in ('corrected', 'revised'):
+            section = sections.get(name)
+            if section:
+                corrected_text = _FENCE_RE.sub('', section).strip()
+                if corrected_text:
+                    return corrected_text
+        if isinstance(json_content, dict) and json_content.get('corrected_text'):
+            return json_content['corrected_text']
+        return ''
@@ -0,0 +1,135 @@
+import bisect
+import difflib
+
+from services.essay_chunker import (
+    MAX_MERGED_GRAMMAR_ERRORS, MAX_MERGED_SUGGESTIONS, dedupe, locate_errors, paragraph_spans
+)
+
+# 修改段落前后附带的上下文长度（字符）
+CONTEXT_CHARS = 200
+# 修改的字符数超过全文的该比例时，整篇重新批改
+MAX_CHANGED_RATIO = 0.5
+# 上一版错误中与位置相关的字段，沿用时按新版重新计算
+_POSITION_FIELDS = ('start', 'end', 'segment')
+
+
+def diff_revision(old_text, old_result, new_text):
+    """按段落对比新旧两版作文，返回增量批改计划；无法增量批改时返回None
+
+    计划为 {'spans': 新版各段落位置, 'kept': {新段落序号: (上一版修改后的段落, [(错误, 段内位置)])},
+    'blocks': [(起始段落, 结束段落)], 'previous': 上一版结果}，blocks 为需要重新批改的连续段落。
+    上一版的修改后文本无法与原文按段落一一对应、或修改过多时返回None；上一版是降级结果或有片段（修改块）
+    批改失败时同样返回None，因为这些段落没有经过星火批改，不能沿用。
+    只沿用上一版中星火给出的错误：本地检查的错误在返回前会按新版重新合并。
+    """
+    if not isinstance(old_result, dict) or not new_text.strip():
+        return None
+    if (old_result.get('degraded') or old_result.get('failed_segments')
+            or (old_result.get('incremental') or {}).get('failed_blocks')):
+        return None
+    old_spans = paragraph_spans(old_text)
+    new_spans = paragraph_spans(new_text)
+    corrected = old_result.get('corrected_text') or ''
+    corrected_spans = paragraph_spans(corrected)
+    if not old_spans or len(corrected_spans) != len(old_spans):
+        return None
+
+    # 上一版的错误按段落归类，记录在段落内的相对位置；无法定位的错误不再沿用
+    errors = [{key: value for key, value in error.items() if key not in _POSITION_FIELDS}
+              for error in old_result.get('detailed_errors') or []
+              if isinstance(error, dict) and error.get('source') != 'local']
+    starts = [start for start, _ in old_spans]
+    old_errors = [[] for _ in old_spans]
+    for error, span in zip(errors, locate_errors(old_text, errors)):
+        if span is not None:
+            index = bisect.bisect_right(starts, span[0]) - 1
+            old_errors[index].append((error, (span[0] - starts[index], span[1] - starts[index])))
+
+    matcher = difflib.SequenceMatcher(
+        None, [old_text[start:end] for start, end in old_spans], [new_text[start:end] for start, end in new_spans],
+        autojunk=False
+    )
+    kept = {}
+    blocks = []
+    changed = 0
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            for step in range(i2 - i1):
+                start, end = corrected_spans[i1 + step]
+                kept[j1 + step] = (corrected[start:end], old_errors[i1 + step])
+        elif j2 > j1:
+            # 只删除段落时新版没有需要批改的内容
+            blocks.append((j1, j2))
+            changed += new_spans[j2 - 1][1] - new_spans[j1][0]
+    if changed > MAX_CHANGED_RATIO * len(new_text):
+        return None
+    return {'spans': new_spans, 'kept': kept, 'blocks': blocks, 'previous': old_result}
+
+
+def block_context(text, spans, j1, j2):
+    """返回段落块 [j1, j2) 的 (start, end, 上文, 下文)，上下文取相邻段落靠近该块的部分"""
+    before = text[spans[j1 - 1][0]:spans[j1 - 1][1]][-CONTEXT_CHARS:] if j1 > 0 else ''
+    after = text[spans[j2][0]:spans[j2][1]][:CONTEXT_CHARS] if j2 < len(spans) else ''
+    return spans[j1][0], spans[j2 - 1][1], before, after
+
+
+def splice_results(text, plan, block_results):
+    """把重新批改的段落块结果与沿用的段落结果按原文顺序合并
+
+    block_results 与 plan['blocks'] 一一对应，批改失败的为None（该块按原文保留）。
+    错误的 start/end 为在新版作文中的位置；模型对上下文给出的错误（只出现在块外）被丢弃。
+    """
+    spans = plan['spans']
+    previous = plan['previous']
+    block_at = {j1: (j2, result) for (j1, j2), result in zip(plan['blocks'], block_results)}
+    detailed_errors = []
+    corrected_parts = []
+    feedback = []
+    suggestions = []
+    grammar_errors = []
+
+    j = 0
+    previous_end = None
+    while j < len(spans):
+        start = spans[j][0]
+        # 段落之间保留新版原文中的分隔符
+        if previous_end is not None:
+            corrected_parts.append(text[previous_end:start])
+        if j not in block_at:
+            corrected, errors = plan['kept'][j]
+            corrected_parts.append(corrected)
+            for error, relative in errors:
+                detailed_errors.append(dict(error, start=start + relative[0], end=start + relative[1]))
+            previous_end = spans[j][1]
+            j += 1
+            continue
+
+        j2, result = block_at[j]
+        end = spans[j2 - 1][1]
+        if result is None:
+            corrected_parts.append(text[start:end])
+        else:
+            corrected_parts.append((result.get('corrected_text') or text[start:end]).strip())
+            if result.get('feedback'):
+                feedback.append(result['feedback'])
+            suggestions.extend(result.get('suggestions') or [])
+            grammar_errors.extend(result.get('grammar_errors') or [])
+            errors = [error for error in result.get('detailed_errors') or [] if isinstance(error, dict)]
+            located = []
+            for error, span in zip(errors, locate_errors(text, errors, start, end)):
+                if span is None and error.get('original') and error['original'] in text:
+                    continue
+                located.append(dict(error, start=span[0] if span else None, end=span[1] if span else None))
+            located.sort(key=lambda error: error['start'] if error['start'] is not None else end)
+            detailed_errors.extend(located)
+        previous_end = end
+        j = j2
+
+    return {
+        'feedback': '\n\n'.join(feedback) or previous.get('feedback', ''),
+        'suggestions': dedupe(suggestions + list(previous.get('suggestions') or []), MAX_MERGED_SUGGESTIONS),
+        'grammar_errors': dedupe(grammar_errors + list(previous.get('grammar_errors') or []),
+                                 MAX_MERGED_GRAMMAR_ERRORS),
+        'detailed_errors': detailed_errors,
+        'corrected_text': ''.join(corrected_parts),
+    }
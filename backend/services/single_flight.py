@@ -0,0 +1,140 @@
+import os
+import copy
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+from services import metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows：没有fcntl时只在进程内合并
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# 跨进程锁文件的保留时间（秒），超过后在下次清理时删除
+LOCK_FILE_TTL = 3600
+# 每执行多少次批改清理一次过期的锁文件
+CLEANUP_INTERVAL = 100
+
+
+class _Call:
+    """一次正在进行的批改：领头的线程执行，其余线程等待其结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并相同键的并发调用：同一时刻只有一个调用真正执行，其余调用等待并共享它的结果
+
+    进程内按键记录正在进行的调用，后到的线程直接等待。设置 lock_dir 时，领头的线程还会在执行前
+    对 lock_dir 下以键命名的锁文件加文件锁（fcntl.flock）：另一个gunicorn worker正在批改同一篇作文时，
+    本进程等它完成；调用方应在拿到锁后先查询共享的磁盘缓存（见 is_shared），命中时不再重复批改。
+    执行失败时异常同样传给所有等待的调用方。
+    """
+
+    def __init__(self, lock_dir=None):
+        self.lock_dir = lock_dir if fcntl is not None else None
+        if lock_dir and fcntl is None:
+            logger.warning('当前平台不支持fcntl，只在进程内合并相同的批改请求')
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._runs = 0
+
+    @classmethod
+    def from_env(cls, cache=None):
+        """根据环境变量创建，SINGLE_FLIGHT=0 时返回None（不合并）
+
+        SINGLE_FLIGHT_LOCK_DIR 只在 cache 使用磁盘缓存（GRADING_CACHE_PATH）时生效：没有进程间共享的缓存时，
+        等到锁的worker拿不到其他进程的结果，仍会再批改一次，跨进程加锁只会让相同作文的批改排队。
+        """
+        if os.getenv('SINGLE_FLIGHT', '1') == '0':
+            return None
+        lock_dir = os.getenv('SINGLE_FLIGHT_LOCK_DIR') or None
+        if lock_dir and getattr(cache, 'disk_path', None) is None:
+            logger.warning('SINGLE_FLIGHT_LOCK_DIR 需要同时设置 GRADING_CACHE_PATH（磁盘缓存），只在进程内合并相同的批改请求')
+            lock_dir = None
+        return cls(lock_dir=lock_dir)
+
+    @property
+    def is_shared(self):
+        """是否跨进程合并（执行函数需要在执行前查询进程间共享的缓存）"""
+        return self.lock_dir is not None
+
+    def do(self, key, fn):
+        """执行 fn() 并返回结果；相同key的调用正在进行时等待它完成，返回其结果的副本"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                leader = True
+            else:
+                call.waiters += 1
+                leader = False
+
+        if not leader:
+            metrics.COALESCED_REQUESTS.labels('thread').inc()
+            logger.info('相同作文正在批改，等待其结果')
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result)
+
+        try:
+            with self._process_lock(key):
+                call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            if call.waiters:
+                logger.info('批改结果同时返回给 %d 个等待的请求', call.waiters)
+            call.done.set()
+
+    @contextmanager
+    def _process_lock(self, key):
+        """跨进程的文件锁，未设置 lock_dir 时不加锁"""
+        if self.lock_dir is None:
+            yield
+            return
+        self._cleanup()
+        with open(os.path.join(self.lock_dir, f'{key}.lock'), 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                metrics.COALESCED_REQUESTS.labels('process').inc()
+                logger.info('其他worker进程正在批改相同作文，等待其完成')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _cleanup(self):
+        """定期删除长时间未使用的锁文件
+
+        删除时若恰好有进程持有该锁，最坏情况是两个进程各自批改一次，不影响结果的正确性。
+        """
+        with self._lock:
+            self._runs += 1
+            if self._runs % CLEANUP_INTERVAL:
+                return
+        expires_before = time.time() - LOCK_FILE_TTL
+        try:
+            with os.scandir(self.lock_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.lock') and entry.stat().st_mtime < expires_before:
+                        os.remove(entry.path)
+        except OSError as e:
+            logger.warning('清理批改锁文件失败: %s', e)
@@ -0,0 +1,134 @@
+import re
+from collections import deque
+
+# 匹配时忽略的撇号（"don't" 与 "dont"、弯引号 "don’t" 视为相同）
+_APOSTROPHES = "'’‘`"
+# 单词：连续的字母或数字，可被撇号连接
+_WORD_RE = re.compile(r"[^\W_]+(?:[" + _APOSTROPHES + r"]+[^\W_]+)*")
+_APOSTROPHE_RE = re.compile("[" + _APOSTROPHES + "]")
+
+
+def _tokens(text, start=0, end=None):
+    """切分 text[start:end] 中的单词，返回 (规范化的单词列表, 各单词在原文中的 (start, end))
+
+    单词转为小写并去掉撇号；单词之间的空白和标点不参与匹配，
+    因此空白多少、标点前后有无空格、大小写不同都不影响匹配。
+    """
+    words = []
+    spans = []
+    for match in _WORD_RE.finditer(text, start, len(text) if end is None else end):
+        words.append(_APOSTROPHE_RE.sub('', match.group()).lower())
+        spans.append(match.span())
+    return words, spans
+
+
+class _Automaton:
+    """以单词为字符的 Aho-Corasick 自动机：对文本的单词序列扫描一遍即可找出所有模式的全部出现位置
+
+    模式和文本都按单词切分，匹配天然在单词边界上开始和结束。
+    """
+
+    def __init__(self, patterns):
+        self.lengths = [len(pattern) for pattern in patterns]
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+        for pattern_id, pattern in enumerate(patterns):
+            node = 0
+            for word in pattern:
+                next_node = self.goto[node].get(word)
+                if next_node is None:
+                    next_node = len(self.goto)
+                    self.goto[node][word] = next_node
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                node = next_node
+            self.output[node].append(pattern_id)
+
+        # 按广度优先计算失配指针，并把失配节点的输出并入当前节点
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for word, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and word not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(word, 0)
+                self.output[child] = self.output[child] + self.output[self.fail[child]]
+
+    def search(self, words):
+        """返回 {模式序号: [(起始单词序号, 结束单词序号)]}，按起始位置升序"""
+        found = {}
+        node = 0
+        goto, fail, output = self.goto, self.fail, self.output
+        for index, word in enumerate(words):
+            while node and word not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(word, 0)
+            for pattern_id in output[node]:
+                found.setdefault(pattern_id, []).append((index + 1 - self.lengths[pattern_id], index + 1))
+        return found
+
+
+def find_spans(text, originals, start=0, end=None, hints=None):
+    """在 text[start:end] 中定位各个原文片段，返回每个片段的 (start, end)（找不到时为None）
+
+    所有片段构建一个Aho-Corasick自动机，对作文的单词序列只扫描一遍。匹配以单词为单位，
+    忽略大小写、撇号和单词之间空白、标点的差异。同一片段出现多次时按片段的先后顺序依次对应；
+    hints 为各片段已知的大致位置（可为None），给出时取该位置之后的第一次出现。
+    按单词找不到的片段（只有标点，或截取了半个单词）再按原文精确查找。
+    """
+    if end is None:
+        end = len(text)
+    hints = hints or [None] * len(originals)
+    words, word_spans = _tokens(text, start, end)
+    keys = [tuple(_tokens(original)[0]) if original else () for original in originals]
+    patterns = sorted({key for key in keys if key})
+    pattern_ids = {pattern: pattern_id for pattern_id, pattern in enumerate(patterns)}
+    occurrences = _Automaton(patterns).search(words) if patterns else {}
+
+    spans = []
+    used = set()
+    cursor = start
+    for original, key, hint in zip(originals, keys, hints):
+        span = None
+        if key:
+            candidates = [(word_spans[first][0], word_spans[last - 1][1])
+                          for first, last in occurrences.get(pattern_ids[key], [])]
+            after = hint if hint is not None else cursor
+            span = (next((candidate for candidate in candidates if candidate[0] >= after and candidate not in used), None)
+                    or next((candidate for candidate in candidates if candidate not in used), None)
+                    or (candidates[0] if candidates else None))
+        if span is None and original:
+            # 不含完整单词的片段（只有标点，或模型截取了半个单词）按原文精确查找
+            position = text.find(original, hint if hint is not None else cursor, end)
+            if position < 0:
+                position = text.find(original, start, end)
+            if position >= 0:
+                span = (position, position + len(original))
+        if span is not None:
+            used.add(span)
+            if hint is None:
+                cursor = span[1]
+        spans.append(span)
+    return spans
+
+
+def align_errors(text, errors):
+    """为每条详细错误设置 start/end（original 在作文中的位置，找不到时为None），返回新的错误列表
+
+    已带 start 的错误（分段批改、本地检查的错误）取该位置处的出现，其余错误按先后顺序依次对应。
+    不是对象的错误项原样保留。
+    """
+    located = [error for error in errors if isinstance(error, dict)]
+    hints = [error.get('start') if isinstance(error.get('start'), int) else None for error in located]
+    spans = iter(find_spans(text, [error.get('original') or '' for error in located], hints=hints))
+    aligned = []
+    for error in errors:
+        if isinstance(error, dict):
+            span = next(spans)
+            error = dict(error, start=span[0] if span else None, end=span[1] if span else None)
+        aligned.append(error)
+    return aligned
@@ -0,0 +1,125 @@
+import os
+import mmap
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORDS_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'english_words.txt')
+# 索引文件格式版本，格式变化时旧索引会被重新生成
+INDEX_VERSION = b'spelling-index-v1'
+
+
+def _deletes(word):
+    """删除一个字母得到的所有字符串（SymSpell的删除变体）"""
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+def osa_distance(a, b, limit=1):
+    """最优字符串对齐距离（允许相邻字母换位），超过limit时返回limit+1"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex:
+    """拼写检查词典：SymSpell式的删除变体索引（编辑距离1），索引文件通过mmap只读共享
+
+    词表按词频降序排列，行号即词频排名。删除变体索引约为词表的8倍大，写入磁盘后通过mmap访问：
+    不占用Python堆内存，多个worker进程共享同一份页缓存。每行格式为 "删除变体\\t排名,排名"，
+    按删除变体排序，查询时在mmap上二分查找。
+    """
+
+    def __init__(self, words_path=DEFAULT_WORDS_PATH, index_path=None):
+        self.words_path = words_path
+        self.index_path = index_path or os.path.splitext(words_path)[0] + '.idx'
+        with open(words_path, 'r', encoding='utf-8') as f:
+            self.words = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        self.ranks = {word: rank for rank, word in reversed(list(enumerate(self.words)))}
+        self._index = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, word):
+        return word in self.ranks
+
+    def _is_current(self):
+        try:
+            if os.path.getmtime(self.index_path) < os.path.getmtime(self.words_path):
+                return False
+            with open(self.index_path, 'rb') as f:
+                return f.readline().rstrip(b'\n') == INDEX_VERSION
+        except OSError:
+            return False
+
+    def _build(self):
+        """生成删除变体索引文件（先写临时文件再替换，多个进程同时生成时互不影响）"""
+        entries = {}
+        for rank, word in enumerate(self.words):
+            for delete in _deletes(word):
+                entries.setdefault(delete, []).append(rank)
+        temp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(INDEX_VERSION + b'\n')
+            for key in sorted(entries):
+                f.write(key.encode('utf-8') + b'\t' + ','.join(map(str, entries[key])).encode('ascii') + b'\n')
+        os.replace(temp_path, self.index_path)
+        logger.info('拼写索引已生成: %s，%d 个删除变体', self.index_path, len(entries))
+
+    def _mapped(self):
+        with self._lock:
+            if self._index is None:
+                if not self._is_current():
+                    self._build()
+                with open(self.index_path, 'rb') as f:
+                    self._index = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return self._index
+
+    def _lookup(self, key):
+        """在索引中二分查找删除变体，返回对应的单词排名列表"""
+        index = self._mapped()
+        key = key.encode('utf-8')
+        # 跳过首行的版本号
+        low, high = index.find(b'\n') + 1, len(index)
+        while low < high:
+            middle = (low + high) // 2
+            start = index.rfind(b'\n', 0, middle) + 1
+            if start < low:
+                start = low
+            end = index.find(b'\n', start)
+            tab = index.find(b'\t', start, end)
+            line_key = index[start:tab]
+            if line_key < key:
+                low = end + 1
+            elif line_key > key:
+                high = start
+            else:
+                return [int(rank) for rank in index[tab + 1:end].split(b',')]
+        return []
+
+    def suggest(self, word):
+        """返回编辑距离为1的最常用单词，没有候选时返回None（word应为小写）"""
+        candidates = set(self._lookup(word))
+        for delete in _deletes(word):
+            candidates.update(self._lookup(delete))
+            if delete in self.ranks:
+                candidates.add(self.ranks[delete])
+        for rank in sorted(candidates):
+            if osa_distance(word, self.words[rank]) <= 1:
+                return self.words[rank]
+        return None
+
+    def warm_up(self):
+        """提前生成并映射索引，避免首个请求等待"""
+        self._mapped()
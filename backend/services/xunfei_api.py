@@ -5,9 +5,20 @@ import hmac
 import hashlib
 import base64
 import urllib.parse
+import contextvars
 import websocket
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from services.response_parser import ResponseParser
+from services.json_stream_parser import IncrementalErrorExtractor
+from services.essay_chunker import merge_results, split_essay
+from services.revision_diff import block_context, diff_revision, splice_results
+from services.local_checker import degraded_result, merge_local_errors
+from services.span_aligner import align_errors
+from services.grading_cache import GradingCache
+from services.log_config import Payload
+from services import metrics
 
 # 加载环境变量
 load_dotenv()
@@ -15,8 +26,26 @@ load_dotenv()
 # 配置日志
 logger = logging.getLogger(__name__)
 
+# 批改作文的提示词模板
+PROMPT_TEMPLATE = "请批改以下英语作文，要求：\n1. 指出所有语法错误，包括拼写、标点、时态、主谓一致等问题\n2. 对每个错误提供详细的修改建议和解释\n3. 以JSON格式返回详细错误列表，每个错误包含original（原始文本）、corrected（修改后文本）、error_type（错误类型）、explanation（解释）字段\n4. 提供修改后的完整文本\n5. 给出评分和改进建议\n\n作文内容：\n{content}"
+
+# 增量批改修改过的段落时的提示词模板
+REGRADE_PROMPT_TEMPLATE = "请批改以下英语作文中修改过的段落。【上文】和【下文】是相邻的未修改内容，只用于理解语境，不要批改，也不要包含在修改后的文本中。要求：\n1. 指出【待批改段落】中所有语法错误，包括拼写、标点、时态、主谓一致等问题\n2. 对每个错误提供详细的修改建议和解释\n3. 以JSON格式返回详细错误列表，每个错误包含original（原始文本）、corrected（修改后文本）、error_type（错误类型）、explanation（解释）字段\n4. 提供【待批改段落】修改后的完整文本\n5. 给出改进建议\n\n【上文】\n{before}\n\n【待批改段落】\n{content}\n\n【下文】\n{after}"
+
+# 模型参数
+CHAT_PARAMETERS = {
+    "domain": "4.0Ultra",
+    "temperature": 0.7,
+    "max_tokens": 4096
+}
+
+# 超过该字符数的作文分段并发批改（一次生成的结果受max_tokens限制，长作文会被截断）
+DEFAULT_CHUNK_CHARS = 2500
+# 同步客户端分段批改时同时进行的请求数
+CHUNK_CONCURRENCY = 4
+
 class XunfeiAPI:
-    def __init__(self):
+    def __init__(self, cache=None, local_checker=None, single_flight=None):
         # 从环境变量获取API配置
         self.appid = os.getenv('APPID')
         self.api_key = os.getenv('APIKey')
@@ -25,10 +54,23 @@ class XunfeiAPI:
         if not all([self.appid, self.api_key, self.api_secret]):
             raise ValueError('讯飞星火API配置不完整')
         
-        # API端点 - Spark X1.5模型
-        self.host = 'spark-api.xf-yun.com'
-        self.path = '/v4.0/chat'
-        self.port = 443
+        # API端点 - Spark X1.5模型（可通过SPARK_API_URL指向本地模拟服务，例如 ws://127.0.0.1:8765/v4.0/chat）
+        endpoint = urllib.parse.urlparse(os.getenv('SPARK_API_URL') or 'wss://spark-api.xf-yun.com:443/v4.0/chat')
+        self.scheme = endpoint.scheme
+        self.host = endpoint.hostname
+        self.path = endpoint.path
+        self.port = endpoint.port or (443 if endpoint.scheme == 'wss' else 80)
+        
+        # 批改结果缓存（GradingCache），为None时不使用缓存
+        self.cache = cache
+        # 本地拼写和语法检查（LocalChecker），为None时不做本地检查
+        self.local_checker = local_checker
+        # 合并相同作文的并发批改（SingleFlight），为None时每个请求单独批改
+        self.single_flight = single_flight
+        # 分段批改的片段长度上限，0表示不分段
+        self.chunk_chars = int(os.getenv('SPARK_CHUNK_CHARS', DEFAULT_CHUNK_CHARS))
+        # 响应解析器
+        self.parser = ResponseParser()
     
     def _generate_signature(self):
         """生成WebSocket签名"""
@@ -66,7 +108,7 @@ class XunfeiAPI:
         }
         
         # 构建完整的WebSocket URL
-        ws_url = f"wss://{self.host}:{self.port}{self.path}?{urllib.parse.urlencode(query)}"
+        ws_url = f"{self.scheme}://{self.host}:{self.port}{self.path}?{urllib.parse.urlencode(query)}"
         return ws_url
     
     def _send_message(self, ws, message):
@@ -78,384 +120,347 @@ class XunfeiAPI:
         start_time = time.time()
         while time.time() - start_time < timeout:
             try:
-                logger.debug('尝试接收WebSocket消息...')
                 message = ws.recv()
-                logger.info(f'接收到WebSocket消息，长度: {len(message)}')
-                logger.debug(f'消息内容: {message[:1000]}...')
+                logger.debug('接收到WebSocket消息，长度: %d', len(message))
                 
                 # 尝试解析JSON
                 try:
-                    parsed_message = json.loads(message)
-                    logger.info('JSON解析成功')
-                    return parsed_message
+                    return json.loads(message)
                 except json.JSONDecodeError as e:
-                    logger.error(f'JSON解析错误: {str(e)}')
-                    logger.error(f'原始消息: {message}')
+                    logger.error('JSON解析错误: %s，原始消息: %s', e, Payload(message))
                     # 即使JSON解析失败，也返回原始消息
                     return {'raw_message': message}
             except websocket.WebSocketTimeoutException:
                 logger.debug('WebSocket接收超时，继续等待')
                 continue
             except Exception as e:
-                logger.error(f'接收消息时发生错误: {str(e)}')
+                logger.error('接收消息时发生错误: %s', e)
                 continue
+        metrics.SPARK_ERRORS.labels('timeout').inc()
         raise TimeoutError('WebSocket接收消息超时')
     
-    def check_essay(self, content):
-        """使用讯飞Spark Max API批改作文"""
-        try:
-            logger.info(f'开始调用讯飞Spark Max API批改作文，内容长度: {len(content)}')
-            
-            # 构建WebSocket URL
-            ws_url = self._build_ws_url()
-            logger.info(f'WebSocket URL: {ws_url}')
-            
-            # 连接WebSocket
-            ws = websocket.create_connection(ws_url, timeout=10)
-            logger.info('WebSocket连接成功')
-            
-            # 构建请求数据
-            request_data = {
-                "header": {
-                    "app_id": self.appid,
-                    "uid": "user123"
-                },
-                "parameter": {
-                    "chat": {
-                        "domain": "4.0Ultra",
-                        "temperature": 0.7,
-                        "max_tokens": 4096
-                    }
-                },
-                "payload": {
-                    "message": {
-                        "text": [
-                            {
-                                "role": "user",
-                                "content": f"请批改以下英语作文，要求：\n1. 指出所有语法错误，包括拼写、标点、时态、主谓一致等问题\n2. 对每个错误提供详细的修改建议和解释\n3. 以JSON格式返回详细错误列表，每个错误包含original（原始文本）、corrected（修改后文本）、error_type（错误类型）、explanation（解释）字段\n4. 提供修改后的完整文本\n5. 给出评分和改进建议\n\n作文内容：\n{content}"
-                            }
-                        ]
-                    }
+    def _build_request(self, content, prompt=None):
+        """构建批改作文的请求数据，prompt 为完整的提示词（默认按PROMPT_TEMPLATE生成）"""
+        return {
+            "header": {
+                "app_id": self.appid,
+                "uid": "user123"
+            },
+            "parameter": {
+                "chat": dict(CHAT_PARAMETERS)
+            },
+            "payload": {
+                "message": {
+                    "text": [
+                        {
+                            "role": "user",
+                            "content": prompt or PROMPT_TEMPLATE.format(content=content)
+                        }
+                    ]
                 }
             }
-            
-            # 发送请求
-            self._send_message(ws, request_data)
-            logger.info('请求发送成功')
-            
-            # 接收响应
-            responses = []
-            while True:
-                response = self._receive_message(ws)
-                responses.append(response)
-                logger.debug(f'收到响应: {json.dumps(response, ensure_ascii=False)}')
-                
-                # 检查是否收到最终响应
-                if response.get('header', {}).get('status') == 2:
-                    logger.info('收到最终响应')
-                    break
-            
-            # 关闭WebSocket连接
-            ws.close()
-            logger.info('WebSocket连接关闭')
-            
-            # 处理响应数据
-            result = self._process_response(responses)
-            logger.info(f'API调用完成，结果: {json.dumps(result, ensure_ascii=False)}')
-            return result
-            
+        }
+    
+    def _check_frame(self, response):
+        """检查响应帧的错误码，非0时抛出异常"""
+        header = response.get('header', {})
+        code = header.get('code', 0)
+        if code != 0:
+            metrics.SPARK_ERRORS.labels(str(code)).inc()
+            raise RuntimeError(f'讯飞API返回错误，错误码: {code}, 错误信息: {header.get("message")}')
+    
+    def _local_errors(self, content):
+        """本地检查作文，未启用或检查出错时返回空列表"""
+        if self.local_checker is None:
+            return []
+        try:
+            return self.local_checker.check(content)
         except Exception as e:
-            logger.error(f'调用讯飞Spark Max API失败: {str(e)}')
-            # 返回默认结果
-            return {
-                "feedback": "",
-                "suggestions": ["增强论点的说服力", "改善句子结构多样性", "增加具体例子"],
-                "grammar_errors": ["时态使用不当", "主谓一致问题", "拼写错误"],
-                "detailed_errors": [],
-                "corrected_text": ""
-            }
+            logger.error('本地检查失败: %s', e)
+            return []
     
-    def _process_response(self, responses):
-        """处理API响应数据"""
-        # 打印响应列表长度和内容，用于调试
-        logger.info(f'收到的响应数量: {len(responses)}')
-        if responses:
-            logger.info(f'第一个响应的结构: {json.dumps(responses[0], ensure_ascii=False)[:500]}...')
-        
-        # 提取所有文本响应
-        text_responses = []
-        for i, response in enumerate(responses):
-            logger.info(f'处理第 {i+1} 个响应')
-            # 检查响应结构
-            payload = response.get('payload', {})
-            logger.info(f'响应 {i+1} 的payload: {json.dumps(payload, ensure_ascii=False)[:300]}...')
-            
-            choices = payload.get('choices', {})
-            logger.info(f'响应 {i+1} 的choices: {json.dumps(choices, ensure_ascii=False)[:300]}...')
-            
-            # 尝试不同的文本提取方式
-            text = []
-            if isinstance(choices, dict):
-                # 标准结构
-                text = choices.get('text', [])
-            elif isinstance(choices, list):
-                # 可能的列表结构
-                text = choices
-            
-            logger.info(f'响应 {i+1} 中的文本数量: {len(text)}')
-            
-            for item in text:
-                logger.info(f'文本项: {json.dumps(item, ensure_ascii=False)}')
-                # 尝试不同的角色检查方式
-                role = item.get('role', '')
-                content = item.get('content', '')
-                
-                # 如果找到内容，无论角色如何，都添加到响应中
-                if content:
-                    text_responses.append(content)
-                    logger.info(f'添加内容: "{content[:100]}..."')
-        
-        # 合并响应文本
-        full_response = ''.join(text_responses)
-        logger.info(f'合并后的响应文本长度: {len(full_response)}')
-        logger.info(f'合并后的响应文本: "{full_response[:200]}..."')
-        
-        # 如果没有提取到内容，尝试从响应的其他部分提取
-        if not full_response:
-            logger.warning('没有从响应中提取到内容，尝试其他方式')
-            for response in responses:
-                # 尝试直接从payload中提取
-                payload = response.get('payload', {})
-                if isinstance(payload, str):
-                    text_responses.append(payload)
-                    logger.info(f'从payload中提取内容: "{payload[:100]}..."')
-                
-                # 尝试从message中提取
-                message = payload.get('message', {})
-                if isinstance(message, dict):
-                    msg_text = message.get('text', [])
-                    for item in msg_text:
-                        if isinstance(item, dict):
-                            content = item.get('content', '')
-                            if content:
-                                text_responses.append(content)
-                                logger.info(f'从message中提取内容: "{content[:100]}..."')
-                elif isinstance(message, list):
-                    for item in message:
-                        if isinstance(item, dict):
-                            content = item.get('content', '')
-                            if content:
-                                text_responses.append(content)
-                                logger.info(f'从message列表中提取内容: "{content[:100]}..."')
-        
-        # 重新合并响应文本
-        full_response = ''.join(text_responses)
-        logger.info(f'最终响应文本长度: {len(full_response)}')
-        logger.info(f'最终响应文本: "{full_response[:200]}..."')
+    def _finalize(self, content, result):
+        """返回给调用方之前处理批改结果（缓存中保存的是处理前的结果）：
+        合并本地检查发现、星火没有指出的错误，并为每条详细错误加上在作文中的位置 start/end
+        """
+        local_errors = self._local_errors(content)
+        if local_errors:
+            result = merge_local_errors(content, result, local_errors)
+        return dict(result, detailed_errors=align_errors(content, result.get('detailed_errors') or []))
+    
+    def _default_result(self, content=''):
+        """API调用失败时返回的降级结果：只包含本地检查发现的错误"""
+        result = degraded_result(content, self._local_errors(content))
+        return dict(result, detailed_errors=align_errors(content, result['detailed_errors']))
+    
+    def _cache_lookup(self, content):
+        """查询批改结果缓存，返回 (缓存键, 缓存结果)"""
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(content, PROMPT_TEMPLATE, CHAT_PARAMETERS)
+        return cache_key, self.cache.get(cache_key)
+    
+    def check_essay(self, content):
+        """使用讯飞Spark Max API批改作文
         
-        # 尝试解析JSON格式的响应
+        相同作文（规范化后的文本和模型参数相同）正在批改时，不再发起新的会话，等待并共享其结果。
+        """
         try:
-            json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', full_response)
-            if json_block_match:
-                json_str = json_block_match.group(1)
-                logger.info(f'找到JSON块，长度: {len(json_str)}')
-                logger.info(f'JSON内容前200字符: {json_str[:200]}...')
-                
-                json_content = json.loads(json_str)
-                logger.info(f'成功解析JSON响应，类型: {type(json_content)}')
-                logger.info(f'JSON键: {json_content.keys() if isinstance(json_content, dict) else "N/A"}')
-                
-                # 检查是否包含errors字段
-                if isinstance(json_content, dict) and 'errors' in json_content:
-                    result = {
-                        'feedback': '',
-                        'suggestions': json_content.get('improvement_suggestions', []),
-                        'grammar_errors': [],
-                        'detailed_errors': json_content.get('errors', []),
-                        'corrected_text': json_content.get('corrected_text', '')
-                    }
-                    logger.info(f'从JSON中提取结果成功: errors={len(result["detailed_errors"])}, suggestions={len(result["suggestions"])}, corrected_text长度={len(result["corrected_text"])}')
-                    return result
-                else:
-                    logger.warning(f'JSON中不包含errors字段，使用文本解析方式')
+            cache_key, cached = self._cache_lookup(content)
+            if cached is not None:
+                logger.info('命中批改结果缓存')
+                return self._finalize(content, cached)
+            
+            if self.single_flight is None:
+                result = self._grade_essay(content, cache_key)
             else:
-                logger.warning(f'未找到JSON块，使用文本解析方式')
+                flight_key = cache_key or GradingCache.make_key(content, PROMPT_TEMPLATE, CHAT_PARAMETERS)
+                result = self.single_flight.do(flight_key, lambda: self._grade_once(content, cache_key))
+            return self._finalize(content, result)
         except Exception as e:
-            logger.warning(f'JSON解析失败: {str(e)}，使用文本解析方式')
-        
-        # 构建结果（移除评分模块）
-        result = {
-            'feedback': full_response,
-            'suggestions': self._extract_suggestions(full_response),
-            'grammar_errors': self._extract_grammar_errors(full_response),
-            'detailed_errors': self._extract_detailed_errors(full_response),
-            'corrected_text': self._generate_corrected_text(full_response)
-        }
-        logger.info(f'使用文本解析方式提取结果: feedback长度={len(result["feedback"])}, suggestions={len(result["suggestions"])}, grammar_errors={len(result["grammar_errors"])}, detailed_errors={len(result["detailed_errors"])}, corrected_text长度={len(result["corrected_text"])}')
-        return result
-    
-
+            logger.error('调用讯飞Spark Max API失败: %s', e)
+            # 返回本地检查的降级结果
+            return self._default_result(content)
     
-    def _extract_suggestions(self, response):
-        """从响应中提取改进建议"""
-        # 尝试从响应中提取改进建议
-        import re
-        suggestions_match = re.search(r'改进建议[:：]\s*([\s\S]*?)(?=详细错误分析|修改后的文本|$)', response)
-        if suggestions_match:
-            suggestions_text = suggestions_match.group(1)
-            # 分割建议并清理
-            suggestions = [s.strip() for s in suggestions_text.split('\n') if s.strip()]
-            return suggestions[:3]  # 最多返回3条建议
-        # 返回默认建议
-        return ['增强论点的说服力', '改善句子结构多样性', '增加具体例子']
+    def _grade_once(self, content, cache_key):
+        """合并批改的执行函数：跨进程合并时，等到的可能是其他worker已写入磁盘缓存的结果"""
+        if self.single_flight.is_shared and cache_key is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                logger.info('其他worker进程已完成相同作文的批改，使用其缓存结果')
+                return cached
+        return self._grade_essay(content, cache_key)
     
-    def _extract_grammar_errors(self, response):
-        """从响应中提取语法错误"""
-        # 尝试从响应中提取语法错误
-        import re
-        errors_match = re.search(r'语法错误[:：]\s*([\s\S]*?)(?=详细错误分析|修改后的文本|$)', response)
-        if errors_match:
-            errors_text = errors_match.group(1)
-            # 分割错误并清理
-            errors = [e.strip() for e in errors_text.split('\n') if e.strip()]
-            return errors[:3]  # 最多返回3条错误
-        # 返回默认错误
-        return ['时态使用不当', '主谓一致问题']
+    def _grade_essay(self, content, cache_key):
+        """调用星火批改作文（整篇或分段），成功且完整的结果写入缓存"""
+        logger.info('开始调用讯飞Spark Max API批改作文，内容长度: %d', len(content))
+        if self.chunk_chars and len(content) > self.chunk_chars:
+            result, complete = self._check_chunked(content)
+        else:
+            result, complete = self._request_essay(content), True
+        # 只缓存成功的结果，失败时的默认结果和部分片段失败的结果不缓存
+        if cache_key is not None and complete:
+            self.cache.set(cache_key, result)
+        logger.info('API调用完成，详细错误: %d 条，修改后文本长度: %d',
+                    len(result.get('detailed_errors') or []), len(result.get('corrected_text') or ''))
+        logger.debug('批改结果: %s', Payload(result))
+        return result
     
-    def _extract_detailed_errors(self, response):
-        """从响应中提取详细的错误信息"""
-        # 尝试从响应中提取详细错误信息
-        import re
+    def _check_chunked(self, content):
+        """长作文分段批改：在段落或句子边界切分，各片段并发批改后按原文顺序合并
         
-        logger.info(f'开始提取详细错误信息，响应长度: {len(response)}')
+        返回 (结果, 是否所有片段都批改成功)。片段结果单独缓存，修改后重新提交时只批改变化的片段。
+        所有片段都失败时抛出异常。
+        """
+        segments = split_essay(content, self.chunk_chars)
+        results = [None] * len(segments)
+        pending = []
+        for index, segment in enumerate(segments):
+            cache_key, cached = self._cache_lookup(segment['text'])
+            if cached is not None:
+                results[index] = cached
+            else:
+                pending.append((index, cache_key))
+        logger.info('作文分为 %d 段批改，其中 %d 段命中缓存', len(segments), len(segments) - len(pending))
         
-        # 尝试匹配JSON格式的详细错误信息
-        json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', response)
-        if json_block_match:
-            try:
-                json_content = json.loads(json_block_match.group(1))
-                # 检查JSON结构，处理不同格式
-                if isinstance(json_content, list):
-                    # 直接是错误列表
-                    logger.info(f'成功从JSON中提取详细错误信息，数量: {len(json_content)}')
-                    return json_content[:5]  # 最多返回5个详细错误
-                elif isinstance(json_content, dict) and 'errors' in json_content:
-                    # 包含errors字段的JSON
-                    errors = json_content['errors']
-                    if isinstance(errors, list):
-                        logger.info(f'成功从JSON的errors字段中提取详细错误信息，数量: {len(errors)}')
-                        return errors[:5]  # 最多返回5个详细错误
-                elif isinstance(json_content, dict):
-                    # 单个错误对象
-                    logger.info('成功从JSON中提取单个错误信息')
-                    return [json_content]
-            except json.JSONDecodeError as e:
-                logger.error(f'JSON解析错误: {str(e)}')
+        outcomes = self._grade_segments([segments[index]['text'] for index, _ in pending])
+        for (index, cache_key), outcome in zip(pending, outcomes):
+            if isinstance(outcome, BaseException):
+                logger.error('第 %d 段批改失败: %s', index + 1, outcome)
+                continue
+            results[index] = outcome
+            if cache_key is not None:
+                self.cache.set(cache_key, outcome)
+        
+        failed = [index for index, result in enumerate(results) if result is None]
+        if len(failed) == len(segments):
+            raise RuntimeError('所有片段批改失败')
+        result = merge_results(content, segments, results)
+        result['segments'] = [{'start': segment['start'], 'end': segment['end']} for segment in segments]
+        if failed:
+            result['failed_segments'] = failed
+        return result, not failed
+    
+    def regrade_essay(self, content, previous_content, previous_result):
+        """批改修改后的作文：只把变化的段落（附带相邻段落作为上下文）发送给星火，其余段落沿用上一版的结果
         
-        # 尝试匹配非JSON格式的详细错误信息
-        errors_match = re.search(r'详细错误分析[:：]\s*([\s\S]*?)(?=修改后的文本|$)', response)
-        if errors_match:
-            errors_text = errors_match.group(1)
-            logger.info(f'成功匹配详细错误分析文本，长度: {len(errors_text)}')
+        上一版结果无法按段落对齐、修改过多或上一版批改失败时，整篇重新批改（check_essay）。
+        各修改块的批改结果按块及其上下文单独缓存；拼接后的整篇结果不缓存，整篇作文的缓存只保存完整批改的结果。
+        """
+        try:
+            _, cached = self._cache_lookup(content)
+            if cached is not None:
+                logger.info('命中批改结果缓存')
+                return self._finalize(content, cached)
+            
+            plan = diff_revision(previous_content, previous_result, content)
+            if plan is None:
+                logger.info('无法与上一版按段落对齐、修改过多或上一版批改失败，整篇重新批改')
+                return self.check_essay(content)
+            
+            blocks = [block_context(content, plan['spans'], j1, j2) for j1, j2 in plan['blocks']]
+            texts = [content[start:end] for start, end, _, _ in blocks]
+            prompts = [REGRADE_PROMPT_TEMPLATE.format(before=before or '（无）', content=text, after=after or '（无）')
+                       for text, (_, _, before, after) in zip(texts, blocks)]
+            logger.info('增量批改：沿用 %d 段，重新批改 %d 处修改共 %d 字符',
+                        len(plan['kept']), len(texts), sum(len(text) for text in texts))
             
-            # 解析非JSON格式的错误信息
-            error_items = []
-            # 尝试按行解析错误信息
-            lines = errors_text.strip().split('\n')
-            current_error = {}
+            results = [None] * len(texts)
+            pending = []
+            for index, prompt in enumerate(prompts):
+                block_key, cached = self._block_cache_lookup(prompt)
+                if cached is not None:
+                    results[index] = cached
+                else:
+                    pending.append((index, block_key))
             
-            for line in lines:
-                line = line.strip()
-                if '原始:' in line:
-                    current_error['original'] = line.split('原始:', 1)[1].strip()
-                elif '修改:' in line:
-                    current_error['corrected'] = line.split('修改:', 1)[1].strip()
-                elif '类型:' in line:
-                    current_error['error_type'] = line.split('类型:', 1)[1].strip()
-                elif '解释:' in line:
-                    current_error['explanation'] = line.split('解释:', 1)[1].strip()
-                    # 当收集到完整的错误信息时，添加到列表
-                    if all(key in current_error for key in ['original', 'corrected', 'error_type', 'explanation']):
-                        error_items.append(current_error.copy())
-                        current_error = {}
+            outcomes = self._grade_segments([texts[index] for index, _ in pending],
+                                            [prompts[index] for index, _ in pending])
+            for (index, block_key), outcome in zip(pending, outcomes):
+                if isinstance(outcome, BaseException):
+                    logger.error('第 %d 处修改批改失败: %s', index + 1, outcome)
+                    continue
+                results[index] = outcome
+                if block_key is not None:
+                    self.cache.set(block_key, outcome)
+            if results and all(result is None for result in results):
+                raise RuntimeError('所有修改段落批改失败')
             
-            if error_items:
-                logger.info(f'成功解析非JSON格式错误信息，数量: {len(error_items)}')
-                return error_items[:5]
+            result = splice_results(content, plan, results)
+            result['incremental'] = {
+                'reused_paragraphs': len(plan['kept']),
+                'regraded_paragraphs': sum(j2 - j1 for j1, j2 in plan['blocks']),
+                'failed_blocks': [index for index, result in enumerate(results) if result is None],
+            }
+            return self._finalize(content, result)
+        except Exception as e:
+            logger.error('增量批改失败: %s', e)
+            return self._default_result(content)
+    
+    def _block_cache_lookup(self, prompt):
+        """查询修改块的批改结果缓存（按包含上下文的完整提示词计算键），返回 (缓存键, 缓存结果)"""
+        if self.cache is None:
+            return None, None
+        block_key = self.cache.make_key(prompt, REGRADE_PROMPT_TEMPLATE, CHAT_PARAMETERS)
+        return block_key, self.cache.get(block_key)
+    
+    def _grade_segments(self, texts, prompts=None):
+        """并发批改多个片段，按顺序返回批改结果或异常；prompts 为各片段的完整提示词（可选）"""
+        if not texts:
+            return []
         
-        # 尝试匹配其他格式的错误信息
-        # 查找所有可能的错误对
-        error_pairs = re.findall(r'(.*?)[→→](.*?)[\n\r]', response)
-        if error_pairs:
-            error_items = []
-            for i, (original, corrected) in enumerate(error_pairs[:5]):
-                error_items.append({
-                    'original': original.strip(),
-                    'corrected': corrected.strip(),
-                    'error_type': '语法错误',
-                    'explanation': '需要修改的语法问题'
-                })
-            logger.info(f'成功匹配错误对，数量: {len(error_items)}')
-            return error_items
+        def grade(text, prompt):
+            try:
+                return self._request_essay(text, prompt)
+            except Exception as e:
+                return e
         
-        # 如果没有找到任何错误信息，返回空列表
-        logger.warning('未能从响应中提取详细错误信息')
-        return []
+        prompts = prompts or [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=min(len(texts), CHUNK_CONCURRENCY),
+                                thread_name_prefix='spark-segment') as executor:
+            # 批改线程的日志沿用调用线程的请求关联ID
+            futures = [executor.submit(contextvars.copy_context().run, grade, text, prompt)
+                       for text, prompt in zip(texts, prompts)]
+            return [future.result() for future in futures]
     
-    def _generate_corrected_text(self, response):
-        """生成修改后的文本"""
-        # 尝试从响应中提取修改后的文本
-        import re
+    def stream_essay(self, content):
+        """流式批改作文，逐帧产出事件
+        
+        事件格式：
+        - {'type': 'local_errors', 'errors': [...]}  本地检查的结果，在请求星火之前产出（未启用本地检查时没有）
+        - {'type': 'delta', 'text': ...}  模型新生成的文本片段
+        - {'type': 'detailed_error', 'error': ...}  JSON块中刚闭合的一个错误对象
+        - {'type': 'error', 'message': ...}  调用失败，随后会产出本地检查的降级结果
+        - {'type': 'result', 'result': ..., 'cached': bool}  最终的结构化结果
+        """
+        cache_key, cached = self._cache_lookup(content)
+        if cached is not None:
+            logger.info('命中批改结果缓存')
+            yield {'type': 'result', 'result': self._finalize(content, cached), 'cached': True}
+            return
         
-        logger.info('开始提取修改后的文本')
-        logger.info(f'响应内容前500字符: {response[:500]}...')
-        logger.info(f'响应内容后500字符: {response[-500:] if len(response) > 500 else response}...')
+        if self.local_checker is not None:
+            yield {'type': 'local_errors', 'errors': self._local_errors(content)}
         
-        # 尝试匹配修改后的文本（中文格式）
-        # 匹配"修改后的文本"或"修改后的完整文本"
-        corrected_match = re.search(r'修改后的(?:完整)?文本[:：]\s*([\s\S]*?)(?=\d+\.|详细错误分析|评分|改进建议|$)', response)
-        if corrected_match:
-            corrected_text = corrected_match.group(1).strip()
-            logger.info(f'匹配到"修改后的文本"，内容长度: {len(corrected_text)}')
-            if corrected_text:
-                # 去除可能的Markdown格式标签
-                corrected_text = re.sub(r'```json\s*([\s\S]*?)\s*```', '', corrected_text)
-                corrected_text = re.sub(r'```\s*([\s\S]*?)\s*```', '', corrected_text)
-                corrected_text = corrected_text.strip()
-                if corrected_text:
-                    logger.info(f'成功提取修改后的文本，长度: {len(corrected_text)}')
-                    return corrected_text
+        logger.info('开始流式调用讯飞Spark Max API批改作文，内容长度: %d', len(content))
+        responses = []
+        extractor = IncrementalErrorExtractor()
+        try:
+            for response in self._iter_frames(content):
+                responses.append(response)
+                text = self._frame_text(response)
+                if text:
+                    yield {'type': 'delta', 'text': text}
+                    for error in extractor.feed(text):
+                        yield {'type': 'detailed_error', 'error': error}
+            result = self._process_response(responses)
+        except Exception as e:
+            logger.error('流式调用讯飞Spark Max API失败: %s', e)
+            yield {'type': 'error', 'message': str(e)}
+            yield {'type': 'result', 'result': self._default_result(content), 'cached': False}
+            return
         
-        # 尝试匹配其他格式的修改后文本
-        other_match = re.search(r'修正后[:：]\s*([\s\S]*?)(?=\n\n|评分|改进建议|$)', response)
-        if other_match:
-            corrected_text = other_match.group(1).strip()
-            logger.info(f'匹配到"修正后"，内容长度: {len(corrected_text)}')
-            if corrected_text:
-                # 去除可能的Markdown格式标签
-                corrected_text = re.sub(r'```json\s*([\s\S]*?)\s*```', '', corrected_text)
-                corrected_text = re.sub(r'```\s*([\s\S]*?)\s*```', '', corrected_text)
-                corrected_text = corrected_text.strip()
-                if corrected_text:
-                    logger.info(f'成功提取其他格式的修改后文本，长度: {len(corrected_text)}')
-                    return corrected_text
+        if cache_key is not None:
+            self.cache.set(cache_key, result)
+        yield {'type': 'result', 'result': self._finalize(content, result), 'cached': False}
+    
+    def _frame_text(self, response):
+        """提取单个响应帧中新生成的文本"""
+        choices = response.get('payload', {}).get('choices', {})
+        text = choices.get('text', []) if isinstance(choices, dict) else choices
+        return ''.join(item.get('content', '') for item in text if isinstance(item, dict))
+    
+    def _request_essay(self, content, prompt=None):
+        """通过WebSocket请求批改结果，失败时抛出异常"""
+        responses = list(self._iter_frames(content, prompt))
+        # 处理响应数据
+        return self._process_response(responses)
+    
+    def _iter_frames(self, content, prompt=None):
+        """发送批改请求并逐个产出响应帧，直到收到最终帧"""
+        # 构建WebSocket URL
+        with metrics.timed('sign'):
+            ws_url = self._build_ws_url()
+        # URL中包含签名，日志只记录地址
+        logger.debug('连接WebSocket: %s://%s:%s%s', self.scheme, self.host, self.port, self.path)
         
-        # 尝试从JSON中提取corrected_text字段
-        json_block_match = re.search(r'```json\s*([\s\S]*?)\s*```', response)
-        if json_block_match:
-            try:
-                json_content = json.loads(json_block_match.group(1))
-                logger.info(f'JSON内容键: {json_content.keys() if isinstance(json_content, dict) else "N/A"}')
-                if isinstance(json_content, dict) and 'corrected_text' in json_content:
-                    corrected_text = json_content['corrected_text']
-                    if corrected_text:
-                        logger.info(f'成功从JSON中提取corrected_text，长度: {len(corrected_text)}')
-                        return corrected_text
-            except json.JSONDecodeError as e:
-                logger.warning(f'JSON解析失败: {e}')
+        # 连接WebSocket
+        try:
+            with metrics.timed('connect'):
+                ws = websocket.create_connection(ws_url, timeout=10)
+        except Exception:
+            metrics.SPARK_ERRORS.labels('connection').inc()
+            raise
         
-        # 如果没有找到修改后的文本，返回空字符串
-        logger.warning('未能从响应中提取修改后的文本')
-        logger.warning(f'完整响应内容: {response}')
-        return ''  # 返回空字符串而不是响应的一部分
-
+        metrics.SPARK_SESSIONS_IN_FLIGHT.inc()
+        try:
+            # 发送请求
+            self._send_message(ws, self._build_request(content, prompt))
+            sent_at = time.perf_counter()
+            logger.debug('请求发送成功')
+            
+            # 接收响应
+            frames = 0
+            while True:
+                response = self._receive_message(ws)
+                if frames == 0:
+                    metrics.observe('first_frame', time.perf_counter() - sent_at)
+                self._check_frame(response)
+                frames += 1
+                logger.debug('收到响应: %s', Payload(response))
+                yield response
+                
+                # 检查是否收到最终响应
+                if response.get('header', {}).get('status') == 2:
+                    metrics.observe('last_frame', time.perf_counter() - sent_at)
+                    logger.debug('收到最终响应，共 %d 帧', frames)
+                    break
+        finally:
+            # 关闭WebSocket连接
+            metrics.SPARK_SESSIONS_IN_FLIGHT.dec()
+            ws.close()
+    
+    def _process_response(self, responses):
+        """处理API响应数据"""
+        with metrics.timed('parse'):
+            return self.parser.parse(responses)
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import hmac
+import base64
+import hashlib
+import logging
+import threading
+import urllib.parse
+from wsgiref.handlers import format_date_time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services.log_config import Payload
+from services import metrics
+
+# 配置日志
+logger = logging.getLogger(__name__)
+
+# 签名的复用时间（秒）：讯飞允许date与服务器时间相差300秒，留出足够余量
+SIGNATURE_TTL = 60
+# 连接超时和读取超时（秒）：识别一页手写作文可能需要数十秒
+DEFAULT_TIMEOUT = (5, 120)
+# 服务端临时错误时的重试状态码
+RETRY_STATUS = (500, 502, 503, 504)
+# 请求体模板中图片base64的占位符
+IMAGE_PLACEHOLDER = '__IMAGE_BASE64__'
+
+
+class XunfeiOCRClient:
+    """讯飞OCR（hh_ocr_recognize_doc）客户端
+
+    配置在创建时读取一次；请求复用同一个连接池（keep-alive），对5xx和超时按指数退避重试；
+    签名在有效期内复用，多页并发识别时不必每页重新计算。
+    """
+
+    def __init__(self, appid=None, api_key=None, api_secret=None, url=None,
+                 pool_size=4, retries=None, backoff=None, timeout=DEFAULT_TIMEOUT):
+        # 讯飞OCR API配置 - 默认从环境变量读取
+        self.appid = appid or os.getenv('OCR_APPID')
+        self.api_key = api_key or os.getenv('OCR_API_KEY')
+        self.api_secret = api_secret or os.getenv('OCR_API_SECRET')
+        self.url = url or os.getenv('OCR_URL')
+        self.timeout = timeout
+
+        # 未配置OCR时服务仍可启动，识别时再报错
+        self.configured = all([self.appid, self.api_key, self.api_secret, self.url])
+        if self.configured:
+            # 解析URL（参考官方demo.py的parse_url方法，host包含端口）
+            endpoint = urllib.parse.urlsplit(self.url)
+            self.host = endpoint.netloc
+            self.path = endpoint.path
+
+        if retries is None:
+            retries = int(os.getenv('OCR_RETRIES', 2))
+        if backoff is None:
+            backoff = float(os.getenv('OCR_RETRY_BACKOFF', 0.5))
+        # 默认的重试策略不包括POST；OCR识别没有副作用，可以安全重试
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff, status_forcelist=RETRY_STATUS,
+                      allowed_methods=frozenset(['POST']), raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # (过期时间, 签名后的URL)
+        self._signature = None
+        self._signature_lock = threading.Lock()
+
+    def _generate_signature(self, date):
+        """按官方demo.py生成authorization"""
+        signature_origin = f"host: {self.host}\ndate: {date}\nPOST {self.path} HTTP/1.1"
+        signature_sha = hmac.new(self.api_secret.encode('utf-8'), signature_origin.encode('utf-8'),
+                                 digestmod=hashlib.sha256).digest()
+        signature = base64.b64encode(signature_sha).decode('utf-8')
+        authorization_origin = f'api_key="{self.api_key}",algorithm="hmac-sha256",headers="host date request-line",signature="{signature}"'
+        return base64.b64encode(authorization_origin.encode('utf-8')).decode('utf-8')
+
+    def _signed_url(self):
+        """返回带鉴权参数的URL，有效期内复用同一个签名"""
+        now = time.time()
+        cached = self._signature
+        if cached and cached[0] > now:
+            return cached[1]
+        with self._signature_lock:
+            cached = self._signature
+            if cached and cached[0] > now:
+                return cached[1]
+            # RFC1123格式的时间戳
+            date = format_date_time(now)
+            # 鉴权参数放入URL查询参数（参考demo.py的assemble_ws_auth_url）
+            auth_url = self.url + "?" + urllib.parse.urlencode({
+                "host": self.host,
+                "date": date,
+                "authorization": self._generate_signature(date)
+            })
+            self._signature = (now + SIGNATURE_TTL, auth_url)
+            return auth_url
+
+    def _build_body(self, image_data):
+        """构建请求体（参考demo.py：使用parameter和payload结构）
+        
+        图片的base64直接拼接为字节，不经过str和json.dumps，避免对整张图片多次复制。
+        """
+        template = json.dumps({
+            "header": {
+                "app_id": self.appid,
+                "status": 3
+            },
+            "parameter": {
+                "hh_ocr_recognize_doc": {
+                    "recognizeDocumentRes": {
+                        "encoding": "utf8",
+                        "compress": "raw",
+                        "format": "json"
+                    }
+                }
+            },
+            "payload": {
+                "image": {
+                    "encoding": "jpg",
+                    "image": IMAGE_PLACEHOLDER,
+                    "status": 3
+                }
+            }
+        }).encode('utf-8')
+        prefix, suffix = template.split(IMAGE_PLACEHOLDER.encode('utf-8'))
+        return b''.join((prefix, base64.b64encode(image_data), suffix))
+    
+    def recognize(self, image_data):
+        """识别一张JPEG图片，返回全文（whole_text）
+
+        配置不完整时抛出ValueError，请求失败或返回错误码时抛出异常。
+        """
+        if not self.configured:
+            raise ValueError('讯飞OCR API配置不完整，请检查环境变量')
+
+        body = self._build_body(image_data)
+        # 请求头使用小写header名，appid而不是X-Appid（参考demo.py）
+        headers = {
+            'content-type': "application/json",
+            'host': self.host,
+            'appid': self.appid
+        }
+        # URL中包含签名，日志只记录地址
+        logger.info('开始调用讯飞OCR API: %s，请求体 %d 字节', self.url, len(body))
+
+        with metrics.timed('ocr'):
+            response = self.session.post(self._signed_url(), data=body,
+                                         headers=headers, timeout=self.timeout)
+        logger.info('OCR响应状态码: %d', response.status_code)
+        if response.status_code in (401, 403):
+            # 签名被拒绝（例如本机时钟被调整），下一次请求重新签名
+            self._signature = None
+        elif response.status_code >= 500:
+            raise RuntimeError(f'OCR服务暂时不可用，状态码: {response.status_code}')
+
+        text = response.content.decode('utf8')
+        logger.debug('OCR响应内容: %s', Payload(text))
+        result = json.loads(text)
+        header = result.get('header', {})
+        if header.get('code') != 0:
+            raise RuntimeError(f"OCR调用失败，错误码: {header.get('code')}, 错误信息: {header.get('message') or result.get('message')}")
+
+        # 识别结果为Base64编码的JSON
+        decoded_result = str(base64.b64decode(result['payload']['recognizeDocumentRes']['text']), 'utf-8')
+        logger.debug('Base64解码后的识别结果: %s', Payload(decoded_result))
+        content = json.loads(decoded_result).get('whole_text', '')
+        logger.info('OCR识别成功，提取到 %d 个字符', len(content))
+        return content
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+测试异步讯飞星火客户端的并发限制与超时
+"""
+
+import json
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import websockets
+
+from services.async_xunfei_api import AsyncXunfeiAPI
+
+
+@pytest.fixture
+def fake_spark():
+    """启动本地WebSocket服务，收到请求后延迟state['delay']秒返回最终响应，测试结束后关闭"""
+    state = {'active': 0, 'peak': 0, 'delay': 0.3}
+    ready = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    async def handler(ws):
+        await ws.recv()
+        state['active'] += 1
+        state['peak'] = max(state['peak'], state['active'])
+        await asyncio.sleep(state['delay'])
+        state['active'] -= 1
+        await ws.send(json.dumps({
+            'header': {'code': 0, 'status': 2},
+            'payload': {'choices': {'text': [{'role': 'assistant', 'content': '批改完成'}]}}
+        }))
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        try:
+            state['server'] = loop.run_until_complete(websockets.serve(handler, '127.0.0.1', 0))
+            state['port'] = state['server'].sockets[0].getsockname()[1]
+        except Exception as e:
+            state['error'] = e
+        finally:
+            ready.set()
+        if 'server' in state:
+            loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait(5)
+    if 'error' in state:
+        raise state['error']
+
+    yield state
+
+    async def shutdown():
+        state['server'].close()
+        await state['server'].wait_closed()
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def make_client(state, **kwargs):
+    client = AsyncXunfeiAPI(**kwargs)
+    client._build_ws_url = lambda: f"ws://127.0.0.1:{state['port']}"
+    return client
+
+
+def test_concurrent_gradings_respect_limit(fake_spark):
+    """多个线程同时批改时并发执行，且不超过并发上限"""
+    client = make_client(fake_spark, max_concurrency=4)
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(client._request_essay, ['essay'] * 8))
+    elapsed = time.time() - started
+
+    assert all(result['feedback'] == '批改完成' for result in results)
+    assert fake_spark['peak'] == 4
+    # 8个请求、并发4、每个0.3秒，应约0.6秒完成而不是串行的2.4秒
+    assert elapsed < 1.5
+
+
+def test_timeout_falls_back_to_default_result(fake_spark):
+    """超过单次超时时间后抛出带说明的超时异常，check_essay返回默认结果"""
+    fake_spark['delay'] = 1
+    client = make_client(fake_spark, timeout=0.2)
+
+    with pytest.raises(TimeoutError, match='0.2 秒'):
+        client._request_essay('essay')
+    assert client.check_essay('essay') == client._default_result('essay')
+
+
+def test_iter_frames_streams_through_background_loop(fake_spark):
+    """流式接口通过后台事件循环逐帧返回，结束后可正常解析"""
+    fake_spark['delay'] = 0
+    client = make_client(fake_spark)
+
+    events = list(client.stream_essay('essay'))
+    assert [event['type'] for event in events] == ['delta', 'result']
+    assert events[-1]['result']['feedback'] == '批改完成'
+
+
+def test_closed_loop_is_replaced_with_new_semaphore(fake_spark):
+    """后台事件循环被关闭后，下一次批改启动新循环并使用新的信号量"""
+    fake_spark['delay'] = 0
+    client = make_client(fake_spark, max_concurrency=2)
+    assert client._request_essay('essay')['feedback'] == '批改完成'
+
+    loop, semaphore = client._loop, client._semaphore
+    loop.call_soon_threadsafe(loop.stop)
+    while loop.is_running():
+        time.sleep(0.01)
+    loop.close()
+
+    assert client._request_essay('essay')['feedback'] == '批改完成'
+    assert client._loop is not loop and client._semaphore is not semaphore
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+测试批量批改服务
+"""
+
+import time
+import threading
+
+from services.batch_service import BatchService
+
+
+class FakeAPI:
+    """记录调用次数，每次批改耗时0.2秒"""
+
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def check_essay(self, content):
+        with self.lock:
+            self.calls.append(content)
+        time.sleep(0.2)
+        return {'feedback': f'graded: {content.strip()}'}
+
+
+class FakeHistory:
+    def __init__(self):
+        self.items = []
+
+    def add_history(self, content, result, input_type='text'):
+        self.items.append(content)
+        return {'id': len(self.items)}
+
+
+def test_batch_dedupes_and_runs_in_parallel():
+    """相同作文只批改一次，不同作文并行批改，结果按原顺序返回"""
+    api = FakeAPI()
+    service = BatchService(api, FakeHistory(), max_workers=4)
+    essays = [{'content': 'Essay A'}, {'content': 'Essay B'}, {'content': ' Essay  A '}, {'content': 'Essay C'}]
+
+    started = time.time()
+    batch = service.submit(essays)
+    assert batch['status'] == 'running'
+    assert (batch['total'], batch['unique']) == (4, 3)
+
+    streamed = list(service.iter_results(batch['batch_id'], timeout=5))
+    elapsed = time.time() - started
+
+    assert sorted(item['index'] for item in streamed) == [0, 1, 2, 3]
+    assert len(api.calls) == 3
+    assert elapsed < 0.5
+
+    result = service.get_batch(batch['batch_id'])
+    assert result['status'] == 'completed'
+    assert result['items'][2]['result'] == {'feedback': 'graded: Essay A'}
+    assert result['items'][1]['name'] == 'essay-2'
+
+
+def test_degraded_result_marks_item_failed():
+    """星火失败时check_essay返回降级结果，该作文标记为failed且不保存历史记录"""
+
+    class DegradedAPI:
+        def check_essay(self, content):
+            if 'fail' in content:
+                return {'feedback': '批改服务暂时不可用', 'detailed_errors': [], 'degraded': True}
+            return {'feedback': 'ok'}
+
+    history = FakeHistory()
+    service = BatchService(DegradedAPI(), history, max_workers=2)
+    batch = service.submit([{'content': 'please fail'}, {'content': 'fine'}])
+    list(service.iter_results(batch['batch_id'], timeout=5))
+
+    items = service.get_batch(batch['batch_id'])['items']
+    assert [item['status'] for item in items] == ['failed', 'completed']
+    assert items[0]['result']['degraded'] is True
+    assert items[0]['history_id'] is None
+    assert history.items == ['fine']
+
+
+def test_unknown_batch():
+    service = BatchService(FakeAPI(), FakeHistory(), max_workers=1)
+    assert service.get_batch('missing') is None
+    assert list(service.iter_results('missing')) == []
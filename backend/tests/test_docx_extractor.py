@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试流式Word文档提取：段落、表格、文本框，以及字符数上限
+"""
+
+import io
+import zipfile
+
+import pytest
+from docx import Document
+
+from services.docx_extractor import DocumentTooLongError, extract_docx_text
+
+W = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+
+
+def make_docx(body):
+    """用给定的 w:body 内容构造最小的.docx"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('word/document.xml', (
+            f'<?xml version="1.0" encoding="UTF-8"?>'
+            f'<w:document xmlns:w="{W}" xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006">'
+            f'<w:body>{body}</w:body></w:document>'
+        ))
+    buffer.seek(0)
+    return buffer
+
+
+def paragraph(text):
+    return f'<w:p><w:r><w:t xml:space="preserve">{text}</w:t></w:r></w:p>'
+
+
+def test_matches_python_docx_for_paragraphs_and_adds_tables():
+    document = Document()
+    document.add_paragraph('My Summer Holiday')
+    document.add_paragraph('')
+    run_paragraph = document.add_paragraph('Last summer I ')
+    run_paragraph.add_run('go to the beach.')
+    table = document.add_table(rows=1, cols=2)
+    table.cell(0, 0).text = 'I swimmed in the sea.'
+    table.cell(0, 1).text = 'It were fun.'
+    buffer = io.BytesIO()
+    document.save(buffer)
+    buffer.seek(0)
+
+    assert extract_docx_text(buffer) == (
+        'My Summer Holiday\nLast summer I go to the beach.\nI swimmed in the sea.\nIt were fun.'
+    )
+
+
+def test_text_box_is_extracted_once():
+    """文本框的VML备用内容（mc:Fallback）不重复提取"""
+    textbox = paragraph('Essay in a text box.')
+    body = (
+        paragraph('Title')
+        + '<w:p><w:r><mc:AlternateContent>'
+        + f'<mc:Choice Requires="wps"><w:drawing><w:txbxContent>{textbox}</w:txbxContent></w:drawing></mc:Choice>'
+        + f'<mc:Fallback><w:pict><w:txbxContent>{textbox}</w:txbxContent></w:pict></mc:Fallback>'
+        + '</mc:AlternateContent></w:r></w:p>'
+        + '<w:p><w:r><w:t>Line one</w:t><w:br/><w:t>line two</w:t><w:tab/><w:t>end</w:t></w:r></w:p>'
+    )
+    assert extract_docx_text(make_docx(body)) == 'Title\nEssay in a text box.\nLine one\nline two\tend'
+
+
+def test_character_limit_stops_parsing_early():
+    """超过上限时立即拒绝：后面损坏的XML不会被解析到"""
+    body = paragraph('a' * 60) + paragraph('b' * 60) + '<w:p><w:r><w:t>broken'
+    with pytest.raises(DocumentTooLongError):
+        extract_docx_text(make_docx(body), max_chars=100)
+    assert extract_docx_text(make_docx(paragraph('a' * 60) + paragraph('b' * 39)), max_chars=100)
+
+
+def test_invalid_document_raises_value_error():
+    with pytest.raises(ValueError, match='无法解析'):
+        extract_docx_text(io.BytesIO(b'not a zip file'))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试长作文分段批改：切分边界、结果合并的顺序和位置，以及片段缓存
+"""
+
+from services.essay_chunker import merge_results, split_essay
+from services.grading_cache import GradingCache
+from services.xunfei_api import XunfeiAPI
+
+
+def result_for(text, errors=(), suggestions=('多用连接词',)):
+    return {
+        'feedback': '',
+        'suggestions': list(suggestions),
+        'grammar_errors': [],
+        'detailed_errors': [dict(error) for error in errors],
+        'corrected_text': text.replace('goes', 'go'),
+    }
+
+
+def test_split_prefers_paragraphs_then_sentences():
+    first = 'I goes to school. ' * 3
+    essay = f'{first.strip()}\n\n  Short one.\n' + 'It were fun. ' * 10
+    segments = split_essay(essay, 70)
+
+    assert all(len(segment['text']) <= 70 for segment in segments)
+    assert all(essay[segment['start']:segment['end']] == segment['text'] for segment in segments)
+    # 第一段和第二段合在一起不超过上限；第三段过长，按句子切开
+    assert segments[0]['text'] == first.strip() + '\n\n  Short one.'
+    assert all(segment['text'].endswith('fun.') for segment in segments[1:])
+    assert ''.join(segment['text'] for segment in segments).replace(' ', '').replace('\n', '') == \
+        essay.replace(' ', '').replace('\n', '')
+
+
+def test_overlong_sentence_is_split_on_whitespace():
+    segments = split_essay('word ' * 30, 22)
+    assert [segment['text'] for segment in segments][0] == 'word word word word'
+    assert all(len(segment['text']) <= 22 for segment in segments)
+
+
+def test_merge_orders_errors_and_keeps_separators():
+    essay = 'He goes home. She goes out.\nThey goes away.'
+    segments = split_essay(essay, 30)
+    results = [
+        result_for(segments[0]['text'], [{'original': 'She goes'}, {'original': 'He goes'}, {'original': '?'}]),
+        result_for(segments[1]['text'], [{'original': 'They goes'}], suggestions=('多用连接词', '注意时态')),
+    ]
+    merged = merge_results(essay, segments, results)
+
+    assert [(error['original'], error['segment'], error['start'], error['end'])
+            for error in merged['detailed_errors']] == [
+        ('He goes', 0, 0, 7), ('She goes', 0, 14, 22), ('?', 0, None, None), ('They goes', 1, 28, 37)]
+    assert 'offset' not in merged['detailed_errors'][0]
+    assert merged['corrected_text'] == 'He go home. She go out.\nThey go away.'
+    assert merged['suggestions'] == ['多用连接词', '注意时态']
+
+
+def test_check_essay_grades_segments_and_reuses_segment_cache(monkeypatch):
+    monkeypatch.setenv('SPARK_CHUNK_CHARS', '40')
+    api = XunfeiAPI(cache=GradingCache())
+    graded = []
+
+    def request(text, prompt=None):
+        graded.append(text)
+        if 'fail' in text:
+            raise RuntimeError('讯飞API返回错误，错误码: 10013')
+        return result_for(text, [{'original': line.split()[0] + ' goes'} for line in text.split('\n')])
+
+    api._request_essay = request
+    essay = 'Tom goes to school.\nAnn goes to work.\nBob goes to bed.'
+    result = api.check_essay(essay)
+    assert len(graded) == 2
+    assert result['corrected_text'] == essay.replace('goes', 'go')
+    assert [error['start'] for error in result['detailed_errors']] == [0, 20, 38]
+    assert all('offset' not in error for error in result['detailed_errors'])
+
+    # 修改最后一段后重新提交：未变化的片段命中缓存
+    graded.clear()
+    result = api.check_essay(essay.replace('Bob goes to bed.', 'Bob fail to sleep.'))
+    assert graded == ['Bob fail to sleep.']
+    assert result['failed_segments'] == [1]
+    assert result['corrected_text'].endswith('Bob fail to sleep.')
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+测试批改结果缓存
+"""
+
+from services.grading_cache import GradingCache, normalize_essay
+from services.xunfei_api import XunfeiAPI, PROMPT_TEMPLATE, CHAT_PARAMETERS
+
+
+def test_key_ignores_whitespace_but_not_parameters():
+    """空白差异不影响缓存键，模型参数或提示词不同则缓存键不同"""
+    key = GradingCache.make_key('I  has a pen.\r\n\r\n\r\nIt is red. ', PROMPT_TEMPLATE, CHAT_PARAMETERS)
+    assert key == GradingCache.make_key('I has a pen.\n\nIt is red.', PROMPT_TEMPLATE, CHAT_PARAMETERS)
+    assert key != GradingCache.make_key('i has a pen.\n\nIt is red.', PROMPT_TEMPLATE, CHAT_PARAMETERS)
+    assert key != GradingCache.make_key('I has a pen.\n\nIt is red.', PROMPT_TEMPLATE, dict(CHAT_PARAMETERS, temperature=0.5))
+    assert normalize_essay(' a \t b \n') == 'a b'
+
+
+def test_lru_ttl_and_counters():
+    """LRU淘汰、TTL过期与命中统计"""
+    cache = GradingCache(max_entries=2, ttl=60)
+    cache.set('a', {'feedback': 'A'})
+    cache.set('b', {'feedback': 'B'})
+    assert cache.get('a') == {'feedback': 'A'}
+    cache.set('c', {'feedback': 'C'})
+    assert cache.get('b') is None
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+    cache.ttl = -1
+    cache.set('d', {'feedback': 'D'})
+    assert cache.get('d') is None
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """磁盘层在进程重启（新实例）后仍可命中"""
+    path = str(tmp_path / 'cache.db')
+    GradingCache(disk_path=path).set('k', {'feedback': 'cached'})
+    cache = GradingCache(disk_path=path)
+    assert cache.get('k') == {'feedback': 'cached'}
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_check_essay_uses_cache_and_skips_failures():
+    """命中缓存时不再调用星火API，失败的默认结果不写入缓存"""
+    calls = []
+    api = XunfeiAPI(cache=GradingCache())
+
+    def fake_request(content):
+        calls.append(content)
+        if len(calls) == 1:
+            raise ConnectionError('network down')
+        return {'feedback': 'ok', 'detailed_errors': []}
+
+    api._request_essay = fake_request
+    assert api.check_essay('My essay.') == api._default_result('My essay.')
+    assert api.check_essay('My essay.')['feedback'] == 'ok'
+    assert api.check_essay('  My essay. ')['feedback'] == 'ok'
+    assert len(calls) == 2
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+测试历史记录服务及其存储后端
+"""
+
+import json
+import random
+import threading
+import multiprocessing
+from datetime import datetime, timedelta
+
+import pytest
+
+from services.history_service import HistoryService
+from services.history_storage import AppendLogHistoryStorage, SQLiteHistoryStorage
+
+
+@pytest.fixture(params=['sqlite', 'log'])
+def storage_factory(request, tmp_path):
+    """分别使用SQLite和追加日志两种后端"""
+    def factory():
+        if request.param == 'sqlite':
+            return SQLiteHistoryStorage(str(tmp_path / 'history.db'))
+        return AppendLogHistoryStorage(str(tmp_path / 'history.log'))
+    return factory
+
+
+def test_add_delete_and_reload(storage_factory, tmp_path):
+    """增删记录后重新打开存储，数据保持一致"""
+    service = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+    first = service.add_history('essay one', {'feedback': 'a'})
+    second = service.add_history('essay two', {'feedback': 'b'}, 'word')
+    assert (first['id'], second['id']) == (1, 2)
+
+    assert service.delete_history(first['id']) is True
+    assert service.delete_history(first['id']) is False
+    third = service.add_history('essay three', {'feedback': 'c'})
+    assert third['id'] == 3
+
+    reopened = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+    assert [item['id'] for item in reopened.history] == [2, 3]
+    assert reopened.get_history_by_id(2)['type'] == 'word'
+
+    assert reopened.clear_history() is True
+    assert HistoryService(str(tmp_path / 'history.json'), storage=storage_factory()).history == []
+
+
+def test_ids_are_never_reused(storage_factory, tmp_path):
+    """删除最新记录或清空后，新记录也不会复用旧ID"""
+    service = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+    service.add_history('essay one', {})
+    newest = service.add_history('essay two', {})
+    service.delete_history(newest['id'])
+    assert service.add_history('essay three', {})['id'] == 3
+
+    service.clear_history()
+    reopened = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+    assert reopened.add_history('essay four', {})['id'] == 4
+
+
+def test_concurrent_add_history(storage_factory, tmp_path):
+    """多线程同时添加记录时不丢失、不产生重复ID"""
+    service = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+
+    def worker():
+        for _ in range(20):
+            assert service.add_history('essay', {}) is not None
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    ids = [item['id'] for item in service.storage.load()]
+    assert len(ids) == 160
+    assert len(set(ids)) == 160
+
+
+def test_migrate_legacy_json(storage_factory, tmp_path):
+    """首次启动时从旧版history.json迁移，之后不再重复导入"""
+    legacy = [
+        {'id': 1, 'content': 'old', 'result': {}, 'type': 'text', 'created_at': '2026-01-01 10:00:00'},
+        {'id': 2, 'content': 'older', 'result': {}, 'type': 'text', 'created_at': '2026-01-02 10:00:00'},
+    ]
+    json_path = tmp_path / 'history.json'
+    json_path.write_text(json.dumps(legacy), encoding='utf-8')
+
+    service = HistoryService(str(json_path), storage=storage_factory())
+    assert [item['id'] for item in service.history] == [1, 2]
+
+    service.clear_history()
+    assert HistoryService(str(json_path), storage=storage_factory()).history == []
+
+
+def test_failed_migration_is_retried(storage_factory, tmp_path):
+    """旧版文件损坏导致迁移失败时，修复后下次启动会重新迁移"""
+    json_path = tmp_path / 'history.json'
+    json_path.write_text('[{"id": 1,', encoding='utf-8')
+    assert HistoryService(str(json_path), storage=storage_factory()).history == []
+
+    legacy = [{'id': 7, 'content': 'old', 'result': {}, 'type': 'text', 'created_at': '2026-01-01 10:00:00'}]
+    json_path.write_text(json.dumps(legacy), encoding='utf-8')
+    service = HistoryService(str(json_path), storage=storage_factory())
+    assert [item['id'] for item in service.history] == [7]
+    assert service.add_history('new', {})['id'] == 8
+
+
+def test_instances_sharing_storage_stay_in_sync(storage_factory, tmp_path):
+    """两个实例（相当于两个worker进程）共享同一个存储文件时，ID不冲突且能看到对方的变更"""
+    first = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+    second = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+
+    a = first.add_history('from first', {})
+    b = second.add_history('from second', {})
+    assert (a['id'], b['id']) == (1, 2)
+    assert {item['id'] for item in first.get_history()} == {1, 2}
+    assert first.get_history_by_id(2)['content'] == 'from second'
+
+    assert second.delete_history(1) is True
+    assert first.get_history_by_id(1) is None
+    assert [item['id'] for item in first.history] == [2]
+
+    first.clear_history()
+    c = second.add_history('after clear', {})
+    assert c['id'] == 3
+    assert [item['id'] for item in first.history] == [3]
+    assert [item['id'] for item in second.history] == [3]
+
+
+def test_revisions_are_linked_across_instances(storage_factory, tmp_path):
+    """修改稿通过parent_id归入同一篇作文，重新打开或其他实例都能查到全部修订"""
+    first = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+    draft = first.add_history('draft', {})
+    other = first.add_history('another essay', {})
+    second_draft = first.add_history('draft v2', {}, parent_id=draft['id'])
+
+    second = HistoryService(str(tmp_path / 'history.json'), storage=storage_factory())
+    third_draft = second.add_history('draft v3', {}, parent_id=second_draft['id'])
+    assert third_draft['essay_id'] == draft['id']
+
+    assert [item['id'] for item in first.get_revisions(draft['id'])] == [1, 3, 4]
+    assert [item['id'] for item in first.get_revisions(third_draft['id'])] == [1, 3, 4]
+    assert [item['id'] for item in second.get_revisions(other['id'])] == [2]
+    assert first.get_revisions(99) is None
+
+    # 删除中间的版本后，其余版本仍属于同一篇作文
+    assert first.delete_history(second_draft['id']) is True
+    assert [item['id'] for item in second.get_revisions(draft['id'])] == [1, 4]
+
+
+def add_from_process(backend, directory, count):
+    """子进程：向共享存储添加count条记录"""
+    if backend == 'sqlite':
+        storage = SQLiteHistoryStorage(str(directory / 'history.db'))
+    else:
+        storage = AppendLogHistoryStorage(str(directory / 'history.log'))
+    service = HistoryService(str(directory / 'history.json'), storage=storage)
+    for i in range(count):
+        assert service.add_history(f'essay {i}', {}) is not None
+
+
+@pytest.mark.parametrize('backend', ['sqlite', 'log'])
+def test_multiple_processes_share_ids(backend, tmp_path):
+    """多个进程同时写入同一个存储，记录不丢失、ID不重复"""
+    context = multiprocessing.get_context('spawn')
+    processes = [context.Process(target=add_from_process, args=(backend, tmp_path, 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+    if backend == 'sqlite':
+        storage = SQLiteHistoryStorage(str(tmp_path / 'history.db'))
+    else:
+        storage = AppendLogHistoryStorage(str(tmp_path / 'history.log'))
+    ids = [item['id'] for item in storage.load()]
+    assert sorted(ids) == list(range(1, 101))
+
+
+def test_append_log_compaction(tmp_path):
+    """失效日志过多时自动压缩日志文件"""
+    storage = AppendLogHistoryStorage(str(tmp_path / 'history.log'))
+    storage.COMPACT_THRESHOLD = 4
+    service = HistoryService(str(tmp_path / 'history.json'), storage=storage)
+    for i in range(5):
+        service.add_history(f'essay {i}', {})
+    for history_id in (1, 2, 3):
+        service.delete_history(history_id)
+
+    with open(storage.log_path, encoding='utf-8') as f:
+        lines = f.readlines()
+    # 一行ID高水位 + 两条有效记录
+    assert len(lines) == 3
+    assert json.loads(lines[0]) == {'op': 'meta', 'last_id': 5}
+    assert [item['id'] for item in storage.load()] == [4, 5]
+
+
+def test_append_log_compaction_seen_by_other_instance(tmp_path):
+    """其他实例压缩（替换）日志文件后，本实例重新加载且ID继续递增"""
+    other_storage = AppendLogHistoryStorage(str(tmp_path / 'history.log'))
+    other_storage.COMPACT_THRESHOLD = 2
+    other = HistoryService(str(tmp_path / 'history.json'), storage=other_storage)
+    service = HistoryService(str(tmp_path / 'history.json'),
+                             storage=AppendLogHistoryStorage(str(tmp_path / 'history.log')))
+    for i in range(4):
+        service.add_history(f'essay {i}', {})
+    for history_id in (1, 2, 3):
+        other.delete_history(history_id)
+
+    assert [item['id'] for item in service.history] == [4]
+    assert service.add_history('after compaction', {})['id'] == 5
+    assert [item['id'] for item in other.history] == [4, 5]
+
+
+def legacy_filter(items, filter_type, now):
+    """旧版 get_history 的筛选与排序逻辑，用于对照"""
+    result = []
+    for item in items:
+        days = (now - datetime.strptime(item['created_at'], '%Y-%m-%d %H:%M:%S')).days
+        if (filter_type == 'all' or (filter_type == 'today' and days == 0)
+                or (filter_type == '3days' and days <= 3) or (filter_type == 'week' and days <= 7)):
+            result.append(item)
+    result.sort(key=lambda x: x['created_at'], reverse=True)
+    return result
+
+
+def test_indexed_filters_match_legacy_scan(tmp_path):
+    """按时间索引筛选的结果与旧版逐条解析、排序的结果一致"""
+    now = datetime.now().replace(microsecond=0)
+    random.seed(7)
+    legacy = []
+    for history_id in range(1, 301):
+        created_at = now - timedelta(hours=random.randint(-30, 24 * 12), minutes=random.choice([0, 30]))
+        legacy.append({'id': history_id, 'content': '', 'result': {}, 'type': 'text',
+                       'created_at': created_at.strftime('%Y-%m-%d %H:%M:%S')})
+    json_path = tmp_path / 'history.json'
+    json_path.write_text(json.dumps(legacy), encoding='utf-8')
+    service = HistoryService(str(json_path), storage=SQLiteHistoryStorage(str(tmp_path / 'history.db')))
+
+    for filter_type in ('all', 'today', '3days', 'week'):
+        expected = [item['id'] for item in legacy_filter(legacy, filter_type, datetime.now())]
+        assert [item['id'] for item in service.get_history(filter_type)] == expected
+
+    service.delete_history(150)
+    assert service.get_history_by_id(150) is None
+    assert 150 not in [item['id'] for item in service.get_history('all')]
+
+
+def test_paginated_summaries(tmp_path):
+    """按游标分页返回摘要，翻完所有页后与完整列表一致"""
+    service = HistoryService(str(tmp_path / 'history.json'), storage=SQLiteHistoryStorage(str(tmp_path / 'history.db')))
+    for i in range(7):
+        service.add_history(f'essay {i} ' + 'x' * 200, {'detailed_errors': [{}] * i})
+
+    pages = []
+    before = None
+    cursors = []
+    while True:
+        page = service.get_history_page('all', limit=3, before=before)
+        pages.append([item['id'] for item in page['items']])
+        assert page['total'] == 7
+        before = page['next_before']
+        if before is None:
+            break
+        cursors.append(before)
+    assert [len(ids) for ids in pages] == [3, 3, 1]
+    ordered = [item['id'] for item in service.get_history('all')]
+    assert sum(pages, []) == ordered
+
+    summary = service.summarize(service.get_history_by_id(7))
+    assert summary == {'id': 7, 'type': 'text', 'created_at': summary['created_at'],
+                       'preview': ('essay 6 ' + 'x' * 200)[:100], 'error_count': 6}
+
+    # 删除上一页的最后一条记录（即游标对应的记录）后，仍可从游标处继续翻页
+    service.delete_history(ordered[2])
+    assert [item['id'] for item in service.get_history_page('all', limit=3, before=cursors[0])['items']] == ordered[3:6]
+    assert service.get_history_page('all', limit=3, before='not-a-cursor') is None
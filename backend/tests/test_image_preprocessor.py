@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+测试OCR图片预处理：EXIF旋转、灰度、缩放和JPEG编码
+"""
+
+import io
+from tempfile import SpooledTemporaryFile
+
+import pytest
+from PIL import Image
+
+from services.image_preprocessor import ImagePreprocessor, preprocess_image
+
+
+def encode(image, fmt, **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **kwargs)
+    return buffer.getvalue()
+
+
+def test_large_photo_is_rotated_downscaled_and_grayscale():
+    """竖拍照片按EXIF方向旋转，缩小到长边上限，输出灰度JPEG"""
+    image = Image.new('RGB', (4000, 3000), (200, 180, 160))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # 顺时针旋转90度
+    data = encode(image, 'JPEG', quality=95, exif=exif)
+
+    processed, stats = preprocess_image(data, max_side=2048)
+    with Image.open(io.BytesIO(processed)) as result:
+        assert result.format == 'JPEG'
+        assert result.mode == 'L'
+        assert result.size == (1536, 2048)
+    assert stats['original_size'] == (4000, 3000)
+    assert stats['saved_bytes'] == len(data) - len(processed) > 0
+
+
+def test_png_with_transparency_is_reencoded_as_jpeg():
+    """PNG/GIF等格式统一重新编码为JPEG，透明区域按白色处理"""
+    image = Image.new('RGBA', (300, 200), (0, 0, 0, 0))
+    processed, stats = preprocess_image(encode(image, 'PNG'))
+    with Image.open(io.BytesIO(processed)) as result:
+        assert result.format == 'JPEG'
+        assert result.getpixel((10, 10)) > 250
+    assert stats['format'] == 'PNG'
+
+
+def test_small_jpeg_is_kept_when_reencoding_does_not_help():
+    data = encode(Image.effect_noise((64, 64), 80), 'JPEG', quality=30)
+    processed, stats = preprocess_image(data)
+    assert processed == data
+    assert stats['saved_bytes'] == 0
+
+
+def test_process_many_keeps_order_and_rejects_invalid_images():
+    preprocessor = ImagePreprocessor(max_workers=2, max_side=100)
+    images = [encode(Image.new('RGB', (100 + i * 100, 50), 'white'), 'PNG') for i in range(3)]
+    results = preprocessor.process_many(images)
+    assert [stats['original_size'] for _, stats in results] == [(100, 50), (200, 50), (300, 50)]
+
+    with pytest.raises(Exception):
+        preprocessor.process(b'not an image')
+
+
+def test_accepts_spooled_upload_stream():
+    """上传文件的流（已转存到临时文件）直接解码，结果与传入字节相同"""
+    data = encode(Image.new('RGB', (3000, 1000), (90, 120, 150)), 'PNG')
+    with SpooledTemporaryFile(max_size=1024, mode='rb+') as stream:
+        stream.write(data)
+        assert stream._rolled
+        processed, stats = preprocess_image(stream)
+    assert bytes(processed) == bytes(preprocess_image(data)[0])
+    assert stats['original_bytes'] == len(data)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试持久化任务队列
+"""
+
+import time
+
+from services.job_queue import JobQueue
+
+
+def test_submit_and_run(tmp_path):
+    """提交的任务由worker执行，结果可通过任务ID查询"""
+    queue = JobQueue(str(tmp_path / 'jobs.db'), poll_interval=0.05)
+    queue.register('double', lambda payload: {'value': payload['value'] * 2})
+    queue.register('boom', lambda payload: 1 / 0)
+    job_id = queue.submit('double', {'value': 21})
+    failed_id = queue.submit('boom', {})
+    assert queue.get(job_id)['status'] == 'queued'
+
+    queue.start(2)
+    deadline = time.time() + 5
+    while time.time() < deadline and queue.get(failed_id)['status'] != 'failed':
+        time.sleep(0.05)
+    queue.stop(5)
+
+    assert queue.get(job_id)['status'] == 'completed'
+    assert queue.get(job_id)['result'] == {'value': 42}
+    assert 'division by zero' in queue.get(failed_id)['error']
+    assert queue.get('missing') is None
+
+
+def test_jobs_survive_restart(tmp_path):
+    """worker中途退出后，租约过期的任务会被新进程重新领取执行"""
+    path = str(tmp_path / 'jobs.db')
+    crashed = JobQueue(path, lease_seconds=0.1)
+    job_id = crashed.submit('echo', {'text': 'hello'})
+    assert crashed.claim('dead-worker')['job_id'] == job_id
+    assert crashed.get(job_id)['status'] == 'running'
+
+    time.sleep(0.2)
+    restarted = JobQueue(path)
+    restarted.register('echo', lambda payload: payload)
+    assert restarted.run_once('new-worker') is True
+    job = restarted.get(job_id)
+    assert job['status'] == 'completed'
+    assert job['attempts'] == 2
+    assert job['result'] == {'text': 'hello'}
+
+
+def test_running_job_lease_is_renewed(tmp_path):
+    """执行时间超过租约的任务会被续租，其他worker不会重复领取"""
+    path = str(tmp_path / 'jobs.db')
+    queue = JobQueue(path, lease_seconds=0.3)
+    other = JobQueue(path, lease_seconds=0.3)
+    claimed_by_other = []
+
+    def slow(payload):
+        for _ in range(5):
+            time.sleep(0.2)
+            claimed_by_other.append(other.claim('other-worker'))
+        return {'done': True}
+
+    queue.register('slow', slow)
+    job_id = queue.submit('slow', {})
+    assert queue.run_once('worker')
+    assert claimed_by_other == [None] * 5
+    assert queue.get(job_id)['status'] == 'completed'
+    assert queue.get(job_id)['attempts'] == 1
+
+
+def test_finished_jobs_are_pruned(tmp_path):
+    """超过保留时长的已结束任务被删除，排队中的任务保留"""
+    queue = JobQueue(str(tmp_path / 'jobs.db'), retention_seconds=60)
+    queue.register('echo', lambda payload: payload)
+    done_id = queue.submit('echo', {'text': 'hi'})
+    assert queue.run_once('worker')
+    queued_id = queue.submit('echo', {'text': 'later'})
+
+    assert queue.prune() == 0
+    assert queue.prune(now=time.time() + 120) == 1
+    assert queue.get(done_id) is None
+    assert queue.get(queued_id)['status'] == 'queued'
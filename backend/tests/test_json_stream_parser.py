@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+测试增量式错误提取器
+"""
+
+import json
+import os
+
+import pytest
+
+from services.json_stream_parser import IncrementalErrorExtractor
+from services.response_parser import ResponseParser
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'spark_responses.jsonl')
+
+with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+    CORPUS = [json.loads(line) for line in f if line.strip()]
+
+
+def test_emits_each_error_as_soon_as_it_closes():
+    """错误对象在右括号到达时立即返回，字符串中的括号和转义不影响判断"""
+    extractor = IncrementalErrorExtractor()
+    chunks = ['以下是批改：\n``', '`json\n{"errors": [{"original": "a}\\"", ', '"corrected": "b"}', ', {"original": "c"',
+              '}], "corrected_text": "{x}"}\n```']
+    emitted = [extractor.feed(chunk) for chunk in chunks]
+    assert emitted == [[], [], [{'original': 'a}"', 'corrected': 'b'}], [], [{'original': 'c'}]]
+    # JSON块结束后不再处理
+    assert extractor.feed('```json\n[{"original": "z"}]```') == []
+
+
+@pytest.mark.parametrize('record', CORPUS, ids=[record['name'] for record in CORPUS])
+def test_matches_full_parse_on_recorded_responses(record):
+    """逐帧喂入录制的响应，得到的错误与完整解析JSON块的结果一致"""
+    extractor = IncrementalErrorExtractor()
+    parser = ResponseParser()
+    for frame in record['frames']:
+        extractor.feed(parser.extract_text([frame]))
+
+    text = parser.extract_text(record['frames'])
+    if '```json' not in text:
+        assert extractor.errors == []
+        return
+    body = text.split('```json', 1)[1].split('```', 1)[0]
+    try:
+        content = json.loads(body)
+    except json.JSONDecodeError:
+        # 模型输出的JSON不合法时，仍能返回其中合法的错误对象
+        assert all(isinstance(error, dict) for error in extractor.errors)
+        return
+    expected = content['errors'] if isinstance(content, dict) else content
+    assert extractor.errors == expected
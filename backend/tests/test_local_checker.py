@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+测试本地拼写和语法检查：拼写索引、规则检查、与星火结果合并、降级结果
+"""
+
+import pytest
+
+from services.local_checker import LocalChecker, apply_corrections, merge_local_errors
+from services.spelling_index import DEFAULT_WORDS_PATH, SpellingIndex, osa_distance
+from services.xunfei_api import XunfeiAPI
+
+
+@pytest.fixture(scope='module')
+def checker(tmp_path_factory):
+    index_path = tmp_path_factory.mktemp('spelling') / 'words.idx'
+    return LocalChecker(SpellingIndex(DEFAULT_WORDS_PATH, str(index_path)))
+
+
+def found(checker, text):
+    return [(error['original'], error['corrected'], error['error_type']) for error in checker.check(text)]
+
+
+def test_spelling_suggestions(checker):
+    assert checker.spelling.suggest('recieve') == 'receive'
+    assert checker.spelling.suggest('teh') == 'the'
+    assert checker.spelling.suggest('xqzt') is None
+    assert osa_distance('abc', 'acb') == 1
+    # 专有名词和全大写缩写不检查拼写
+    assert found(checker, 'I met Jonh in the NYCC office.') == []
+    assert found(checker, 'My frend goed home.') == [('frend', 'friend', '拼写错误'), ('goed', 'went', '动词形式')]
+
+
+def test_index_is_reused(tmp_path):
+    index_path = tmp_path / 'words.idx'
+    SpellingIndex(DEFAULT_WORDS_PATH, str(index_path)).warm_up()
+    built_at = index_path.stat().st_mtime_ns
+    index = SpellingIndex(DEFAULT_WORDS_PATH, str(index_path))
+    assert index.suggest('becuase') == 'because'
+    assert index_path.stat().st_mtime_ns == built_at
+
+
+def test_grammar_rules(checker):
+    assert found(checker, 'She like music. They is happy. He were late.') == [
+        ('She like', 'She likes', '主谓一致'), ('They is', 'They are', '主谓一致'), ('He were', 'He was', '主谓一致'),
+    ]
+    assert found(checker, 'It is a apple and an book, not an hour or a university.') == [
+        ('a apple', 'an apple', '冠词'), ('an book', 'a book', '冠词'),
+    ]
+    assert found(checker, 'we went to the the park and i was happy.') == [
+        ('we', 'We', '大小写'), ('the the', 'the', '重复单词'), ('i', 'I', '大小写'),
+    ]
+    # 虚拟语气、情态动词和使役动词之后不报告
+    assert found(checker, 'If he were rich, he would help. Can she swim? I let him go. We had had lunch.') == []
+
+
+def test_merge_skips_errors_reported_by_model(checker):
+    text = 'I goes to scool. She like it.'
+    local = checker.check(text)
+    result = {'feedback': 'ok', 'detailed_errors': [{'original': 'I goes', 'corrected': 'I go'},
+                                                    {'original': 'scool', 'corrected': 'school'}]}
+    merged = merge_local_errors(text, result, local)
+    assert [(error['original'], error.get('source')) for error in merged['detailed_errors']] == [
+        ('I goes', None), ('scool', None), ('She like', 'local'),
+    ]
+    assert apply_corrections(text, local) == 'I go to school. She likes it.'
+
+
+def test_degraded_result_uses_local_errors(checker, monkeypatch):
+    monkeypatch.setenv('APPID', 'app')
+    monkeypatch.setenv('APIKey', 'key')
+    monkeypatch.setenv('APISecret', 'secret')
+    api = XunfeiAPI(local_checker=checker)
+
+    def broken(content, prompt=None):
+        raise ConnectionError('network down')
+
+    api._request_essay = broken
+    result = api.check_essay('She like apples.')
+    assert result['degraded'] is True
+    assert result['corrected_text'] == 'She likes apples.'
+    assert result['grammar_errors'] == ['主谓一致：1 处']
+    assert result['detailed_errors'][0]['source'] == 'local'
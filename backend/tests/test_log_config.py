@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+测试日志配置：延迟序列化的载荷、截断与请求关联ID
+"""
+
+import logging
+import threading
+
+import pytest
+
+from services import log_config
+from services.log_config import Payload, configure_logging, new_request_id, request_id_var, truncate
+
+
+class CountingValue:
+    """记录被序列化的次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __repr__(self):
+        self.calls += 1
+        return 'counting-value'
+
+
+@pytest.fixture
+def root_logger():
+    """configure_logging会替换根日志器的handler，测试结束后恢复"""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield root
+    log_config._stop_listener()
+    root.handlers = handlers
+    root.setLevel(level)
+
+
+def test_payload_is_serialized_only_when_emitted(root_logger, capsys):
+    """日志级别未开启时载荷不会被序列化"""
+    configure_logging('INFO')
+    value = CountingValue()
+    logger = logging.getLogger('test.payload')
+
+    logger.debug('payload: %s', Payload(value))
+    assert value.calls == 0
+
+    logger.info('payload: %s', Payload(value))
+    log_config._stop_listener()
+    assert value.calls == 1
+    assert 'payload: counting-value' in capsys.readouterr().err
+
+
+def test_truncate_keeps_prefix_and_length():
+    assert truncate('abcdef', 10) == 'abcdef'
+    assert truncate('abcdef', 3) == 'abc...(共6字符)'
+    assert truncate('abcdef', 0) == 'abcdef'
+    assert str(Payload({'text': '批改' * 10}, limit=12)) == '{"text": "批改...(共32字符)'
+
+
+def test_request_id_is_captured_in_logging_thread(root_logger, capsys):
+    """关联ID在产生日志的线程中读取，不同请求线程互不影响"""
+    configure_logging('INFO')
+    logger = logging.getLogger('test.request_id')
+
+    def handle(request_id):
+        new_request_id(request_id)
+        logger.info('handling %s', request_id)
+
+    threads = [threading.Thread(target=handle, args=(f'req-{i}',)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.info('outside request')
+    log_config._stop_listener()
+
+    lines = capsys.readouterr().err.splitlines()
+    for i in range(4):
+        assert any(f'[req-{i}] handling req-{i}' in line for line in lines)
+    assert any('[-] outside request' in line for line in lines)
+    assert request_id_var.get() == '-'
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+测试批改流程的耗时与错误码指标
+"""
+
+import pytest
+from prometheus_client import REGISTRY
+
+from services import metrics
+from services.xunfei_api import XunfeiAPI
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+def test_stage_timings_and_error_codes():
+    """解析耗时计入parse阶段，非0错误码按错误码计数"""
+    api = XunfeiAPI()
+    parsed = sample('essay_checker_stage_seconds_count', stage='parse')
+    errors = sample('essay_checker_spark_errors_total', code='10013')
+
+    api._process_response([{'header': {'code': 0, 'status': 2},
+                            'payload': {'choices': {'text': [{'content': '改进建议：多用连接词'}]}}}])
+    with pytest.raises(RuntimeError):
+        api._check_frame({'header': {'code': 10013, 'message': 'input content audit failed'}})
+
+    assert sample('essay_checker_stage_seconds_count', stage='parse') == parsed + 1
+    assert sample('essay_checker_spark_errors_total', code='10013') == errors + 1
+
+
+def test_timed_records_failures():
+    """代码块抛出异常时同样记录耗时"""
+    before = sample('essay_checker_stage_seconds_count', stage='test_failure')
+    with pytest.raises(ValueError):
+        with metrics.timed('test_failure'):
+            raise ValueError('boom')
+    assert sample('essay_checker_stage_seconds_count', stage='test_failure') == before + 1
+
+
+def test_render_metrics_exposes_histograms():
+    body, content_type = metrics.render_metrics()
+    assert content_type.startswith('text/plain')
+    assert b'essay_checker_stage_seconds_bucket' in body
+    assert b'essay_checker_spark_sessions_in_flight' in body
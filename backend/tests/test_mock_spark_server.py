@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+测试压测用的模拟星火服务：校验客户端生成的签名URL，并按帧回放录制的响应
+"""
+
+import asyncio
+import threading
+
+import pytest
+import websockets
+
+from benchmarks.mock_spark_server import MockSpark, load_corpus
+from services.xunfei_api import XunfeiAPI
+
+
+@pytest.fixture
+def mock_spark(monkeypatch):
+    monkeypatch.setenv('APPID', 'test-app')
+    monkeypatch.setenv('APIKey', 'test-key')
+    monkeypatch.setenv('APISecret', 'test-secret')
+    spark = MockSpark(load_corpus(), token_rate=0, latency=0, chunk_size=40, error_rate=0,
+                      error_code=10013, api_key='test-key', api_secret='test-secret')
+    state = {}
+    ready = threading.Event()
+    loop = asyncio.new_event_loop()
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        try:
+            state['server'] = loop.run_until_complete(
+                websockets.serve(spark.handler, '127.0.0.1', 0, process_request=spark.process_request))
+            state['port'] = state['server'].sockets[0].getsockname()[1]
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    ready.wait(5)
+    monkeypatch.setenv('SPARK_API_URL', f"ws://127.0.0.1:{state['port']}/v4.0/chat")
+
+    yield spark
+
+    async def shutdown():
+        state['server'].close()
+        await state['server'].wait_closed()
+
+    asyncio.run_coroutine_threadsafe(shutdown(), loop).result(5)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    loop.close()
+
+
+def test_signed_request_is_replayed(mock_spark):
+    """签名正确时按帧回放录制的响应"""
+    client = XunfeiAPI()
+    frames = list(client._iter_frames('I goes to school.'))
+
+    assert len(frames) > 1
+    assert frames[0]['header']['status'] == 0
+    assert frames[-1]['header']['status'] == 2
+    assert client.parser.extract_text(frames) in load_corpus()
+
+
+def test_bad_signature_is_rejected(mock_spark, monkeypatch):
+    """签名密钥错误时握手被拒绝"""
+    monkeypatch.setenv('APISecret', 'wrong-secret')
+
+    with pytest.raises(Exception):
+        list(XunfeiAPI()._iter_frames('I goes to school.'))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+测试多页作文OCR：各页并发识别、按页码拼接全文、PDF按页渲染
+"""
+
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from services.file_processor import FileProcessor
+from services.image_preprocessor import ImagePreprocessor
+
+
+def encode_png(shade):
+    buffer = io.BytesIO()
+    Image.new('RGB', (60, 40), (shade, shade, shade)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class StubOCRProcessor(FileProcessor):
+    """按图片灰度值返回页码文本，用于验证并发和拼接顺序"""
+
+    def __init__(self, fail_pages=(), **kwargs):
+        super().__init__(preprocessor=ImagePreprocessor(max_workers=0), **kwargs)
+        self.fail_pages = set(fail_pages)
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _ocr_page(self, image_data):
+        with Image.open(io.BytesIO(image_data)) as image:
+            page = round(image.getpixel((0, 0)) / 10)
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        # 前面的页识别得更慢，结果顺序不能依赖完成顺序
+        time.sleep(0.05 * (5 - page))
+        with self._lock:
+            self.active -= 1
+        return None if page in self.fail_pages else f' 第{page}页 \n'
+
+
+def test_pages_are_recognized_concurrently_and_joined_in_order():
+    processor = StubOCRProcessor(ocr_concurrency=4)
+    content = processor.process_images([encode_png(page * 10) for page in range(1, 5)])
+    assert content == '第1页\n第2页\n第3页\n第4页'
+    assert processor.max_active > 1
+
+
+def test_any_failed_page_fails_the_submission():
+    processor = StubOCRProcessor(fail_pages={2}, ocr_concurrency=4)
+    assert processor.process_images([encode_png(page * 10) for page in range(1, 4)]) is None
+
+
+def test_invalid_image_returns_none():
+    processor = StubOCRProcessor(ocr_concurrency=2)
+    assert processor.process_images([encode_png(10), b'not an image']) is None
+
+
+def test_render_pdf_returns_one_grayscale_jpeg_per_page():
+    buffer = io.BytesIO()
+    pages = [Image.new('RGB', (200, 280), 'white') for _ in range(3)]
+    pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:], resolution=72)
+
+    processor = FileProcessor(ocr_concurrency=1)
+    rendered = processor.render_pdf(buffer.getvalue())
+    assert len(rendered) == 3
+    with Image.open(io.BytesIO(rendered[0])) as image:
+        assert image.format == 'JPEG'
+        assert image.mode == 'L'
+
+    with pytest.raises(ValueError):
+        processor.render_pdf(buffer.getvalue(), max_pages=2)
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+测试单次扫描的星火响应解析器
+"""
+
+import json
+import os
+import logging
+
+import pytest
+
+from benchmarks.legacy_response_parser import LegacyResponseParser
+from services.response_parser import ResponseParser
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'fixtures', 'spark_responses.jsonl')
+
+with open(CORPUS_PATH, 'r', encoding='utf-8') as f:
+    CORPUS = [json.loads(line) for line in f if line.strip()]
+
+
+@pytest.mark.parametrize('record', CORPUS, ids=[record['name'] for record in CORPUS])
+def test_matches_legacy_parser(record, caplog):
+    """在录制的响应上与旧版解析器结果一致"""
+    caplog.set_level(logging.WARNING)
+    assert ResponseParser().parse(record['frames']) == LegacyResponseParser()._process_response(record['frames'])
+
+
+def test_text_sections():
+    """非JSON格式的各小节解析"""
+    text = ('语法错误：\nI goes → I go\n\n详细错误分析：\n原始: I goes\n修改: I go\n类型: 主谓一致\n解释: 用原形\n'
+            '修改后的文本：\nI go to school.\n\n评分：80\n改进建议：\n多用连接词\n')
+    result = ResponseParser().parse_text(text)
+    assert result['grammar_errors'] == ['I goes → I go']
+    assert result['detailed_errors'] == [
+        {'original': 'I goes', 'corrected': 'I go', 'error_type': '主谓一致', 'explanation': '用原形'}
+    ]
+    assert result['corrected_text'] == 'I go to school.'
+    assert result['suggestions'] == ['多用连接词']
+
+
+def test_structured_json_and_fallbacks():
+    """JSON对象包含errors字段时直接使用；无法解析时返回默认建议"""
+    text = '```json\n{"errors": [{"original": "a"}], "corrected_text": "b", "improvement_suggestions": ["c"]}\n```'
+    result = ResponseParser().parse_text(text)
+    assert result == {'feedback': '', 'suggestions': ['c'], 'grammar_errors': [],
+                      'detailed_errors': [{'original': 'a'}], 'corrected_text': 'b'}
+
+    result = ResponseParser().parse_text('```json\n{broken\n```')
+    assert result['suggestions'] == ['增强论点的说服力', '改善句子结构多样性', '增加具体例子']
+    assert result['detailed_errors'] == []
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+测试修改稿的增量批改：段落对比、只发送修改过的段落、结果拼接
+"""
+
+from services.grading_cache import GradingCache
+from services.revision_diff import diff_revision, splice_results
+from services.xunfei_api import XunfeiAPI
+
+OLD = 'I goes to school.\nMy teacher are kind.\nWe plays games.\nIt were fun.'
+OLD_RESULT = {
+    'feedback': 'old feedback',
+    'suggestions': ['注意主谓一致'],
+    'grammar_errors': [],
+    'detailed_errors': [
+        {'original': 'I goes', 'corrected': 'I go'},
+        {'original': 'teacher are', 'corrected': 'teacher is'},
+        {'original': 'We plays', 'corrected': 'We play'},
+        {'original': 'It were', 'corrected': 'It was'},
+    ],
+    'corrected_text': 'I go to school.\nMy teacher is kind.\nWe play games.\nIt was fun.',
+}
+
+
+def test_only_changed_paragraphs_are_regraded():
+    new = 'I goes to school.\nMy teachers is kind.\nWe plays games.\nIt were fun.'
+    plan = diff_revision(OLD, OLD_RESULT, new)
+    assert plan['blocks'] == [(1, 2)]
+    assert sorted(plan['kept']) == [0, 2, 3]
+
+    block_result = {
+        'feedback': 'new feedback',
+        'suggestions': ['注意单复数'],
+        'grammar_errors': [],
+        # 模型对上下文给出的错误被丢弃
+        'detailed_errors': [{'original': 'teachers is', 'corrected': 'teachers are'},
+                            {'original': 'We plays', 'corrected': 'We play'}],
+        'corrected_text': 'My teachers are kind.',
+    }
+    result = splice_results(new, plan, [block_result])
+    assert result['corrected_text'] == 'I go to school.\nMy teachers are kind.\nWe play games.\nIt was fun.'
+    assert [(error['original'], error['start'], error['end']) for error in result['detailed_errors']] == [
+        ('I goes', 0, 6), ('teachers is', 21, 32), ('We plays', 39, 47), ('It were', 55, 62)]
+    assert result['suggestions'] == ['注意单复数', '注意主谓一致']
+    assert result['feedback'] == 'new feedback'
+
+
+def test_inserted_and_deleted_paragraphs_shift_offsets():
+    new = 'Hello there.\nI goes to school.\nWe plays games.\nIt were fun.'
+    plan = diff_revision(OLD, OLD_RESULT, new)
+    assert plan['blocks'] == [(0, 1)]
+    result = splice_results(new, plan, [None])
+    assert result['corrected_text'] == 'Hello there.\nI go to school.\nWe play games.\nIt was fun.'
+    assert [error['start'] for error in result['detailed_errors']] == [13, 31, 47]
+
+
+def test_unalignable_or_heavily_edited_revision_falls_back():
+    assert diff_revision(OLD, dict(OLD_RESULT, corrected_text='one paragraph only'), OLD) is None
+    assert diff_revision(OLD, OLD_RESULT, 'Completely new essay.\nNothing in common.') is None
+    # 上一版批改失败（降级结果、部分修改块失败）时整篇重新批改
+    assert diff_revision(OLD, dict(OLD_RESULT, degraded=True), OLD) is None
+    assert diff_revision(OLD, dict(OLD_RESULT, incremental={'failed_blocks': [0]}), OLD) is None
+
+
+def test_local_errors_and_stale_positions_are_not_reused():
+    previous = dict(OLD_RESULT, detailed_errors=[
+        {'original': 'I goes', 'corrected': 'I go', 'start': 40, 'end': 46, 'segment': 1},
+        {'original': 'teacher are', 'corrected': 'teacher is', 'source': 'local', 'start': 21, 'end': 32},
+    ])
+    plan = diff_revision(OLD, previous, OLD)
+    assert plan['kept'][0][1] == [({'original': 'I goes', 'corrected': 'I go'}, (0, 6))]
+    assert plan['kept'][1][1] == []
+
+
+def test_regrade_sends_only_changed_paragraphs_with_context():
+    api = XunfeiAPI(cache=GradingCache())
+    requests = []
+
+    def request(content, prompt=None):
+        requests.append((content, prompt))
+        return {'feedback': '', 'suggestions': [], 'grammar_errors': [], 'detailed_errors': [],
+                'corrected_text': content.replace('plays', 'play')}
+
+    api._request_essay = request
+    new = OLD.replace('We plays games.', 'We plays many games.')
+    result = api.regrade_essay(new, OLD, OLD_RESULT)
+
+    assert len(requests) == 1
+    content, prompt = requests[0]
+    assert content == 'We plays many games.'
+    assert '【上文】\nMy teacher are kind.' in prompt and '【下文】\nIt were fun.' in prompt
+    assert result['corrected_text'] == 'I go to school.\nMy teacher is kind.\nWe play many games.\nIt was fun.'
+    assert result['incremental'] == {'reused_paragraphs': 3, 'regraded_paragraphs': 1, 'failed_blocks': []}
+
+    # 没有修改时不调用API
+    requests.clear()
+    assert api.regrade_essay(OLD, OLD, OLD_RESULT)['corrected_text'] == OLD_RESULT['corrected_text']
+    assert requests == []
+
+
+def test_regrade_caches_block_results_not_spliced_result():
+    api = XunfeiAPI(cache=GradingCache())
+    requests = []
+
+    def request(content, prompt=None):
+        requests.append(content)
+        return {'feedback': '', 'suggestions': [], 'grammar_errors': [], 'detailed_errors': [],
+                'corrected_text': content.replace('plays', 'play').replace('goes', 'go')}
+
+    api._request_essay = request
+    new = OLD.replace('We plays games.', 'We plays many games.')
+    api.regrade_essay(new, OLD, OLD_RESULT)
+    assert requests == ['We plays many games.']
+
+    # 再次提交同一修改稿：修改块命中缓存
+    assert api.regrade_essay(new, OLD, OLD_RESULT)['incremental']['regraded_paragraphs'] == 1
+    assert requests == ['We plays many games.']
+
+    # 拼接的结果不写入整篇作文的缓存，直接提交时完整批改
+    api.check_essay(new)
+    assert requests == ['We plays many games.', new]
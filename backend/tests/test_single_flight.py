@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+测试相同作文并发批改的合并：进程内的线程合并、失败时的传递，以及通过锁文件跨进程合并
+"""
+
+import threading
+import time
+
+from services.grading_cache import GradingCache
+from services.single_flight import SingleFlight
+from services.xunfei_api import XunfeiAPI
+
+
+def slow_request(calls, fail=False):
+    def request(content, prompt=None):
+        calls.append(content)
+        time.sleep(0.3)
+        if fail:
+            raise ConnectionError('network down')
+        return {'feedback': 'ok', 'detailed_errors': [{'original': 'I goes', 'corrected': 'I go'}],
+                'corrected_text': 'I go home.'}
+    return request
+
+
+def run_concurrently(targets):
+    results = [None] * len(targets)
+
+    def run(index, target):
+        results[index] = target()
+
+    threads = [threading.Thread(target=run, args=(index, target)) for index, target in enumerate(targets)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_identical_requests_share_one_session():
+    calls = []
+    api = XunfeiAPI(cache=GradingCache(), single_flight=SingleFlight())
+    api._request_essay = slow_request(calls)
+    essays = ['I goes home.', '  I goes   home. ', 'I goes home.', 'I goes home!']
+    results = run_concurrently([lambda essay=essay: api.check_essay(essay) for essay in essays])
+
+    # 规范化后相同的三篇只批改一次，最后一篇内容不同单独批改
+    assert sorted(calls) == ['I goes home!', 'I goes home.']
+    assert all(result['feedback'] == 'ok' for result in results)
+    # 错误位置按各自提交的文本计算
+    assert [result['detailed_errors'][0]['start'] for result in results] == [0, 2, 0, 0]
+
+
+def test_failure_is_shared_with_waiters():
+    calls = []
+    api = XunfeiAPI(single_flight=SingleFlight())
+    api._request_essay = slow_request(calls, fail=True)
+    results = run_concurrently([lambda: api.check_essay('I goes home.')] * 3)
+    assert len(calls) == 1
+    assert all(result['degraded'] for result in results)
+
+
+def test_workers_coalesce_through_lock_file_and_disk_cache(tmp_path):
+    """两个客户端各自使用独立的缓存和SingleFlight实例（模拟两个worker进程），共享锁目录和磁盘缓存"""
+    calls = []
+    workers = []
+    for _ in range(2):
+        cache = GradingCache(disk_path=str(tmp_path / 'cache.db'))
+        api = XunfeiAPI(cache=cache, single_flight=SingleFlight(lock_dir=str(tmp_path / 'locks')))
+        api._request_essay = slow_request(calls)
+        workers.append(api)
+    results = run_concurrently([lambda api=api: api.check_essay('I goes home.') for api in workers])
+    assert len(calls) == 1
+    assert results[0] == results[1]
+
+
+def test_lock_dir_requires_disk_cache(tmp_path, monkeypatch, caplog):
+    """没有磁盘缓存时不启用跨进程锁（等到锁的worker无法复用其他进程的结果），启动时给出警告"""
+    monkeypatch.setenv('SINGLE_FLIGHT_LOCK_DIR', str(tmp_path / 'locks'))
+    assert not SingleFlight.from_env(GradingCache()).is_shared
+    assert not SingleFlight.from_env(None).is_shared
+    assert 'GRADING_CACHE_PATH' in caplog.text
+    assert SingleFlight.from_env(GradingCache(disk_path=str(tmp_path / 'cache.db'))).is_shared
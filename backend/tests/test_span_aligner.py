@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+测试详细错误的位置对齐：单遍多模式匹配、容忍空白和标点差异、重复片段依次对应
+"""
+
+from services.span_aligner import align_errors, find_spans
+
+
+def spans_text(text, spans):
+    return [text[start:end] if (start, end) != (None, None) else None for start, end in spans]
+
+
+def test_tolerant_matching():
+    text = 'My teacher  are kind ,and she don’t like it. This is fine.'
+    originals = ['teacher are', 'kind, and', "she don't", 'is', 'missing words']
+    spans = [span or (None, None) for span in find_spans(text, originals)]
+    assert spans_text(text, spans) == ['teacher  are', 'kind ,and', 'she don’t', 'is', None]
+    # 只在单词边界匹配："is" 不会匹配到 "This" 中
+    assert spans[3][0] == text.index(' is ') + 1
+
+
+def test_repeated_phrases_follow_error_order():
+    text = 'I goes home. Tom goes out. I goes to bed.'
+    aligned = align_errors(text, [{'original': 'I goes'}, {'original': 'i goes'}, 'not an object'])
+    assert [(error['start'], error['end']) for error in aligned[:2]] == [(0, 6), (27, 33)]
+    assert aligned[2] == 'not an object'
+
+
+def test_start_hint_selects_occurrence():
+    text = 'I goes home. I goes to bed.'
+    aligned = align_errors(text, [{'original': 'I goes', 'start': 13}, {'original': ',', 'start': None}])
+    assert (aligned[0]['start'], aligned[0]['end']) == (13, 19)
+    assert aligned[1]['start'] is None
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+测试流式批改：逐帧转发文本并在最后产出结构化结果
+"""
+
+from services.xunfei_api import XunfeiAPI
+from services.grading_cache import GradingCache
+
+
+def make_frame(text, status):
+    return {
+        'header': {'code': 0, 'status': status},
+        'payload': {'choices': {'text': [{'role': 'assistant', 'content': text}]}}
+    }
+
+
+def test_stream_yields_deltas_then_result():
+    """每帧文本立即以delta事件产出，最终帧后产出结果并写入缓存"""
+    api = XunfeiAPI(cache=GradingCache())
+    frames = [make_frame('改进建议：', 0), make_frame('多用连接词', 1), make_frame('', 2)]
+    api._iter_frames = lambda content: iter(frames)
+
+    events = list(api.stream_essay('My essay.'))
+    assert [event['type'] for event in events] == ['delta', 'delta', 'result']
+    assert events[0]['text'] == '改进建议：'
+    assert events[-1]['result']['feedback'] == '改进建议：多用连接词'
+
+    # 再次提交相同作文时直接返回缓存结果
+    cached = list(api.stream_essay('My essay.'))
+    assert cached == [{'type': 'result', 'result': events[-1]['result'], 'cached': True}]
+
+
+def test_stream_failure_yields_error_and_default_result():
+    """调用失败时产出error事件和默认结果"""
+    api = XunfeiAPI()
+
+    def broken(content):
+        yield make_frame('部分', 0)
+        raise RuntimeError('讯飞API返回错误，错误码: 10013')
+
+    api._iter_frames = broken
+    events = list(api.stream_essay('My essay.'))
+    assert [event['type'] for event in events] == ['delta', 'error', 'result']
+    assert events[-1]['result'] == api._default_result('My essay.')
+
+
+def test_stream_emits_errors_before_final_frame():
+    """错误对象在最终帧到达之前就以detailed_error事件产出"""
+    api = XunfeiAPI()
+    frames = [make_frame('```json\n[{"original": "I goes",', 0), make_frame(' "corrected": "I go"}, ', 1),
+              make_frame('{"original": "x", "corrected": "y"}]\n```', 1), make_frame('', 2)]
+    api._iter_frames = lambda content: iter(frames)
+
+    events = [event for event in api.stream_essay('I goes.') if event['type'] != 'delta']
+    assert events[0] == {'type': 'detailed_error', 'error': {'original': 'I goes', 'corrected': 'I go'}}
+    assert events[1]['error'] == {'original': 'x', 'corrected': 'y'}
+    assert events[2]['type'] == 'result'
+    assert len(events[2]['result']['detailed_errors']) == 2
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+测试讯飞OCR客户端：连接复用、签名复用和5xx重试（使用本地模拟OCR服务）
+"""
+
+import base64
+import json
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from benchmarks.mock_spark_server import make_ocr_handler
+from services.xunfei_ocr import XunfeiOCRClient
+
+API_KEY = 'test-ocr-key'
+API_SECRET = 'test-ocr-secret'
+TEXT = 'I goes to school everyday.'
+
+
+@pytest.fixture
+def ocr_server():
+    """模拟OCR服务，前 fail_first 个请求返回503，记录每个请求的连接和签名"""
+    base = make_ocr_handler(TEXT, 0, API_KEY, API_SECRET)
+    state = {'fail_first': 0, 'requests': [], 'connections': set()}
+
+    class Handler(base):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            state['requests'].append(self.path)
+            state['connections'].add(self.client_address)
+            if len(state['requests']) <= state['fail_first']:
+                self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                self.send_response(503)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            super().do_POST()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    state['url'] = f'http://127.0.0.1:{server.server_port}/v1/private/hh_ocr_recognize_doc'
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(url, **kwargs):
+    return XunfeiOCRClient(appid='test-app', api_key=API_KEY, api_secret=API_SECRET, url=url, **kwargs)
+
+
+def test_connection_and_signature_are_reused(ocr_server):
+    client = make_client(ocr_server['url'])
+    assert [client.recognize(b'page') for _ in range(3)] == [TEXT] * 3
+    # 同一个keep-alive连接，同一个签名
+    assert len(ocr_server['connections']) == 1
+    assert len(set(ocr_server['requests'])) == 1
+
+
+def test_server_errors_are_retried(ocr_server):
+    ocr_server['fail_first'] = 2
+    client = make_client(ocr_server['url'], retries=2, backoff=0)
+    assert client.recognize(b'page') == TEXT
+    assert len(ocr_server['requests']) == 3
+
+
+def test_gives_up_after_retries(ocr_server):
+    ocr_server['fail_first'] = 10
+    client = make_client(ocr_server['url'], retries=1, backoff=0)
+    with pytest.raises(RuntimeError, match='503'):
+        client.recognize(b'page')
+    assert len(ocr_server['requests']) == 2
+
+
+def test_rejected_signature_is_regenerated(ocr_server):
+    client = make_client(ocr_server['url'])
+    client.api_secret = 'wrong-secret'
+    with pytest.raises(RuntimeError):
+        client.recognize(b'page')
+    client.api_secret = API_SECRET
+    assert client.recognize(b'page') == TEXT
+
+
+def test_missing_config_raises_on_use(monkeypatch):
+    monkeypatch.delenv('OCR_URL', raising=False)
+    client = XunfeiOCRClient(appid='test-app', api_key=API_KEY, api_secret=API_SECRET)
+    with pytest.raises(ValueError, match='配置不完整'):
+        client.recognize(b'page')
+
+
+def test_request_body_matches_json_encoding():
+    """直接拼接字节得到的请求体与json.dumps结果一致"""
+    client = make_client('http://127.0.0.1/v1/private/hh_ocr_recognize_doc')
+    body = json.loads(client._build_body(memoryview(b'\xff\xd8jpeg')))
+    assert body['header'] == {'app_id': 'test-app', 'status': 3}
+    assert base64.b64decode(body['payload']['image']['image']) == b'\xff\xd8jpeg'